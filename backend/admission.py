@@ -0,0 +1,192 @@
+"""
+Admission control against the deployment's RPM/TPM quota
+
+Azure OpenAI answers calls over a deployment's quota with a 429, and retrying
+into a saturated deployment only keeps it saturated. Every model call now asks
+an AdmissionController first. It keeps two token buckets per deployment, one
+for requests and one for tokens, refilled at ADMISSION_HEADROOM of the
+per-minute quota so traffic stays just under it.
+
+A call that does not fit right away waits its turn (in arrival order) for at
+most ADMISSION_MAX_WAIT_SECONDS. If it would have to wait longer, or
+ADMISSION_MAX_QUEUED calls are already waiting, it is rejected at once with
+AdmissionRejected, which the API turns into a 429 with Retry-After. A 429
+from Azure itself empties the deployment's buckets for the Retry-After it sent.
+
+Tokens are counted the way Azure counts them when admitting a request: the
+estimated prompt plus max_tokens. A limit of 0 (the default) disables that
+bucket.
+"""
+import asyncio
+import math
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+import metrics
+
+DEPLOYMENT_RPM_LIMIT = float(os.getenv("DEPLOYMENT_RPM_LIMIT", "0"))
+DEPLOYMENT_TPM_LIMIT = float(os.getenv("DEPLOYMENT_TPM_LIMIT", "0"))
+ADMISSION_HEADROOM = float(os.getenv("ADMISSION_HEADROOM", "0.9"))
+# Azure enforces quotas over short windows, so only a few seconds of quota may be spent at once
+ADMISSION_BURST_SECONDS = float(os.getenv("ADMISSION_BURST_SECONDS", "10"))
+ADMISSION_MAX_WAIT_SECONDS = float(os.getenv("ADMISSION_MAX_WAIT_SECONDS", "5"))
+ADMISSION_MAX_QUEUED = int(os.getenv("ADMISSION_MAX_QUEUED", "100"))
+
+admission_decisions = metrics.counter("admission_requests_total", "Model calls by deployment and admission outcome")
+admission_queue_depth = metrics.gauge("admission_queue_depth", "Model calls waiting for quota, by deployment")
+admission_wait = metrics.histogram("admission_wait_seconds", "Time model calls waited for quota")
+upstream_throttled = metrics.counter("upstream_throttled_total", "429 responses received from the model, by deployment")
+
+
+class AdmissionRejected(Exception):
+    """Raised when a model call cannot be admitted within its deadline"""
+
+    def __init__(self, deployment: str, reason: str, retry_after: float):
+        super().__init__(f"Rate limit reached for deployment {deployment}, please retry shortly")
+        self.deployment = deployment
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    """Continuously refilled bucket; the level goes negative to hold reservations of waiting calls"""
+
+    def __init__(self, per_minute: float, burst_seconds: float):
+        self.rate = per_minute / 60
+        self.capacity = max(self.rate * burst_seconds, 1)
+        self.level = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def wait_time(self, amount: float) -> float:
+        """Seconds until amount is available, after every earlier reservation"""
+        self._refill()
+        return max(amount - self.level, 0) / self.rate
+
+    def reserve(self, amount: float) -> None:
+        self._refill()
+        self.level -= amount
+
+    def refund(self, amount: float) -> None:
+        self._refill()
+        self.level = min(self.capacity, self.level + amount)
+
+    def drain(self, seconds: float) -> None:
+        """Make the next call wait at least this long"""
+        self._refill()
+        self.level = min(self.level, -self.rate * seconds)
+
+
+class _Deployment:
+    def __init__(self, requests: Optional[TokenBucket], tokens: Optional[TokenBucket]):
+        self.requests = requests
+        self.tokens = tokens
+        self.waiting = 0
+
+    def buckets(self, tokens: int) -> List[Tuple[TokenBucket, float]]:
+        return [(bucket, amount) for bucket, amount in ((self.requests, 1), (self.tokens, tokens)) if bucket is not None]
+
+
+class AdmissionController:
+    """Per-deployment request and token buckets with a deadline-bounded wait"""
+
+    def __init__(self, rpm: float, tpm: float, headroom: float, burst_seconds: float, max_wait: float, max_queued: int):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.headroom = headroom
+        self.burst_seconds = burst_seconds
+        self.max_wait = max_wait
+        self.max_queued = max_queued
+        self._deployments: Dict[str, _Deployment] = {}
+
+    def _deployment(self, deployment: str) -> _Deployment:
+        state = self._deployments.get(deployment)
+        if state is None:
+            state = _Deployment(
+                TokenBucket(self.rpm * self.headroom, self.burst_seconds) if self.rpm > 0 else None,
+                TokenBucket(self.tpm * self.headroom, self.burst_seconds) if self.tpm > 0 else None,
+            )
+            self._deployments[deployment] = state
+        return state
+
+    async def admit(self, deployment: str, tokens: int, max_wait: Optional[float] = None) -> None:
+        """Wait until the call fits the deployment's quota; raises AdmissionRejected"""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        state = self._deployment(deployment)
+        buckets = state.buckets(tokens)
+        if not buckets:
+            return
+
+        wait = max(bucket.wait_time(amount) for bucket, amount in buckets)
+        if wait > 0 and state.waiting >= self.max_queued:
+            admission_decisions.inc(deployment=deployment, outcome="rejected_queue_full")
+            raise AdmissionRejected(deployment, "queue_full", wait)
+        if wait > max_wait:
+            # Shed now rather than hold the caller until it times out anyway
+            admission_decisions.inc(deployment=deployment, outcome="rejected_deadline")
+            raise AdmissionRejected(deployment, "deadline", wait)
+
+        for bucket, amount in buckets:
+            bucket.reserve(amount)
+        if wait <= 0:
+            admission_decisions.inc(deployment=deployment, outcome="admitted")
+            return
+
+        state.waiting += 1
+        admission_queue_depth.set(state.waiting, deployment=deployment)
+        try:
+            await asyncio.sleep(wait)
+        except asyncio.CancelledError:
+            for bucket, amount in buckets:
+                bucket.refund(amount)  # The caller went away; give its reservation back
+            raise
+        finally:
+            state.waiting -= 1
+            admission_queue_depth.set(state.waiting, deployment=deployment)
+        admission_wait.observe(wait)
+        admission_decisions.inc(deployment=deployment, outcome="queued")
+
+    def refund(self, deployment: str, tokens: int) -> None:
+        """Give back the quota of an admitted call that is not going to be sent"""
+        for bucket, amount in self._deployment(deployment).buckets(tokens):
+            bucket.refund(amount)
+
+    def wait_time(self, deployment: str, tokens: int) -> float:
+        """How long a call would wait for quota right now, without reserving it"""
+        return max((bucket.wait_time(amount) for bucket, amount in self._deployment(deployment).buckets(tokens)), default=0.0)
+
+    def throttled(self, deployment: str, retry_after: float) -> AdmissionRejected:
+        """Record a 429 from the model and hold further calls for its Retry-After"""
+        upstream_throttled.inc(deployment=deployment)
+        for bucket, _ in self._deployment(deployment).buckets(0):
+            bucket.drain(retry_after)
+        return AdmissionRejected(deployment, "upstream", retry_after)
+
+
+def upstream_retry_after(error: Exception, default: float = 10) -> float:
+    """Seconds to back off after a 429 from the model, read from its response headers"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None) or {}
+    try:
+        if headers.get("retry-after-ms"):
+            return float(headers["retry-after-ms"]) / 1000
+        if headers.get("retry-after"):
+            return float(headers["retry-after"])
+    except ValueError:
+        pass
+    return default
+
+
+admission = AdmissionController(
+    DEPLOYMENT_RPM_LIMIT,
+    DEPLOYMENT_TPM_LIMIT,
+    ADMISSION_HEADROOM,
+    ADMISSION_BURST_SECONDS,
+    ADMISSION_MAX_WAIT_SECONDS,
+    ADMISSION_MAX_QUEUED,
+)
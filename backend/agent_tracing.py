@@ -1,5 +1,4 @@
 from azure.ai.projects import AIProjectClient
-from azure.identity import DefaultAzureCredential
 from azure.monitor.opentelemetry import configure_azure_monitor
 from opentelemetry.instrumentation.openai_v2 import OpenAIInstrumentor
 from dotenv import load_dotenv
@@ -9,12 +8,14 @@ from opentelemetry import trace
 
 load_dotenv()
 
+from credentials import get_credential
+
 # Enable content recording for agents
 os.environ["AZURE_TRACING_GEN_AI_CONTENT_RECORDING_ENABLED"] = "true"
 
 # Initialize project client
 project_client = AIProjectClient(
-    credential=DefaultAzureCredential(),
+    credential=get_credential(),
     endpoint=os.environ["PROJECT_ENDPOINT"],
 )
 
@@ -1,48 +1,209 @@
-from fastapi import FastAPI, HTTPException, Query
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import StreamingResponse
+from fastapi.responses import JSONResponse, PlainTextResponse
 from pydantic import BaseModel
-from typing import List, Dict, Any, Optional
-import json
+from typing import List, Any, Optional
 import asyncio
+import sys
+import time
+from contextlib import aclosing, asynccontextmanager, contextmanager
 import uvicorn
-from azure.ai.projects import AIProjectClient
-from azure.identity import DefaultAzureCredential
+from azure.ai.projects.aio import AIProjectClient as AsyncAIProjectClient
+from azure.identity.aio import get_bearer_token_provider
 from azure.monitor.opentelemetry import configure_azure_monitor
 from opentelemetry.instrumentation.openai_v2 import OpenAIInstrumentor
 from dotenv import load_dotenv
+from openai import AsyncAzureOpenAI, AsyncOpenAI, RateLimitError
 import os
 import urllib.parse
-from prompts import get_solution_architect_system_prompt
+from datetime import datetime, timezone
 
-app = FastAPI(title="Solution Architect Agent API", version="1.0.0")
-
-# Load environment variables
+# Load environment variables before the local modules below read their settings
 load_dotenv()
 
+from structured_logging import configure_logging, get_logger
+from prompts import get_history_summary_prompt, get_solution_architect_system_prompt, get_system_prompt_version
+from response_cache import make_cache_key, response_cache
+from semantic_cache import create_semantic_cache
+from coalescing import COALESCE_REQUESTS, StreamFanout, request_fingerprint, single_flight, stream_coalescer
+from compaction import history_compactor
+from conversation_store import conversation_store, is_valid_conversation_id
+from content_recording import (
+    ContentRecordingLogProcessor,
+    ContentRecordingSpanExporter,
+    ContentRecordingSpanProcessor,
+    begin_request,
+)
+from telemetry_export import setup_tracing
+from startup import get_connection_string, startup_tasks
+from credentials import get_async_credential
+from admission import AdmissionRejected, admission, upstream_retry_after
+from routing import create_router
+from circuit_breaker import CircuitOpen
+from hedging import (
+    HEDGE_BUDGET_RATIO,
+    HEDGE_MIN_DELAY_SECONDS,
+    HEDGE_MIN_SAMPLES,
+    HEDGE_PERCENTILE,
+    HEDGE_REQUESTS,
+    Hedger,
+    hedge_primary_latency,
+)
+from resumable import event_id, parse_event_id, resumable_streams, stream_resumes
+from idempotency import IdempotencyKeyReused, InvalidIdempotencyKey, body_fingerprint, idempotency_key, idempotency_store
+from request_context import RequestIdMiddleware, RequestIdSpanProcessor
+from streaming import (
+    SSE_DONE_FRAME,
+    LimitedStreamingResponse,
+    StreamLimiterSaturated,
+    TextDeltaStream,
+    coalesce_deltas,
+    sse_chunk_frame,
+    sse_error_frame,
+    stream_limiter,
+)
+from request_metrics import (
+    FlushTimer,
+    RequestMetricsMiddleware,
+    estimate_prompt_tokens,
+    phase,
+    record_phase,
+    record_request_parse,
+    tokens_used,
+    ttft,
+    update_threadpool_gauges,
+    upstream_latency,
+)
+import metrics
+
+configure_logging()
+log = get_logger("app")
+
 # Get environment variables
 endpoint = os.getenv("PROJECT_ENDPOINT")
 model_deployment_name = os.getenv("MODEL_DEPLOYMENT_NAME")
 
-if not endpoint or not model_deployment_name:
+# Point the app at a local chat-completions server (see scripts/mock_openai_server.py)
+# instead of Azure. No Azure credentials, project client or telemetry are used.
+mock_openai_base_url = os.getenv("MOCK_OPENAI_BASE_URL")
+
+if mock_openai_base_url:
+    model_deployment_name = model_deployment_name or "mock-gpt"
+elif not endpoint or not model_deployment_name:
     raise ValueError("PROJECT_ENDPOINT and MODEL_DEPLOYMENT_NAME must be set in environment")
 
-# Initialize Azure AI Project client
-project_client = AIProjectClient(
-    credential=DefaultAzureCredential(),
-    endpoint=endpoint,
-)
+if not mock_openai_base_url:
+    # Content is captured, then sampled and size-capped per request by the
+    # content recording processors before it is exported. Instrumenting is
+    # local; the exporters are configured by the telemetry startup task.
+    os.environ["AZURE_TRACING_GEN_AI_CONTENT_RECORDING_ENABLED"] = "true"
+    os.environ["OTEL_INSTRUMENTATION_GENAI_CAPTURE_MESSAGE_CONTENT"] = "true"
+    OpenAIInstrumentor().instrument()
+
+# Sampling parameters shared by both chat endpoints
+COMPLETION_PARAMS = {"temperature": 0.7, "max_tokens": 1500}
+OPENAI_API_VERSION = "2024-02-01"
+# Fail a hung model call well before the SDK's 10 minute default so the circuit breaker sees it
+UPSTREAM_TIMEOUT_SECONDS = float(os.getenv("UPSTREAM_TIMEOUT_SECONDS", "60"))
+COGNITIVE_SERVICES_SCOPE = "https://cognitiveservices.azure.com/.default"
 
-# Get Application Insights connection string
-connection_string = project_client.telemetry.get_application_insights_connection_string()
+# Deployments model calls are spread over (MODEL_DEPLOYMENTS, or just MODEL_DEPLOYMENT_NAME)
+router = create_router(model_deployment_name)
+router.quota_wait = admission.wait_time
 
-# Set up tracing
-os.environ["AZURE_TRACING_GEN_AI_CONTENT_RECORDING_ENABLED"] = "true"
-OpenAIInstrumentor().instrument()
-configure_azure_monitor(connection_string=connection_string)
+# Async Azure AI Project client. Its OpenAI client is created once and shared by
+# every request so completions never block the event loop.
+async_credential = None
+async_project_client = None
+if not mock_openai_base_url:
+    async_credential = get_async_credential()  # Shared, pinned and proactively refreshed
+    async_project_client = AsyncAIProjectClient(
+        credential=async_credential,
+        endpoint=endpoint,
+    )
+async_openai_client = None
+async_openai_client_lock = asyncio.Lock()
+
+async def get_async_openai_client():
+    """Get the shared async OpenAI client, creating it on first use"""
+    global async_openai_client
+    if async_openai_client is None:
+        async with async_openai_client_lock:
+            if async_openai_client is None:
+                if mock_openai_base_url:
+                    async_openai_client = AsyncOpenAI(base_url=mock_openai_base_url, api_key="mock")
+                else:
+                    # A coroutine in azure-ai-projects 1.0 (pinned); 2.x made it synchronous
+                    async_openai_client = await async_project_client.get_openai_client(api_version=OPENAI_API_VERSION)
+    return async_openai_client
+
+backend_clients = {}
+
+async def get_backend_client(backend):
+    """OpenAI client for a routed backend; backends without an endpoint use the project's client"""
+    if backend.endpoint is None:
+        return await get_async_openai_client()
+    client = backend_clients.get(backend.name)
+    if client is None:
+        if mock_openai_base_url:
+            client = AsyncOpenAI(base_url=backend.endpoint, api_key="mock")
+        else:
+            client = AsyncAzureOpenAI(
+                azure_endpoint=backend.endpoint,
+                api_version=OPENAI_API_VERSION,
+                azure_ad_token_provider=get_bearer_token_provider(async_credential, COGNITIVE_SERVICES_SCOPE),
+            )
+        backend_clients[backend.name] = client
+    return client
+
+async def setup_telemetry():
+    """Fetch (or reuse) the Application Insights connection string and configure Azure Monitor"""
+    connection_string = await get_connection_string(
+        endpoint,
+        async_project_client.telemetry.get_application_insights_connection_string,
+    )
+    await asyncio.to_thread(configure_telemetry, connection_string)
+
+def configure_telemetry(connection_string):
+    # Spans are exported through a bounded, drop-oldest queue instead of the distro's pipeline
+    setup_tracing(
+        connection_string,
+        span_processors=[ContentRecordingSpanProcessor(), RequestIdSpanProcessor()],
+        wrap_exporter=ContentRecordingSpanExporter,
+    )
+    configure_azure_monitor(
+        connection_string=connection_string,
+        disable_tracing=True,
+        log_record_processors=[ContentRecordingLogProcessor()],
+    )
 
-# Get OpenAI client
-openai_client = project_client.get_openai_client(api_version="2024-02-01")
+async def warm_credential():
+    """Resolve the credential chain and cache a token before the first request needs one"""
+    token = await async_credential.get_token(COGNITIVE_SERVICES_SCOPE)
+    return token.expires_on
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Start slow initialization concurrently and serve requests right away"""
+    if not mock_openai_base_url:
+        startup_tasks.start("credential", warm_credential())
+        startup_tasks.start("telemetry", setup_telemetry())
+    startup_tasks.start("llm_client", get_async_openai_client())
+    yield
+    await startup_tasks.cancel()
+    await close_async_clients()
+
+async def close_async_clients():
+    """Close the shared async clients and their connection pools"""
+    if async_openai_client is not None:
+        await async_openai_client.close()
+    for client in backend_clients.values():
+        await client.close()
+    if async_project_client is not None:
+        await async_project_client.close()
+        await async_credential.close()
+
+app = FastAPI(title="Solution Architect Agent API", version="1.0.0", lifespan=lifespan)
 
 # Add CORS middleware to allow frontend communication
 app.add_middleware(
@@ -51,8 +212,14 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Conversation-Id", "X-Stream-Id", "X-Request-Id", "Idempotent-Replayed", "Retry-After"],
 )
 
+# Added last so they wrap everything, including CORS preflights; the request
+# ID is assigned first so every log line and span of the request carries it
+app.add_middleware(RequestMetricsMiddleware)
+app.add_middleware(RequestIdMiddleware)
+
 # Data models
 class Message(BaseModel):
     role: str  # "user" or "assistant"
@@ -60,15 +227,262 @@ class Message(BaseModel):
     timestamp: Optional[str] = None
 
 class ChatRequest(BaseModel):
-    messages: List[Message]
+    messages: List[Message]  # Full history, or only the new turn when conversation_id is set
     stream: bool = False
+    conversation_id: Optional[str] = None
 
 class ChatResponse(BaseModel):
     message: Message
     conversation_id: Optional[str] = None
 
-# In-memory storage for demo purposes (replace with CosmosDB later)
-conversations: Dict[str, List[Message]] = {}
+async def resolve_conversation(request: ChatRequest):
+    """
+    Resolve the conversation a chat request belongs to.
+
+    Returns (conversation_id, history, new_messages). Without a conversation_id
+    the request carries the full history and a new conversation is started.
+    """
+    new_messages = [
+        {"role": msg.role, "content": msg.content, "timestamp": msg.timestamp or datetime.now(timezone.utc).isoformat()}
+        for msg in request.messages
+    ]
+    if not any(msg["role"] == "user" for msg in new_messages):
+        raise HTTPException(status_code=400, detail="No user message found")
+
+    if request.conversation_id is None:
+        return conversation_store.new_id(), [], new_messages
+
+    if not is_valid_conversation_id(request.conversation_id):
+        raise HTTPException(status_code=400, detail="Invalid conversation_id")
+    with phase("history_load"):
+        history = await conversation_store.get(request.conversation_id)
+    if history is None:
+        raise HTTPException(status_code=404, detail=f"Conversation {request.conversation_id} not found")
+    return request.conversation_id, history, new_messages
+
+def build_azure_messages(request: ChatRequest, conversation_id, history, new_messages):
+    """Convert conversation messages to Azure AI format, compacting long histories"""
+    with phase("prompt_build"):
+        azure_messages = [
+            {"role": "system", "content": get_solution_architect_system_prompt()},
+        ]
+    # Only summarize conversations the client will come back to
+    with phase("history_assembly", messages=len(history) + len(new_messages)):
+        azure_messages.extend(history_compactor.compact(
+            conversation_id,
+            history,
+            new_messages,
+            allow_summary=request.conversation_id is not None,
+        ))
+    return azure_messages
+
+async def summarize_history(previous_summary, messages):
+    """Fold older messages into the rolling conversation summary"""
+    transcript = "\n\n".join(f"{msg['role']}: {msg['content']}" for msg in messages)
+    if previous_summary:
+        transcript = f"PREVIOUS SUMMARY:\n{previous_summary}\n\nNEW MESSAGES:\n{transcript}"
+    messages = [
+        {"role": "system", "content": get_history_summary_prompt()},
+        {"role": "user", "content": transcript},
+    ]
+    backend = await reserve_backend("summary", messages, 500)
+    openai_client = await get_backend_client(backend)
+    with upstream_call(backend, "summary"):
+        response = await openai_client.chat.completions.create(
+            model=backend.deployment,
+            messages=messages,
+            temperature=0,
+            max_tokens=500,
+            timeout=UPSTREAM_TIMEOUT_SECONDS
+        )
+    return response.choices[0].message.content
+
+history_compactor.summarize = summarize_history
+
+def estimate_request_tokens(messages, max_tokens):
+    """Tokens a call counts against the TPM quota when Azure admits it: prompt plus max_tokens"""
+    return estimate_prompt_tokens(messages) + max_tokens
+
+async def reserve_backend(endpoint_name, messages, max_tokens, exclude=(), max_wait=None):
+    """Pick the backend for a model call and wait for its quota; raises AdmissionRejected"""
+    tokens = estimate_request_tokens(messages, max_tokens)
+    backend = router.pick(endpoint_name, tokens, exclude=exclude)
+    await admission.admit(backend.name, tokens, max_wait=max_wait)
+    return backend
+
+def release_backend(backend, messages, max_tokens):
+    """Give back the quota reserved by reserve_backend for a call that is not going to be sent"""
+    admission.refund(backend.name, estimate_request_tokens(messages, max_tokens))
+
+@contextmanager
+def upstream_call(backend, endpoint_name):
+    """Track a model call on its backend; a 429 from the model becomes AdmissionRejected"""
+    try:
+        with router.track(backend, endpoint_name) as call:
+            yield call
+    except RateLimitError as e:
+        raise admission.throttled(backend.name, upstream_retry_after(e)) from e
+
+def rate_limited(error: AdmissionRejected):
+    return HTTPException(status_code=429, detail=str(error), headers={"Retry-After": str(error.retry_after)})
+
+def model_unavailable(error: CircuitOpen):
+    return HTTPException(status_code=503, detail=str(error), headers={"Retry-After": str(error.retry_after)})
+
+def request_idempotency_key(raw_request: Request):
+    try:
+        return idempotency_key(raw_request.headers)
+    except InvalidIdempotencyKey as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+def idempotency_conflict(error: IdempotencyKeyReused):
+    return HTTPException(status_code=422, detail=str(error))
+
+def assistant_message(content):
+    return {"role": "assistant", "content": content, "timestamp": datetime.now(timezone.utc).isoformat()}
+
+semantic_cache = create_semantic_cache(get_async_openai_client)
+
+def response_cache_key(azure_messages):
+    """Cache key for a completion request, or None when the response cache is off"""
+    if response_cache is None:
+        return None
+    # The system prompt is represented by its version instead of being hashed in full
+    return make_cache_key(get_system_prompt_version(), azure_messages[1:], model_deployment_name, COMPLETION_PARAMS)
+
+def semantic_cache_context(azure_messages):
+    """
+    Context key for a semantic cache lookup, or None when the request is not eligible.
+
+    Only single-turn questions are eligible, since a follow-up's answer depends on the history.
+    """
+    if semantic_cache is None or len(azure_messages) != 2 or azure_messages[1]["role"] != "user":
+        return None
+    return make_cache_key(get_system_prompt_version(), [], model_deployment_name, COMPLETION_PARAMS)
+
+async def get_cached_response(azure_messages):
+    """Look a request up in the exact-match cache, then in the semantic cache"""
+    cache_key = response_cache_key(azure_messages)
+    if cache_key:
+        cached = response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    context = semantic_cache_context(azure_messages)
+    if context:
+        try:
+            return await semantic_cache.lookup(azure_messages[-1]["content"], context)
+        except Exception as e:
+            log.warning("semantic_cache_lookup_failed", error=str(e), hot=True)
+    return None
+
+async def cache_response(azure_messages, content, backend):
+    """Store a completed response in every enabled cache; failures never fail the request"""
+    if backend not in router.backends:
+        # The fallback deployment runs another model; its answers must not be served as the primary's
+        return
+    try:
+        cache_key = response_cache_key(azure_messages)
+        if cache_key:
+            await response_cache.set(cache_key, content)
+
+        context = semantic_cache_context(azure_messages)
+        if context:
+            await semantic_cache.add(azure_messages[-1]["content"], context, content)
+    except Exception as e:
+        log.warning("response_cache_store_failed", error=str(e), hot=True)
+
+def coalescing_key(azure_messages):
+    """Fingerprint used to share one upstream call between identical requests"""
+    return request_fingerprint(get_system_prompt_version(), azure_messages[1:], model_deployment_name, COMPLETION_PARAMS)
+
+# Hedge delays come from first attempts that answered, which the hedger times itself
+hedger = Hedger(
+    hedge_primary_latency,
+    {},
+    HEDGE_PERCENTILE,
+    HEDGE_MIN_DELAY_SECONDS,
+    HEDGE_BUDGET_RATIO,
+    HEDGE_MIN_SAMPLES,
+) if HEDGE_REQUESTS else None
+
+async def complete_on_backend(azure_messages, tried, hedge=False, sent=None):
+    """One completion attempt, on a backend this request has not tried yet when possible
+
+    Returns the response and the backend that gave it. sent is set once the
+    call has been admitted, which starts the hedge delay.
+    """
+    # A hedge never waits for quota: if it cannot go now, the first attempt carries on alone
+    backend = await reserve_backend("chat", azure_messages, COMPLETION_PARAMS["max_tokens"], exclude=tried, max_wait=0 if hedge else None)
+    tried.append(backend)
+    if sent is not None:
+        sent.set()
+    openai_client = await get_backend_client(backend)
+    start = time.perf_counter()
+    with phase("upstream_completion", endpoint="chat", backend=backend.name, hedge=hedge), upstream_call(backend, "chat"):
+        response = await openai_client.chat.completions.create(
+            model=backend.deployment,
+            messages=azure_messages,
+            **COMPLETION_PARAMS,
+            timeout=UPSTREAM_TIMEOUT_SECONDS
+        )
+    upstream_latency.observe(time.perf_counter() - start, endpoint="chat")
+    return response, backend
+
+async def complete_upstream(azure_messages):
+    """Run a non-streaming completion, hedged when enabled, and cache it once complete"""
+    tried = []
+    if hedger is None:
+        response, backend = await complete_on_backend(azure_messages, tried)
+    else:
+        response, backend = await hedger.run(lambda hedge, sent: complete_on_backend(azure_messages, tried, hedge, sent))
+    if response.usage is not None:
+        tokens_used.inc(response.usage.prompt_tokens, endpoint="chat", type="prompt")
+        tokens_used.inc(response.usage.completion_tokens, endpoint="chat", type="completion")
+    
+    content = response.choices[0].message.content
+    if response.choices[0].finish_reason == "stop":
+        await cache_response(azure_messages, content, backend)
+    return content
+
+async def stream_upstream(azure_messages, backend):
+    """Yield the text deltas of a streaming completion and cache it once complete
+
+    The backend is picked and its quota reserved by the caller, before the response starts.
+    """
+    openai_client = await get_backend_client(backend)
+    start = time.perf_counter()
+    with upstream_call(backend, "chat_stream") as call:
+        with phase("upstream_connect", endpoint="chat_stream", backend=backend.name):
+            stream = await openai_client.chat.completions.create(
+                model=backend.deployment,
+                messages=azure_messages,
+                stream=True,
+                **COMPLETION_PARAMS,
+                timeout=UPSTREAM_TIMEOUT_SECONDS
+            )
+        connected_ns = time.time_ns()
+        tokens_used.inc(estimate_prompt_tokens(azure_messages), endpoint="chat_stream", type="prompt")
+        
+        response_parts = []
+        first_token_ns = None
+        deltas = TextDeltaStream(stream, max_tokens=COMPLETION_PARAMS["max_tokens"])
+        try:
+            async with aclosing(deltas):
+                async for text in deltas:
+                    if first_token_ns is None:
+                        first_token_ns = time.time_ns()
+                        call.first_token()
+                        record_phase("first_token", connected_ns, first_token_ns)
+                    response_parts.append(text)
+                    yield text
+        finally:
+            upstream_latency.observe(time.perf_counter() - start, endpoint="chat_stream")
+            tokens_used.inc(deltas.tokens_streamed, endpoint="chat_stream", type="completion")
+            # From the first to the last token: the generation itself
+            record_phase("last_token", first_token_ns, tokens=deltas.tokens_streamed, finish_reason=str(deltas.finish_reason))
+    if deltas.finish_reason == "stop":
+        await cache_response(azure_messages, "".join(response_parts), backend)
 
 @app.get("/")
 async def root():
@@ -82,136 +496,384 @@ async def root():
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "timestamp": "2025-08-06T00:00:00Z"}
+    return {"status": "healthy", "timestamp": datetime.now(timezone.utc).isoformat()}
+
+@app.get("/ready")
+async def readiness_check():
+    """Readiness endpoint: 503 until the LLM client has been created"""
+    tasks = startup_tasks.status()
+    ready = startup_tasks.is_ready("llm_client")
+    return JSONResponse(
+        status_code=200 if ready else 503,
+        content={"status": "ready" if ready else "starting", "startup": tasks},
+    )
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def prometheus_metrics():
+    """Prometheus scrape endpoint, rendered from in-process metrics"""
+    update_threadpool_gauges()
+    router.update_gauges()
+    return PlainTextResponse(metrics.render_prometheus(), media_type="text/plain; version=0.0.4")
+
+async def answer_chat(request: ChatRequest, headers, details):
+    """Answer one chat turn and store it; details gets its conversation ID and source"""
+    conversation_id, history, new_messages = await resolve_conversation(request)
+    details["conversation_id"] = conversation_id
+    begin_request(conversation_id, headers)
+    azure_messages = build_azure_messages(request, conversation_id, history, new_messages)
+    assistant_response = await get_cached_response(azure_messages)
+    details["source"] = "cache" if assistant_response is not None else "upstream"
+    
+    if assistant_response is None:
+        if COALESCE_REQUESTS:
+            assistant_response = await single_flight.run(
+                coalescing_key(azure_messages),
+                lambda: complete_upstream(azure_messages),
+            )
+        else:
+            assistant_response = await complete_upstream(azure_messages)
+    
+    reply = assistant_message(assistant_response)
+    await conversation_store.append(conversation_id, new_messages + [reply])
+    
+    return ChatResponse(
+        message=Message(**reply),
+        conversation_id=conversation_id
+    )
 
 @app.post("/api/chat", response_model=ChatResponse)
-async def chat_completion(request: ChatRequest):
+async def chat_completion(request: ChatRequest, raw_request: Request, response: Response):
     """
     Handle chat completion requests using Azure AI Foundry
+
+    A request repeating an Idempotency-Key gets the first request's answer
+    (waiting for it if needed) without a new model call.
     """
+    started = time.perf_counter()
+    record_request_parse(raw_request.state)
+    details = {"conversation_id": None, "source": None}
     try:
-        # Get the last user message
-        user_messages = [msg for msg in request.messages if msg.role == "user"]
-        if not user_messages:
-            raise HTTPException(status_code=400, detail="No user message found")
+        key = request_idempotency_key(raw_request)
+        if key is None:
+            return await answer_chat(request, raw_request.headers, details)
         
-        # Convert request messages to Azure AI format
-        azure_messages = [
-            {"role": "system", "content": get_solution_architect_system_prompt()},
-        ]
-        
-        for msg in request.messages:
-            azure_messages.append({
-                "role": msg.role,
-                "content": msg.content
-            })
-        
-        response = openai_client.chat.completions.create(
-            model=model_deployment_name,
-            messages=azure_messages,
-            temperature=0.7,
-            max_tokens=1500
-        )
-        
-        assistant_response = response.choices[0].message.content
-        
-        # Create response message
-        response_message = Message(
-            role="assistant",
-            content=assistant_response
-        )
-        
-        return ChatResponse(
-            message=response_message,
-            conversation_id="dummy-conversation-id"
+        chat_response, replayed = await idempotency_store.run(
+            "chat",
+            key,
+            body_fingerprint(request.model_dump(mode="json")),
+            lambda: answer_chat(request, raw_request.headers, details),
         )
+        if replayed:
+            details.update(conversation_id=chat_response.conversation_id, source="idempotency")
+            response.headers["Idempotent-Replayed"] = "true"
+        return chat_response
         
+    except HTTPException:
+        raise
+    except IdempotencyKeyReused as e:
+        raise idempotency_conflict(e)
+    except AdmissionRejected as e:
+        raise rate_limited(e)
+    except CircuitOpen as e:
+        raise model_unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error processing chat request: {str(e)}")
+    finally:
+        # One summary line per request
+        error = sys.exc_info()[1]
+        status = getattr(error, "status_code", "cancelled" if isinstance(error, asyncio.CancelledError) else 200)
+        summary = log.error if status == 500 else log.info
+        summary(
+            "chat_finished",
+            conversation_id=details["conversation_id"],
+            status=status,
+            source=details["source"],
+            duration_ms=round((time.perf_counter() - started) * 1000, 1),
+            error=getattr(error, "detail", None),
+            hot=True,
+        )
 
-@app.post("/api/chat/stream")
-async def chat_completion_stream(request: ChatRequest):
-    """
-    Handle streaming chat completion requests using Azure AI Foundry
+async def sse_frames(deltas, started, source, stream=None, offset=0, **summary_fields):
+    """SSE frames for an answer's deltas, with event IDs when the stream is resumable
+
+    Logs one summary line per response instead of one per token.
     """
-    def generate_stream():  # Regular function, not async
-        try:
-            # Get the last user message
-            user_messages = [msg for msg in request.messages if msg.role == "user"]
-            if not user_messages:
-                yield f"data: {json.dumps({'error': 'No user message found'})}\n\n"
-                return
-            
-            # Convert request messages to Azure AI format
-            azure_messages = [
-                {"role": "system", "content": get_solution_architect_system_prompt()},
-            ]
-            
-            for msg in request.messages:
-                azure_messages.append({
-                    "role": msg.role,
-                    "content": msg.content
-                })
+    flush = FlushTimer()
+    outcome = "cancelled"  # Until it completes or fails; a client disconnect closes the generator
+    error = None
+    chars = 0
+    first_chunk_ms = None
+    try:
+        # Deltas are batched into frames; the first one is never held back
+        async with aclosing(deltas) as deltas, aclosing(coalesce_deltas(deltas)) as batches:
+            async for text in batches:
+                if first_chunk_ms is None:
+                    first_chunk_ms = (time.perf_counter() - started) * 1000
+                    ttft.observe(first_chunk_ms / 1000, source=source)
+                chars += len(text)
+                offset += len(text)
+                flush.start()
+                yield sse_chunk_frame(text, event_id(stream.id, offset) if stream is not None else None)
+                flush.stop()
             
-            print("🔄 Starting Azure AI streaming...")
+        # Signal end exactly like working example
+        flush.start()
+        yield SSE_DONE_FRAME
+        flush.stop()
+        outcome = "completed"
             
-            # Create streaming response
-            stream = openai_client.chat.completions.create(
-                model=model_deployment_name,
-                messages=azure_messages,
-                temperature=0.7,
-                max_tokens=1500,
-                stream=True
-            )
+    except Exception as e:
+        outcome = "error"
+        error = str(e)
+        yield sse_error_frame(error)
+    finally:
+        flush.record()
+        summary = log.error if error is not None else log.info
+        summary(
+            "chat_stream_finished",
+            stream_id=stream.id if stream is not None else None,
+            outcome=outcome,
+            source=source,
+            frames=flush.frames,
+            chars=chars,
+            ttft_ms=round(first_chunk_ms, 1) if first_chunk_ms is not None else None,
+            duration_ms=round((time.perf_counter() - started) * 1000, 1),
+            error=error,
+            hot=True,
+            **summary_fields,
+        )
+
+async def acquire_stream_slot():
+    """Take a stream slot; raises a 503 when the limiter is saturated"""
+    try:
+        await stream_limiter.acquire()
+    except StreamLimiterSaturated as e:
+        raise HTTPException(
+            status_code=503,
+            detail="Too many concurrent streams, please retry shortly",
+            headers={"Retry-After": str(e.retry_after)},
+        )
+
+def sse_response(frames, conversation_id, stream=None, limiter=None, on_close=None):
+    """SSE response for an answer
+
+    Pass limiter when the response holds the slot taken by acquire_stream_slot
+    and returns it when it ends. A shared generation's slot belongs to the
+    generation instead (see start_shared_answer), so its readers pass none.
+    """
+    headers = {
+        "Cache-Control": "no-cache, no-store, must-revalidate",
+        "Connection": "keep-alive",
+        "Access-Control-Allow-Origin": "http://localhost:3000",
+        "Access-Control-Allow-Headers": "*",
+        "Access-Control-Allow-Methods": "POST, OPTIONS",
+        "X-Accel-Buffering": "no",  # Disable proxy buffering
+        "X-Conversation-Id": conversation_id,
+    }
+    if stream is not None:
+        headers["X-Stream-Id"] = stream.id  # Lets a client resume before it has seen an event ID
+    return LimitedStreamingResponse(frames, limiter, on_close=on_close, media_type="text/event-stream", headers=headers)
+
+async def resume_stream(last_event_id, started):
+    """Continue a dropped stream after the client's last event, from the replay buffer"""
+    parsed = parse_event_id(last_event_id)
+    stream = await resumable_streams.get(parsed[0]) if parsed else None
+    if stream is None or not stream.has_offset(parsed[1]):
+        stream_resumes.inc(outcome="unavailable")
+        raise HTTPException(status_code=410, detail="The stream can no longer be resumed")
+    stream_resumes.inc(outcome="resumed")
+    frames = sse_frames(
+        stream.subscribe(parsed[1]),
+        started,
+        "resume",
+        stream,
+        parsed[1],
+        conversation_id=stream.conversation_id,
+        resumed_from=parsed[1],
+    )
+    return sse_response(frames, stream.conversation_id, stream)
+
+async def prepare_answer(request: ChatRequest, headers):
+    """Resolve the turn, check the cache and reserve a backend before the response starts
+
+    Returns the answer's delta producer, a discard() that gives back what was
+    taken for it if the producer is never started, its source and its summary
+    fields.
+    """
+    conversation_id, history, new_messages = await resolve_conversation(request)
+    begin_request(conversation_id, headers)
+    azure_messages = build_azure_messages(request, conversation_id, history, new_messages)
+    cached_response = await get_cached_response(azure_messages)
+    
+    # Pick a backend and reserve its quota before the response starts so a
+    # rejection is still a 429. Streams joining an identical in-flight one make
+    # no upstream call; the fanout is held from here on so it cannot end before
+    # this stream reads it.
+    backend = None
+    fanout = None
+    if cached_response is None:
+        key = coalescing_key(azure_messages) if COALESCE_REQUESTS else None
+        fanout = stream_coalescer.attach(key) if key else None
+        if fanout is None:
+            try:
+                backend = await reserve_backend("chat_stream", azure_messages, COMPLETION_PARAMS["max_tokens"])
+            except AdmissionRejected as e:
+                raise rate_limited(e)
+            except CircuitOpen as e:
+                raise model_unavailable(e)
+            if key:
+                # An identical stream may have started while this one waited for quota
+                fanout = stream_coalescer.attach(key)
+                if fanout is not None:
+                    release_backend(backend, azure_messages, COMPLETION_PARAMS["max_tokens"])
+                    backend = None
+                else:
+                    fanout = stream_coalescer.start(key, lambda: stream_upstream(azure_messages, backend))
+    
+    started = False
+    
+    async def produce_answer():
+        """The answer's text deltas; the turn is stored once the answer is complete"""
+        nonlocal started
+        started = True
+        if cached_response is not None:
+            # Replay the cached answer through the same SSE framing
+            yield cached_response
+            full_response = cached_response
+        else:
+            # Identical in-flight streams share one upstream call
+            upstream = fanout.subscribe(held=True) if fanout is not None else stream_upstream(azure_messages, backend)
             
-            # Stream the response - EXACTLY like working Gemini example
-            for chunk in stream:
-                try:
-                    if (hasattr(chunk, 'choices') and 
-                        chunk.choices and 
-                        len(chunk.choices) > 0):
-                        
-                        choice = chunk.choices[0]
-                        
-                        if (hasattr(choice, 'delta') and 
-                            choice.delta and 
-                            hasattr(choice.delta, 'content') and 
-                            choice.delta.content is not None):
-                            
-                            text = choice.delta.content
-                            data_chunk = json.dumps({'chunk': text})
-                            yield f"data: {data_chunk}\n\n"
-                            print(f"📤 Yielding chunk: {repr(text)}")
-                        
-                        # Check for finish reason
-                        if (hasattr(choice, 'finish_reason') and 
-                            choice.finish_reason == 'stop'):
-                            print("✅ Stream completed")
-                            break
-                            
-                except (AttributeError, IndexError):
-                    continue  # Skip malformed chunks
-                
-            # Signal end exactly like working example
-            yield "data: [DONE]\n\n"
-            print("📤 Sent [DONE] signal")
-                
-        except Exception as e:
-            print(f"❌ Stream error: {e}")
-            yield f"data: {json.dumps({'error': str(e)})}\n\n"
+            response_parts = []
+            async with aclosing(upstream) as deltas:
+                async for text in deltas:
+                    response_parts.append(text)
+                    yield text
+            full_response = "".join(response_parts)
+        await conversation_store.append(conversation_id, new_messages + [assistant_message(full_response)])
     
-    return StreamingResponse(
-        generate_stream(),
-        media_type="text/event-stream",
-        headers={
-            "Cache-Control": "no-cache, no-store, must-revalidate",
-            "Connection": "keep-alive",
-            "Access-Control-Allow-Origin": "http://localhost:3000",
-            "Access-Control-Allow-Headers": "*",
-            "Access-Control-Allow-Methods": "POST, OPTIONS",
-            "X-Accel-Buffering": "no",  # Disable proxy buffering
-        }
-    )
+    def discard():
+        """Give back the fanout place or the quota held for an answer whose producer never ran
+
+        A response whose client left before the first chunk closes generators
+        that never started, so their own cleanup never runs.
+        """
+        if started:
+            return
+        if fanout is not None:
+            fanout.release()  # The shared upstream stops once nobody else reads it
+        elif backend is not None:
+            release_backend(backend, azure_messages, COMPLETION_PARAMS["max_tokens"])
+    
+    source = "cache" if cached_response is not None else "upstream"
+    fields = {"conversation_id": conversation_id, "backend": backend.name if backend is not None else None}
+    return produce_answer, discard, source, fields
+
+async def start_shared_answer(request: ChatRequest, headers):
+    """Take a stream slot and start generating the answer into a buffer its readers share
+
+    The buffer is a resumable stream, or a plain StreamFanout when resuming
+    is turned off. The slot belongs to the generation, not to a response: it
+    is given back once the answer is complete, fails or is abandoned after
+    the client left.
+    """
+    # The slot is taken before any quota is reserved, so a 503 never wastes a reservation
+    await acquire_stream_slot()
+    try:
+        produce_answer, discard, source, fields = await prepare_answer(request, headers)
+    except BaseException:
+        stream_limiter.release()
+        raise
+    try:
+        if resumable_streams is not None:
+            stream = await resumable_streams.start(produce_answer, fields["conversation_id"])
+        else:
+            stream = StreamFanout(fields["conversation_id"], lambda _: None)
+            stream.start(produce_answer)
+    except BaseException:
+        discard()
+        stream_limiter.release()
+        raise
+    stream.add_done_callback(stream_limiter.release)
+    return stream, source, fields
+
+def replayable(handle) -> bool:
+    """Whether a repeat of an Idempotency-Key can read this answer from the start"""
+    if resumable_streams is not None:
+        return resumable_streams.replayable(handle)
+    # Cancelled once its last reader left, or failed: there is no complete answer to share
+    return not handle.closing and handle.error is None
+
+async def idempotent_stream(request: ChatRequest, raw_request: Request, key, started):
+    """Stream a keyed request's answer, attaching a repeat of the key to the first request's stream
+
+    Without resumable streams the answer is shared through a StreamFanout
+    kept with the key: a repeat gets it from the start while the first
+    request is still reading it or once it completed, and a new answer after
+    the first client left mid-answer.
+    """
+    async def start_stream():
+        stream, source, fields = await start_shared_answer(request, raw_request.headers)
+        # A resumable stream is looked up by ID, so the key does not pin a spilled stream in memory
+        return (stream.id if resumable_streams is not None else stream), source, fields
+    
+    try:
+        (handle, source, fields), replayed = await idempotency_store.run(
+            "chat_stream",
+            key,
+            body_fingerprint(request.model_dump(mode="json")),
+            start_stream,
+            # A stream that failed or is no longer retained from its start is generated again
+            reusable=lambda result: replayable(result[0]),
+        )
+    except IdempotencyKeyReused as e:
+        raise idempotency_conflict(e)
+    if resumable_streams is None:
+        stream, resumable = handle, None
+    else:
+        stream = resumable = await resumable_streams.get(handle)
+        if stream is None:
+            raise HTTPException(status_code=410, detail="The stream can no longer be replayed")
+    frames = sse_frames(stream.subscribe(), started, "idempotency" if replayed else source, resumable, **fields)
+    response = sse_response(frames, fields["conversation_id"], resumable)
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return response
+
+@app.post("/api/chat/stream")
+async def chat_completion_stream(request: ChatRequest, raw_request: Request):
+    """
+    Handle streaming chat completion requests using Azure AI Foundry
+
+    A client whose stream dropped sends the same request again with a
+    Last-Event-ID header and gets the rest of the answer without a new model
+    call. A request repeating an Idempotency-Key gets the first request's
+    stream replayed from the start.
+    """
+    started = time.perf_counter()
+    record_request_parse(raw_request.state)
+    last_event_id = raw_request.headers.get("last-event-id")
+    if last_event_id and resumable_streams is not None:
+        return await resume_stream(last_event_id, started)
+    key = request_idempotency_key(raw_request)
+    if key is not None:
+        return await idempotent_stream(request, raw_request, key, started)
+    
+    if resumable_streams is not None:
+        # The answer is generated into a replay buffer that outlives this connection
+        stream, source, fields = await start_shared_answer(request, raw_request.headers)
+        frames = sse_frames(stream.subscribe(), started, source, stream, **fields)
+        return sse_response(frames, fields["conversation_id"], stream)
+    
+    # The slot is taken before any quota is reserved, so a 503 never wastes a reservation
+    await acquire_stream_slot()
+    try:
+        produce_answer, discard, source, fields = await prepare_answer(request, raw_request.headers)
+    except BaseException:
+        stream_limiter.release()
+        raise
+    frames = sse_frames(produce_answer(), started, source, **fields)
+    return sse_response(frames, fields["conversation_id"], limiter=stream_limiter, on_close=discard)
 
 @app.get("/api/conversations")
 async def get_conversations():
@@ -238,24 +900,25 @@ async def get_conversations():
 @app.get("/api/conversations/{conversation_id}")
 async def get_conversation(conversation_id: str):
     """
-    Get a specific conversation by ID (dummy endpoint)
+    Get a specific conversation by ID
     """
+    messages = await conversation_store.get(conversation_id) if is_valid_conversation_id(conversation_id) else None
+    if messages is None:
+        raise HTTPException(status_code=404, detail=f"Conversation {conversation_id} not found")
     return {
         "id": conversation_id,
-        "messages": [
-            {
-                "role": "assistant",
-                "content": "Hello! How can I help you today?",
-                "timestamp": "2025-08-06T00:00:00Z"
-            }
-        ]
+        "messages": messages
     }
 
 @app.delete("/api/conversations/{conversation_id}")
 async def delete_conversation(conversation_id: str):
     """
-    Delete a specific conversation (dummy endpoint)
+    Delete a specific conversation
     """
+    deleted = await conversation_store.delete(conversation_id) if is_valid_conversation_id(conversation_id) else False
+    history_compactor.forget(conversation_id)
+    if not deleted:
+        raise HTTPException(status_code=404, detail=f"Conversation {conversation_id} not found")
     return {"message": f"Conversation {conversation_id} deleted successfully"}
 
 if __name__ == "__main__":
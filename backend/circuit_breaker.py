@@ -0,0 +1,114 @@
+"""
+Per-backend circuit breakers for model calls
+
+A degraded deployment used to cost every request a full SDK timeout followed
+by a 500. Each routed backend now has a breaker:
+
+- closed: calls go through; CIRCUIT_FAILURE_THRESHOLD failures in a row open it
+- open: no calls for CIRCUIT_OPEN_SECONDS; the router skips the backend and
+  uses the others, then FALLBACK_DEPLOYMENT, and fails fast with a 503 when
+  none is left
+- half-open: one probe call is let through; success closes the breaker,
+  failure opens it again. Only the probe decides: results of calls started
+  before it (for example long streams sent while the breaker was still
+  closed) are ignored once the breaker has opened
+
+Only failures of the backend count (5xx, timeouts, connection errors), not
+429s or errors caused by the request. Transitions are counted in
+circuit_breaker_transitions_total and the current state is exported as
+circuit_breaker_state.
+"""
+import os
+import time
+from typing import Optional
+
+import metrics
+from structured_logging import get_logger
+
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "3"))
+CIRCUIT_OPEN_SECONDS = float(os.getenv("CIRCUIT_OPEN_SECONDS", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+_STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+breaker_state = metrics.gauge("circuit_breaker_state", "Breaker state per backend: 0 closed, 1 half-open, 2 open")
+breaker_transitions = metrics.counter("circuit_breaker_transitions_total", "Breaker state changes per backend, by new state")
+breaker_rejections = metrics.counter("circuit_breaker_rejected_total", "Requests failed fast because every breaker was open")
+
+log = get_logger("circuit_breaker")
+
+
+class CircuitOpen(Exception):
+    """Raised when no backend with a closed (or probing) breaker is left"""
+
+    def __init__(self, retry_after: float):
+        super().__init__("The model is unavailable, please retry shortly")
+        self.retry_after = max(1, int(retry_after + 0.999))
+
+
+class CircuitBreaker:
+    """Closed/open/half-open breaker counting consecutive failures"""
+
+    def __init__(self, name: str, failure_threshold: int, open_seconds: float):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probe_started: Optional[float] = None
+        breaker_state.set(_STATE_VALUES[CLOSED], backend=name)
+
+    def _transition(self, state: str) -> None:
+        if state == self.state:
+            return
+        (log.info if state == CLOSED else log.warning)("circuit_breaker_transition", backend=self.name, previous=self.state, state=state)
+        self.state = state
+        breaker_state.set(_STATE_VALUES[state], backend=self.name)
+        breaker_transitions.inc(backend=self.name, state=state)
+
+    def retry_in(self, now: float) -> float:
+        """Seconds until the breaker lets a call through again"""
+        if self.state == CLOSED:
+            return 0.0
+        return max(self.opened_at + self.open_seconds - now, 0.0)
+
+    def allows(self, now: float) -> bool:
+        """Whether a call may be sent now (in half-open, only while no probe is running)"""
+        if self.state == CLOSED:
+            return True
+        if now < self.opened_at + self.open_seconds:
+            return False
+        # A probe that never reported back (e.g. rejected before it was sent) expires
+        return self.probe_started is None or now - self.probe_started > self.open_seconds
+
+    def on_pick(self, now: float) -> None:
+        """A call is about to be sent; past the open period it becomes the probe"""
+        if self.state != CLOSED:
+            self._transition(HALF_OPEN)
+            self.probe_started = now
+
+    def _is_stale(self, started_at: float) -> bool:
+        """Whether a call's result is too old to decide an open or half-open breaker"""
+        return self.state != CLOSED and (self.probe_started is None or started_at < self.probe_started)
+
+    def record_success(self, started_at: float) -> None:
+        """Report a call that succeeded; started_at is its time.monotonic() start"""
+        if self._is_stale(started_at):
+            return
+        self.failures = 0
+        self.probe_started = None
+        self._transition(CLOSED)
+
+    def record_failure(self, started_at: float) -> None:
+        """Report a call that failed because of the backend; started_at is its time.monotonic() start"""
+        if self._is_stale(started_at):
+            return
+        self.failures += 1
+        if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+            self.opened_at = time.monotonic()
+            self.probe_started = None
+            self._transition(OPEN)
@@ -0,0 +1,226 @@
+"""
+Single-flight coalescing of identical in-flight chat requests
+
+Concurrent requests whose normalized messages, model and parameters match
+share one upstream call. Non-streaming callers await the same task. Streaming
+callers subscribe to a StreamFanout: one pump task reads the upstream stream
+into a shared append-only buffer and every subscriber reads it at its own
+position, so a slow client never holds back the others and a late joiner
+still gets the answer from the first token.
+
+The upstream call is only cancelled once every caller has gone away.
+"""
+import asyncio
+import bisect
+import hashlib
+import json
+import os
+from contextlib import aclosing
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+import metrics
+
+COALESCE_REQUESTS = os.getenv("COALESCE_REQUESTS", "true").lower() == "true"
+
+coalesced_requests = metrics.counter("coalesced_requests_total", "Requests that joined an identical in-flight upstream call")
+inflight_upstream = metrics.gauge("coalescing_inflight_upstream", "Distinct upstream calls currently shared by callers")
+
+
+def request_fingerprint(system_prompt_version: str, messages: List[Dict[str, str]], model: str, params: Dict) -> str:
+    """Hash a request with whitespace-normalized message content"""
+    normalized = [{"role": msg["role"], "content": " ".join(msg["content"].split())} for msg in messages]
+    payload = json.dumps([system_prompt_version, normalized, model, params], sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class _Flight:
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Share one awaitable result between concurrent callers with the same key"""
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+
+    async def run(self, key: str, call: Callable[[], Awaitable]):
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight(asyncio.create_task(call()))
+            self._flights[key] = flight
+            inflight_upstream.inc()
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        else:
+            coalesced_requests.inc(mode="complete")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task)
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()  # Nobody is waiting for the answer any more
+                self._forget(key, flight)
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+            inflight_upstream.dec()
+
+
+class OffsetUnavailable(Exception):
+    """Raised when a stream's text at an offset was dropped or not produced yet"""
+
+
+class StreamFanout:
+    """One upstream text stream broadcast to any number of subscribers
+
+    Subscribers read by character offset from the start of the text. With
+    max_chars set, only the last max_chars characters are kept, in whole
+    chunks, and earlier offsets can no longer be read.
+    """
+
+    def __init__(self, key: str, on_finished: Callable[["StreamFanout"], None], max_chars: Optional[int] = None):
+        self.key = key
+        self.max_chars = max_chars
+        self.size = 0  # Characters produced so far
+        self.base = 0  # Characters dropped from the front of the buffer
+        self.done = False
+        self.closing = False  # Every subscriber left and the pump is being cancelled
+        self.error: Optional[BaseException] = None
+        self.subscribers = 0
+        self._chunks: List[str] = []
+        self._starts: List[int] = []  # Offset of each buffered chunk
+        self._changed = asyncio.Condition()
+        self._on_finished = on_finished
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, produce: Callable[[], AsyncIterator[str]]) -> None:
+        """Start pumping produce() into the buffer"""
+        self._task = asyncio.create_task(self._pump(produce))
+
+    def add_done_callback(self, callback: Callable[[], None]) -> None:
+        """Call callback once the pump has ended, however it ended"""
+        self._task.add_done_callback(lambda _: callback())
+
+    def _append(self, text: str) -> None:
+        self._chunks.append(text)
+        self._starts.append(self.size)
+        self.size += len(text)
+        if self.max_chars is not None and self.size - self.base > self.max_chars:
+            # Drop whole chunks from the front, keeping at least the newest one
+            keep_from = min(bisect.bisect_left(self._starts, self.size - self.max_chars), len(self._chunks) - 1)
+            del self._chunks[:keep_from], self._starts[:keep_from]
+            self.base = self._starts[0]
+
+    def has_offset(self, offset: int) -> bool:
+        """Whether reading can start at offset (it is neither dropped nor past the end)"""
+        return self.base <= offset <= self.size
+
+    def read(self, offset: int) -> str:
+        """Buffered text from offset on; raises OffsetUnavailable if it was dropped or never sent"""
+        if not self.has_offset(offset):
+            raise OffsetUnavailable(f"Stream {self.key} has no text at offset {offset}")
+        if offset == self.size:
+            return ""
+        index = bisect.bisect_right(self._starts, offset) - 1
+        return self._chunks[index][offset - self._starts[index]:] + "".join(self._chunks[index + 1:])
+
+    def text(self) -> str:
+        return "".join(self._chunks)
+
+    async def _pump(self, produce: Callable[[], AsyncIterator[str]]) -> None:
+        try:
+            async with aclosing(produce()) as chunks:
+                async for text in chunks:
+                    async with self._changed:
+                        self._append(text)
+                        self._changed.notify_all()
+        except BaseException as e:
+            self.error = e
+            if isinstance(e, asyncio.CancelledError):
+                raise
+        finally:
+            self.done = True
+            self._finished()
+            async with self._changed:
+                self._changed.notify_all()
+
+    def _finished(self) -> None:
+        """The pump ended; called before waiting subscribers are woken"""
+        self._on_finished(self)
+
+    def hold(self) -> None:
+        """Keep the upstream stream running for a caller that will subscribe(held=True) later"""
+        self.subscribers += 1
+
+    async def subscribe(self, offset: int = 0, held: bool = False) -> AsyncIterator[str]:
+        """Yield the text from offset on as it is produced; raises if the upstream stream failed
+
+        With held=True the subscription takes over a place taken with hold().
+        """
+        if not held:
+            self.hold()
+        try:
+            while True:
+                async with self._changed:
+                    await self._changed.wait_for(lambda: offset < self.size or self.done)
+                    text = self.read(offset)
+                    finished = self.done
+                if text:
+                    offset += len(text)
+                    yield text
+                if finished and offset >= self.size:
+                    break
+            if self.error is not None:
+                raise self.error
+        finally:
+            self.release()
+
+    def release(self) -> None:
+        """Give back a place taken with hold() (subscribe() does this when it ends)"""
+        self.subscribers -= 1
+        if self.subscribers == 0 and not self.done:
+            self._idle()
+
+    def _idle(self) -> None:
+        """The last subscriber left before the stream ended: stop generating"""
+        self.closing = True
+        self._on_finished(self)
+        self._task.cancel()
+
+
+class StreamCoalescer:
+    """Registry of in-flight StreamFanouts keyed by request fingerprint"""
+
+    def __init__(self):
+        self._fanouts: Dict[str, StreamFanout] = {}
+
+    def attach(self, key: str) -> Optional[StreamFanout]:
+        """The running fanout for key, held for the caller, or None when there is none"""
+        fanout = self._fanouts.get(key)
+        if fanout is None or fanout.done or fanout.closing:
+            return None
+        coalesced_requests.inc(mode="stream")
+        fanout.hold()
+        return fanout
+
+    def start(self, key: str, produce: Callable[[], AsyncIterator[str]]) -> StreamFanout:
+        """A new fanout running produce, held for the caller; later callers with key attach to it"""
+        fanout = StreamFanout(key, self._forget)
+        fanout.start(produce)
+        fanout.hold()
+        self._fanouts[key] = fanout
+        inflight_upstream.inc()
+        return fanout
+
+    def _forget(self, fanout: StreamFanout) -> None:
+        if self._fanouts.get(fanout.key) is fanout:
+            del self._fanouts[fanout.key]
+            inflight_upstream.dec()
+
+
+single_flight = SingleFlight()
+stream_coalescer = StreamCoalescer()
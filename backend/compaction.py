@@ -0,0 +1,153 @@
+"""
+Token-budget-aware history compaction
+
+When a conversation's history exceeds HISTORY_TOKEN_BUDGET, the most recent
+messages are kept verbatim and everything older is replaced by a rolling
+summary. Summaries are produced in the background by an LLM call, so a request
+never waits on one: it uses the latest summary available and drops whatever
+that summary does not cover yet.
+"""
+import asyncio
+import os
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional
+
+import metrics
+from structured_logging import get_logger
+
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "12000"))
+HISTORY_KEEP_RECENT_MESSAGES = int(os.getenv("HISTORY_KEEP_RECENT_MESSAGES", "6"))
+HISTORY_MAX_SUMMARIES = int(os.getenv("HISTORY_MAX_SUMMARIES", "1000"))
+
+MESSAGE_OVERHEAD_TOKENS = 4  # Role and separators added by the chat format
+
+try:
+    import tiktoken
+    _encoding = tiktoken.get_encoding("o200k_base")
+except Exception:  # Not installed, or the encoding cannot be loaded offline
+    _encoding = None
+
+compactions = metrics.counter("history_compactions_total", "Requests whose history was compacted")
+summaries_generated = metrics.counter("history_summaries_total", "Background history summaries by outcome")
+tokens_compacted = metrics.counter("history_tokens_compacted_total", "History tokens replaced by a summary or dropped")
+
+log = get_logger("compaction")
+
+Summarizer = Callable[[Optional[str], List[Dict[str, str]]], Awaitable[str]]
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens locally, falling back to ~4 characters per token without tiktoken"""
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 3) // 4
+
+
+def message_tokens(message: Dict) -> int:
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+class Summary(NamedTuple):
+    text: str
+    covered: int  # Number of leading messages the summary covers
+    tokens: int
+
+
+class HistoryCompactor:
+    """Keeps history within a token budget using a rolling background summary"""
+
+    def __init__(self, budget: int, keep_recent: int, max_summaries: int, summarize: Optional[Summarizer] = None):
+        self.budget = budget
+        self.keep_recent = keep_recent
+        self.max_summaries = max_summaries
+        self.summarize = summarize
+        self._summaries: "OrderedDict[str, Summary]" = OrderedDict()
+        self._pending: Dict[str, asyncio.Task] = {}
+        # Token counts of each conversation's stored messages, by position
+        self._history_tokens: "OrderedDict[str, List[int]]" = OrderedDict()
+
+    def _count_history(self, conversation_id: str, history: List[Dict]) -> List[int]:
+        """Token counts of stored history; it only grows, so only messages not seen before are counted"""
+        counts = self._history_tokens.pop(conversation_id, [])
+        if len(counts) > len(history):
+            counts = []
+        counts.extend(message_tokens(msg) for msg in history[len(counts):])
+        if history:
+            self._history_tokens[conversation_id] = counts
+            while len(self._history_tokens) > self.max_summaries:
+                self._history_tokens.popitem(last=False)
+        return counts
+
+    def compact(self, conversation_id: str, history: List[Dict], new_messages: List[Dict],
+                allow_summary: bool = True) -> List[Dict[str, str]]:
+        """Return the stored history plus the new turn, in Azure AI format, within the budget"""
+        messages = history + new_messages
+        tokens = self._count_history(conversation_id, history) + [message_tokens(msg) for msg in new_messages]
+        if sum(tokens) <= self.budget:
+            return [{"role": msg["role"], "content": msg["content"]} for msg in messages]
+
+        summary = self._summaries.get(conversation_id)
+        if summary is not None:
+            self._summaries.move_to_end(conversation_id)
+
+        # Keep the newest messages that fit next to the summary, and always the last keep_recent
+        available = self.budget - (summary.tokens if summary else 0)
+        start = len(messages)
+        used = 0
+        while start > 0:
+            kept = len(messages) - start
+            if used + tokens[start - 1] > available and kept >= self.keep_recent:
+                break
+            used += tokens[start - 1]
+            start -= 1
+
+        compactions.inc()
+        tokens_compacted.inc(sum(tokens[:start]))
+
+        if allow_summary and self.summarize is not None and (summary is None or summary.covered < start):
+            self._schedule_summary(conversation_id, summary, messages[:start])
+
+        compacted = []
+        if summary is not None:
+            compacted.append({"role": "system", "content": f"Summary of the earlier conversation:\n{summary.text}"})
+        compacted.extend({"role": msg["role"], "content": msg["content"]} for msg in messages[start:])
+        return compacted
+
+    def _schedule_summary(self, conversation_id: str, summary: Optional[Summary], older_messages: List[Dict]) -> None:
+        if conversation_id in self._pending:
+            return
+        covered = summary.covered if summary else 0
+        task = asyncio.create_task(
+            self._update_summary(conversation_id, summary, older_messages[covered:], len(older_messages))
+        )
+        self._pending[conversation_id] = task
+        task.add_done_callback(lambda done: self._clear_pending(conversation_id, done))
+
+    def _clear_pending(self, conversation_id: str, task: asyncio.Task) -> None:
+        if self._pending.get(conversation_id) is task:
+            del self._pending[conversation_id]
+
+    async def _update_summary(self, conversation_id: str, summary: Optional[Summary], new_messages: List[Dict], covered: int) -> None:
+        try:
+            text = await self.summarize(summary.text if summary else None, new_messages)
+        except Exception as e:
+            summaries_generated.inc(outcome="error")
+            log.error("history_summary_failed", conversation_id=conversation_id, error=str(e), hot=True)
+            return
+
+        summaries_generated.inc(outcome="ok")
+        self._summaries[conversation_id] = Summary(text, covered, count_tokens(text) + MESSAGE_OVERHEAD_TOKENS)
+        self._summaries.move_to_end(conversation_id)
+        while len(self._summaries) > self.max_summaries:
+            self._summaries.popitem(last=False)
+
+    def forget(self, conversation_id: str) -> None:
+        """Drop the summary of a deleted conversation"""
+        self._summaries.pop(conversation_id, None)
+        self._history_tokens.pop(conversation_id, None)
+        task = self._pending.pop(conversation_id, None)
+        if task is not None:
+            task.cancel()
+
+
+history_compactor = HistoryCompactor(HISTORY_TOKEN_BUDGET, HISTORY_KEEP_RECENT_MESSAGES, HISTORY_MAX_SUMMARIES)
@@ -0,0 +1,231 @@
+"""
+Content recording policy for GenAI telemetry
+
+The OpenAI instrumentation records prompts and completions, so every request
+would export the full system prompt (all of core_knowledge.txt) plus the
+history. This layer decides per request how much of that reaches the exporter:
+
+- full: everything, for conversations flagged for debugging
+- sampled: CONTENT_RECORDING_SAMPLE_RATE of requests, with the system prompt
+  replaced by a reference to its content hash and every recorded value capped
+  at CONTENT_RECORDING_MAX_ATTRIBUTE_BYTES
+- off: content removed; model, token and timing metadata are kept
+
+The mode is picked when a request starts and carried in a context variable.
+A span processor tags each span with it as the span starts, and an exporter
+wrapper hands the exporter redacted copies of finished spans, so the SDK's own
+span objects are never modified. A log record processor applies the mode to
+GenAI events emitted as logs.
+"""
+import contextvars
+import json
+import os
+import random
+from typing import Any, Mapping, Optional, Sequence
+
+from opentelemetry.sdk._logs import LogRecordProcessor
+from opentelemetry.sdk.trace import Event, ReadableSpan, SpanProcessor
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+import metrics
+from prompts import get_solution_architect_system_prompt, get_system_prompt_version
+
+CONTENT_RECORDING_SAMPLE_RATE = float(os.getenv("CONTENT_RECORDING_SAMPLE_RATE", "0.1"))
+CONTENT_RECORDING_MAX_ATTRIBUTE_BYTES = int(os.getenv("CONTENT_RECORDING_MAX_ATTRIBUTE_BYTES", "2048"))
+CONTENT_RECORDING_FULL_SESSIONS = frozenset(
+    session.strip() for session in os.getenv("CONTENT_RECORDING_FULL_SESSIONS", "").split(",") if session.strip()
+)
+# Lets a client ask for full recording with an X-Content-Recording: full header
+CONTENT_RECORDING_ALLOW_HEADER = os.getenv("CONTENT_RECORDING_ALLOW_HEADER", "false").lower() == "true"
+
+FULL = "full"
+SAMPLED = "sampled"
+OFF = "off"
+
+MODE_ATTRIBUTE = "architect_agent.content_recording"
+
+_CONTENT_ATTRIBUTE_PREFIXES = (
+    "gen_ai.prompt",
+    "gen_ai.completion",
+    "gen_ai.input.messages",
+    "gen_ai.output.messages",
+    "gen_ai.system_instructions",
+    "gen_ai.event.content",
+)
+
+_mode: contextvars.ContextVar[str] = contextvars.ContextVar("content_recording_mode", default=OFF)
+
+recorded_requests = metrics.counter("genai_content_recording_requests_total", "Requests by content recording mode")
+truncated_values = metrics.counter("genai_content_truncated_total", "Recorded content values cut to the byte cap")
+
+
+def select_mode(conversation_id: Optional[str], headers: Mapping[str, str]) -> str:
+    """Pick the recording mode for one request"""
+    if conversation_id in CONTENT_RECORDING_FULL_SESSIONS:
+        return FULL
+    if CONTENT_RECORDING_ALLOW_HEADER and headers.get("x-content-recording", "").lower() == FULL:
+        return FULL
+    return SAMPLED if random.random() < CONTENT_RECORDING_SAMPLE_RATE else OFF
+
+
+def begin_request(conversation_id: Optional[str], headers: Mapping[str, str]) -> str:
+    """Set the recording mode for the rest of the current request"""
+    mode = select_mode(conversation_id, headers)
+    _mode.set(mode)
+    recorded_requests.inc(mode=mode)
+    return mode
+
+
+def current_mode() -> str:
+    return _mode.get()
+
+
+_prompt_reference_cache = {}
+
+
+def _system_prompt_reference():
+    """(raw prompt, JSON-escaped prompt, reference) for the current system prompt version"""
+    version = get_system_prompt_version()
+    forms = _prompt_reference_cache.get(version)
+    if forms is None:
+        prompt = get_solution_architect_system_prompt()
+        forms = (prompt, json.dumps(prompt)[1:-1], f"[system prompt sha256:{version}]")
+        _prompt_reference_cache.clear()
+        _prompt_reference_cache[version] = forms
+    return forms
+
+
+def _cap(value: str) -> str:
+    encoded = value.encode('utf-8')
+    if len(encoded) <= CONTENT_RECORDING_MAX_ATTRIBUTE_BYTES:
+        return value
+    truncated_values.inc()
+    kept = encoded[:CONTENT_RECORDING_MAX_ATTRIBUTE_BYTES].decode('utf-8', errors='ignore')
+    return f"{kept}...[truncated {len(encoded) - CONTENT_RECORDING_MAX_ATTRIBUTE_BYTES} bytes]"
+
+
+def apply_policy(value: Any, mode: str) -> Any:
+    """Return what may be exported of a content value, or None to drop it"""
+    if mode == FULL:
+        return value
+    if mode == OFF or not isinstance(value, str):
+        return None
+    raw, escaped, reference = _system_prompt_reference()
+    if raw and raw in value:
+        value = value.replace(raw, reference)
+    elif escaped and escaped in value:
+        value = value.replace(escaped, reference)
+    return _cap(value)
+
+
+def _is_content_attribute(key: str) -> bool:
+    return key.startswith(_CONTENT_ATTRIBUTE_PREFIXES)
+
+
+def _filter_attributes(attributes: Optional[Mapping[str, Any]], mode: str):
+    """Apply the policy to content attributes; returns None when nothing changed"""
+    if not attributes or not any(_is_content_attribute(key) for key in attributes):
+        return None
+    filtered = {}
+    for key, value in attributes.items():
+        if _is_content_attribute(key):
+            value = apply_policy(value, mode)
+            if value is None:
+                continue
+        filtered[key] = value
+    return filtered
+
+
+def _filter_content(body: Mapping[str, Any], mode: str) -> dict:
+    """Copy of an event body with the policy applied to its "content" field"""
+    filtered = dict(body)
+    if "content" in filtered:
+        content = apply_policy(filtered.pop("content"), mode)
+        if content is not None:
+            filtered["content"] = content
+    return filtered
+
+
+class ContentRecordingSpanProcessor(SpanProcessor):
+    """Tags spans with the request's recording mode, for ContentRecordingSpanExporter to enforce"""
+
+    def on_start(self, span, parent_context=None) -> None:
+        span.set_attribute(MODE_ATTRIBUTE, current_mode())
+
+
+def redact_span(span: ReadableSpan) -> ReadableSpan:
+    """The span as it may be exported under the recording mode it was tagged with"""
+    mode = (span.attributes or {}).get(MODE_ATTRIBUTE, OFF)
+    if mode == FULL:
+        return span
+
+    attributes = _filter_attributes(span.attributes, mode)
+    events = []
+    for event in span.events:
+        event_attributes = _filter_attributes(event.attributes, mode) if event.name.startswith("gen_ai.") else None
+        if event_attributes is None:
+            events.append(event)
+        elif event_attributes or mode != OFF:
+            events.append(Event(event.name, event_attributes, event.timestamp))
+    if attributes is None and len(events) == len(span.events) and all(a is b for a, b in zip(events, span.events)):
+        return span
+
+    return ReadableSpan(
+        name=span.name,
+        context=span.context,
+        parent=span.parent,
+        resource=span.resource,
+        attributes=span.attributes if attributes is None else attributes,
+        events=events,
+        links=span.links,
+        kind=span.kind,
+        status=span.status,
+        start_time=span.start_time,
+        end_time=span.end_time,
+        instrumentation_scope=span.instrumentation_scope,
+    )
+
+
+class ContentRecordingSpanExporter(SpanExporter):
+    """Wraps an exporter so it only receives spans redacted to their recording mode"""
+
+    def __init__(self, exporter: SpanExporter):
+        self.exporter = exporter
+
+    def export(self, spans: Sequence[ReadableSpan]) -> SpanExportResult:
+        return self.exporter.export([redact_span(span) for span in spans])
+
+    def shutdown(self) -> None:
+        self.exporter.shutdown()
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self.exporter.force_flush(timeout_millis)
+
+
+class ContentRecordingLogProcessor(LogRecordProcessor):
+    """Enforces the recording mode on GenAI events emitted as log records"""
+
+    def on_emit(self, log_data) -> None:
+        record = getattr(log_data, "log_record", log_data)
+        attributes = record.attributes or {}
+        event_name = getattr(record, "event_name", None) or attributes.get("event.name", "")
+        if not event_name.startswith("gen_ai.") or not isinstance(record.body, dict):
+            return
+        mode = current_mode()  # Log records are emitted synchronously in the request's context
+        if mode == FULL:
+            return
+
+        body = _filter_content(record.body, mode)
+        message = body.get("message")
+        if isinstance(message, dict):
+            body["message"] = _filter_content(message, mode)
+        record.body = body
+
+    # Older SDKs call emit() instead of on_emit()
+    emit = on_emit
+
+    def shutdown(self) -> None:
+        pass
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return True
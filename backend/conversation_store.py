@@ -0,0 +1,162 @@
+"""
+Server-side conversation history for the chat endpoints
+
+Clients send a conversation_id plus only the new turn; the history lives here.
+The most recently used conversations are kept in memory up to a fixed count,
+older ones are spilled to JSON files on disk and loaded back on demand, and
+the number of spilled conversations is capped too.
+
+Each conversation has its own lock, held across its disk I/O, so a slow read
+or write only holds up requests for that conversation. A conversation is
+only spilled or dropped while no request holds its lock.
+
+The spill directory holds chat content, so it must be one only this process's
+user can use; see private_files.
+"""
+import asyncio
+import json
+import os
+import re
+import tempfile
+import uuid
+import weakref
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional
+
+from private_files import private_directory, write_private_file
+
+CONVERSATION_MAX_IN_MEMORY = int(os.getenv("CONVERSATION_MAX_IN_MEMORY", "1000"))
+CONVERSATION_MAX_ON_DISK = int(os.getenv("CONVERSATION_MAX_ON_DISK", "100000"))
+CONVERSATION_SPILL_DIR = os.getenv(
+    "CONVERSATION_SPILL_DIR",
+    os.path.join(tempfile.gettempdir(), "architect_agent_conversations"),
+)
+
+_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def is_valid_conversation_id(conversation_id: str) -> bool:
+    """Check that a conversation ID is safe to use as a file name"""
+    return bool(_ID_PATTERN.match(conversation_id))
+
+
+class ConversationStore:
+    """Bounded in-memory LRU of conversations that spills to disk"""
+
+    def __init__(self, max_in_memory: int, max_on_disk: int, spill_dir: str):
+        self.max_in_memory = max_in_memory
+        self.max_on_disk = max_on_disk
+        self.spill_dir = private_directory(spill_dir)
+        self._memory: "OrderedDict[str, List[Dict[str, str]]]" = OrderedDict()
+        self._on_disk: "OrderedDict[str, None]" = OrderedDict()
+        self._locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+        for name in sorted(os.listdir(self.spill_dir), key=lambda n: os.path.getmtime(os.path.join(self.spill_dir, n))):
+            if name.endswith(".json"):
+                self._on_disk[name[:-5]] = None
+
+    def new_id(self) -> str:
+        return uuid.uuid4().hex
+
+    @asynccontextmanager
+    async def _locked(self, conversation_id: str):
+        lock = self._locks.get(conversation_id)
+        if lock is None:
+            lock = self._locks[conversation_id] = asyncio.Lock()
+        async with lock:
+            yield
+
+    def _is_busy(self, conversation_id: str) -> bool:
+        lock = self._locks.get(conversation_id)
+        return lock is not None and lock.locked()
+
+    def _path(self, conversation_id: str) -> str:
+        return os.path.join(self.spill_dir, f"{conversation_id}.json")
+
+    def _write_file(self, conversation_id: str, messages: List[Dict[str, str]]) -> None:
+        write_private_file(self._path(conversation_id), json.dumps(messages).encode('utf-8'))
+
+    def _read_file(self, conversation_id: str) -> Optional[List[Dict[str, str]]]:
+        try:
+            with open(self._path(conversation_id), 'r', encoding='utf-8') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return None
+
+    def _remove_file(self, conversation_id: str) -> None:
+        try:
+            os.remove(self._path(conversation_id))
+        except FileNotFoundError:
+            pass
+
+    async def _spill_overflow(self) -> None:
+        """Move least recently used conversations to disk until memory is within bounds
+
+        Conversations in use are skipped; a later call spills them once they are idle.
+        """
+        while len(self._memory) > self.max_in_memory:
+            conversation_id = next((cid for cid in self._memory if not self._is_busy(cid)), None)
+            if conversation_id is None:
+                break
+            async with self._locked(conversation_id):
+                messages = self._memory.pop(conversation_id)
+                await asyncio.to_thread(self._write_file, conversation_id, messages)
+                self._on_disk[conversation_id] = None
+                self._on_disk.move_to_end(conversation_id)
+
+        while len(self._on_disk) > self.max_on_disk:
+            conversation_id = next((cid for cid in self._on_disk if not self._is_busy(cid)), None)
+            if conversation_id is None:
+                break
+            async with self._locked(conversation_id):
+                del self._on_disk[conversation_id]
+                await asyncio.to_thread(self._remove_file, conversation_id)
+
+    async def _load(self, conversation_id: str) -> Optional[List[Dict[str, str]]]:
+        """Messages from memory, or moved back from disk; call with the conversation's lock held"""
+        messages = self._memory.get(conversation_id)
+        if messages is None and conversation_id in self._on_disk:
+            messages = await asyncio.to_thread(self._read_file, conversation_id)
+            del self._on_disk[conversation_id]
+            await asyncio.to_thread(self._remove_file, conversation_id)
+            if messages is not None:
+                self._memory[conversation_id] = messages
+        return messages
+
+    async def get(self, conversation_id: str) -> Optional[List[Dict[str, str]]]:
+        """Get a copy of a conversation's messages, or None if it is unknown"""
+        async with self._locked(conversation_id):
+            messages = await self._load(conversation_id)
+            if messages is None:
+                return None
+            self._memory.move_to_end(conversation_id)
+            messages = list(messages)
+        await self._spill_overflow()
+        return messages
+
+    async def append(self, conversation_id: str, new_messages: List[Dict[str, str]]) -> None:
+        """Append messages to a conversation, creating it if needed"""
+        async with self._locked(conversation_id):
+            messages = await self._load(conversation_id)
+            if messages is None:
+                messages = self._memory[conversation_id] = []
+            messages.extend(new_messages)
+            self._memory.move_to_end(conversation_id)
+        await self._spill_overflow()
+
+    async def delete(self, conversation_id: str) -> bool:
+        """Delete a conversation; returns False if it did not exist"""
+        async with self._locked(conversation_id):
+            if self._memory.pop(conversation_id, None) is not None:
+                return True
+            if conversation_id in self._on_disk:
+                del self._on_disk[conversation_id]
+                await asyncio.to_thread(self._remove_file, conversation_id)
+                return True
+            return False
+
+conversation_store = ConversationStore(
+    CONVERSATION_MAX_IN_MEMORY,
+    CONVERSATION_MAX_ON_DISK,
+    CONVERSATION_SPILL_DIR,
+)
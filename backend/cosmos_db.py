@@ -6,10 +6,13 @@ from dotenv import load_dotenv
 from azure.cosmos import CosmosClient, exceptions, PartitionKey
 from azure.cosmos.container import ContainerProxy
 from azure.cosmos.database import DatabaseProxy
-from azure.identity import DefaultAzureCredential
+from credentials import get_credential
+from structured_logging import get_logger
 from datetime import datetime, timezone, timedelta
 import traceback
 
+log = get_logger("cosmos_db")
+
 class CosmosDBManager:
     def __init__(self, cosmos_host=None, cosmos_database_id=None, cosmos_container_id=None):
         self._load_env_variables(cosmos_host, cosmos_database_id, cosmos_container_id)
@@ -29,14 +32,8 @@ class CosmosDBManager:
             raise ValueError("Cosmos DB configuration is incomplete")
 
     def _get_cosmos_client(self) -> CosmosClient:
-        print("Initializing Cosmos DB client")
-        print("Using DefaultAzureCredential for Cosmos DB authentication")
-        credential = DefaultAzureCredential(
-            interactive_browser_tenant_id=self.tenant_id,
-            visual_studio_code_tenant_id=self.tenant_id,
-            workload_identity_tenant_id=self.tenant_id,
-            shared_cache_tenant_id=self.tenant_id
-        )
+        log.info("cosmos_client_initializing", host=self.cosmos_host, credential="shared")
+        credential = get_credential(tenant_id=self.tenant_id)
         return CosmosClient(self.cosmos_host, credential=credential)
 
     def _initialize_database_and_container(self) -> None:
@@ -44,16 +41,16 @@ class CosmosDBManager:
             self.database = self._create_or_get_database()
             self.container = self._create_or_get_container()
         except exceptions.CosmosHttpResponseError as e:
-            print(f'An error occurred: {e.message}')
+            log.error("cosmos_initialization_failed", error=e.message)
             raise
 
     def _create_or_get_database(self) -> DatabaseProxy:
         try:
             database = self.client.create_database(id=self.cosmos_database_id)
-            print(f'Database with id \'{self.cosmos_database_id}\' created')
+            log.info("cosmos_database_created", database=self.cosmos_database_id)
         except exceptions.CosmosResourceExistsError:
             database = self.client.get_database_client(self.cosmos_database_id)
-            print(f'Database with id \'{self.cosmos_database_id}\' was found')
+            log.info("cosmos_database_found", database=self.cosmos_database_id)
         return database
 
     def _create_or_get_container(self) -> ContainerProxy:
@@ -62,10 +59,10 @@ class CosmosDBManager:
                 id=self.cosmos_container_id, 
                 partition_key=PartitionKey(path='/user_id')
             )
-            print(f'Container with id \'{self.cosmos_container_id}\' created')
+            log.info("cosmos_container_created", container=self.cosmos_container_id)
         except exceptions.CosmosResourceExistsError:
             container = self.database.get_container_client(self.cosmos_container_id)
-            print(f'Container with id \'{self.cosmos_container_id}\' was found')
+            log.info("cosmos_container_found", container=self.cosmos_container_id)
         return container
 
     # Core CRUD Operations
@@ -77,7 +74,7 @@ class CosmosDBManager:
         except exceptions.CosmosResourceNotFoundError:
             return None
         except Exception as e:
-            print(f"Error retrieving item {item_id}: {str(e)}")
+            log.error("cosmos_read_failed", item_id=item_id, error=str(e))
             raise
 
     def create_item(self, item: Dict[str, Any]) -> Dict[str, Any]:
@@ -92,13 +89,13 @@ class CosmosDBManager:
             item['updated_at'] = current_time
             
             created_item = self.container.create_item(body=item)
-            print(f"Item created with id: {created_item['id']}")
+            log.debug("cosmos_item_created", item_id=created_item['id'], hot=True)
             return created_item
         except exceptions.CosmosResourceExistsError:
-            print(f"Item with id {item.get('id')} already exists")
+            log.warning("cosmos_item_exists", item_id=item.get('id'))
             raise
         except Exception as e:
-            print(f"Error creating item: {str(e)}")
+            log.error("cosmos_create_failed", item_id=item.get('id'), error=str(e))
             raise
 
     def update_item(self, item_id: str, updates: Dict[str, Any]) -> Dict[str, Any]:
@@ -120,7 +117,7 @@ class CosmosDBManager:
             )
             return updated_item
         except Exception as e:
-            print(f"Error updating item {item_id}: {str(e)}")
+            log.error("cosmos_update_failed", item_id=item_id, error=str(e))
             raise
 
     def delete_item(self, item_id: str, user_id: str) -> bool:
@@ -131,7 +128,7 @@ class CosmosDBManager:
         except exceptions.CosmosResourceNotFoundError:
             return False
         except Exception as e:
-            print(f"Error deleting item {item_id}: {str(e)}")
+            log.error("cosmos_delete_failed", item_id=item_id, error=str(e))
             raise
 
     def get_user_data(self, user_id: str) -> Dict[str, List[Dict[str, Any]]]:
@@ -168,7 +165,7 @@ class CosmosDBManager:
 
             return result
         except Exception as e:
-            print(f"Error getting user data: {str(e)}")
+            log.error("cosmos_user_data_failed", user_id=user_id, error=str(e))
             raise
 
     def get_changes_since(self, user_id: str, since_timestamp: str) -> List[Dict[str, Any]]:
@@ -189,7 +186,7 @@ class CosmosDBManager:
             ))
             return items
         except Exception as e:
-            print(f"Error getting changes since timestamp: {str(e)}")
+            log.error("cosmos_changes_query_failed", user_id=user_id, since=since_timestamp, error=str(e))
             raise
 
 
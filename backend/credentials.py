@@ -0,0 +1,341 @@
+"""
+Shared Azure credential provider
+
+DefaultAzureCredential walks its whole chain (environment, workload identity,
+managed identity, CLI, ...) the first time it is used, and every module used
+to build its own. Here one provider per tenant:
+
+- pins the credential type: AZURE_CREDENTIAL_TYPE if set, otherwise the type
+  DefaultAzureCredential resolved to, remembered on disk so restarts skip the
+  chain probe
+- caches tokens in memory, and in an encrypted file when
+  AZURE_TOKEN_CACHE_KEY (a Fernet key) is set, so restarts skip AAD too
+- refreshes tokens in a background thread TOKEN_REFRESH_MARGIN_SECONDS before
+  they expire, so a request never waits on AAD once a scope has been warmed
+
+get_credential() returns a sync TokenCredential and get_async_credential() an
+AsyncTokenCredential; both share the same provider and cache.
+"""
+import asyncio
+import json
+import os
+import tempfile
+import threading
+import time
+from typing import Callable, Dict, Optional, Tuple
+
+from azure.core.credentials import AccessToken
+from azure.identity import (
+    AzureCliCredential,
+    AzureDeveloperCliCredential,
+    AzurePowerShellCredential,
+    DefaultAzureCredential,
+    EnvironmentCredential,
+    InteractiveBrowserCredential,
+    ManagedIdentityCredential,
+    SharedTokenCacheCredential,
+    VisualStudioCodeCredential,
+    WorkloadIdentityCredential,
+)
+
+import metrics
+from private_files import private_directory, write_private_file
+from structured_logging import get_logger
+
+AZURE_CREDENTIAL_TYPE = os.getenv("AZURE_CREDENTIAL_TYPE", "").strip()
+AZURE_TOKEN_CACHE_KEY = os.getenv("AZURE_TOKEN_CACHE_KEY")
+CREDENTIAL_CACHE_DIR = os.getenv(
+    "CREDENTIAL_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "architect_agent_credentials"),
+)
+TOKEN_REFRESH_MARGIN_SECONDS = float(os.getenv("TOKEN_REFRESH_MARGIN_SECONDS", "600"))
+
+token_requests = metrics.counter("credential_token_requests_total", "Token requests by where the token came from")
+token_refreshes = metrics.counter("credential_token_refreshes_total", "Background token refreshes by outcome")
+
+log = get_logger("credentials")
+
+# Credential types DefaultAzureCredential can resolve to, by class name. Each is
+# built from the same environment settings DefaultAzureCredential passes it, so
+# a pinned rebuild after a restart is the same identity (e.g. a user-assigned
+# managed identity selected by AZURE_CLIENT_ID).
+CREDENTIAL_TYPES: Dict[str, Callable[[Optional[str]], object]] = {
+    "EnvironmentCredential": lambda tenant: EnvironmentCredential(),
+    "WorkloadIdentityCredential": lambda tenant: WorkloadIdentityCredential(
+        client_id=os.getenv("AZURE_CLIENT_ID"),
+        tenant_id=tenant or os.getenv("AZURE_TENANT_ID"),
+        token_file_path=os.getenv("AZURE_FEDERATED_TOKEN_FILE"),
+    ),
+    "ManagedIdentityCredential": lambda tenant: ManagedIdentityCredential(client_id=os.getenv("AZURE_CLIENT_ID")),
+    "SharedTokenCacheCredential": lambda tenant: SharedTokenCacheCredential(
+        username=os.getenv("AZURE_USERNAME"),
+        tenant_id=tenant or os.getenv("AZURE_TENANT_ID"),
+    ),
+    "AzureCliCredential": lambda tenant: AzureCliCredential(tenant_id=tenant or ""),
+    "AzurePowerShellCredential": lambda tenant: AzurePowerShellCredential(tenant_id=tenant or ""),
+    "AzureDeveloperCliCredential": lambda tenant: AzureDeveloperCliCredential(tenant_id=tenant or ""),
+    "VisualStudioCodeCredential": lambda tenant: VisualStudioCodeCredential(tenant_id=tenant),
+    "InteractiveBrowserCredential": lambda tenant: InteractiveBrowserCredential(tenant_id=tenant or os.getenv("AZURE_TENANT_ID")),
+}
+
+_CAE_SUFFIX = " #cae"  # Marks cache keys of CAE-enabled tokens, which are kept apart from the others
+
+
+def token_cache_key(scopes: Tuple[str, ...], claims: Optional[str] = None, tenant_id: Optional[str] = None,
+                    enable_cae: bool = False, **kwargs) -> Optional[str]:
+    """Cache key for a get_token call, or None when it must not be served from the cache"""
+    if claims or tenant_id or kwargs:
+        return None  # Claims challenges, cross-tenant and other special requests
+    return " ".join(scopes) + (_CAE_SUFFIX if enable_cae else "")
+
+
+def _token_request(scope_key: str) -> Tuple[Tuple[str, ...], Dict[str, bool]]:
+    """The scopes and get_token options a cache key was made from"""
+    if scope_key.endswith(_CAE_SUFFIX):
+        return tuple(scope_key[:-len(_CAE_SUFFIX)].split(" ")), {"enable_cae": True}
+    return tuple(scope_key.split(" ")), {}
+
+
+def _default_credential(tenant_id: Optional[str]) -> DefaultAzureCredential:
+    if not tenant_id:
+        return DefaultAzureCredential()
+    return DefaultAzureCredential(
+        interactive_browser_tenant_id=tenant_id,
+        visual_studio_code_tenant_id=tenant_id,
+        workload_identity_tenant_id=tenant_id,
+        shared_cache_tenant_id=tenant_id,
+    )
+
+
+class _TokenFile:
+    """Encrypted on-disk token cache (Fernet); disabled without a key or the cryptography package"""
+
+    def __init__(self, path: str, key: Optional[str]):
+        self.path = path
+        self._fernet = None
+        if key:
+            try:
+                from cryptography.fernet import Fernet
+                self._fernet = Fernet(key.encode('utf-8'))
+            except Exception as e:  # Not installed, or not a valid Fernet key
+                log.warning("token_cache_disabled", error=str(e))
+
+    def load(self) -> Dict[str, AccessToken]:
+        if self._fernet is None:
+            return {}
+        try:
+            with open(self.path, 'rb') as file:
+                entries = json.loads(self._fernet.decrypt(file.read()))
+        except Exception:  # Missing, corrupt or encrypted with another key
+            return {}
+        return {scope_key: AccessToken(token, expires_on) for scope_key, (token, expires_on) in entries.items()}
+
+    def save(self, tokens: Dict[str, AccessToken]) -> None:
+        if self._fernet is None:
+            return
+        payload = self._fernet.encrypt(json.dumps({k: [t.token, t.expires_on] for k, t in tokens.items()}).encode('utf-8'))
+        write_private_file(self.path, payload)
+
+
+class CredentialProvider:
+    """One pinned credential per tenant with a shared, proactively refreshed token cache"""
+
+    def __init__(self, tenant_id: Optional[str], cache_dir: str, refresh_margin: float, cache_key: Optional[str]):
+        self.tenant_id = tenant_id
+        self.refresh_margin = refresh_margin
+        cache_dir = private_directory(cache_dir)
+        suffix = tenant_id or "default"
+        self._type_path = os.path.join(cache_dir, f"credential_type_{suffix}")
+        self._token_file = _TokenFile(os.path.join(cache_dir, f"tokens_{suffix}.bin"), cache_key)
+        self._lock = threading.Lock()
+        self._credential = None
+        self._tokens: Dict[str, AccessToken] = self._token_file.load()
+        self._refresher: Optional[threading.Thread] = None
+        self._wake = threading.Event()
+
+    @property
+    def credential_type(self) -> Optional[str]:
+        return type(self._credential).__name__ if self._credential is not None else None
+
+    def _pinned_type(self) -> Optional[str]:
+        if AZURE_CREDENTIAL_TYPE:
+            return AZURE_CREDENTIAL_TYPE
+        try:
+            with open(self._type_path, 'r', encoding='utf-8') as file:
+                return file.read().strip() or None
+        except OSError:
+            return None
+
+    def _get_credential(self):
+        if self._credential is None:
+            pinned = self._pinned_type()
+            factory = CREDENTIAL_TYPES.get(pinned) if pinned else None
+            self._credential = factory(self.tenant_id) if factory else _default_credential(self.tenant_id)
+        return self._credential
+
+    def _fetch(self, scope_key: str) -> AccessToken:
+        scopes, options = _token_request(scope_key)
+        credential = self._get_credential()
+        try:
+            token = credential.get_token(*scopes, **options)
+        except Exception:
+            if isinstance(credential, DefaultAzureCredential) or AZURE_CREDENTIAL_TYPE:
+                raise
+            # The remembered type no longer works here (e.g. moved hosts): walk the chain again
+            self._forget_pinned_type()
+            credential = self._credential = _default_credential(self.tenant_id)
+            token = credential.get_token(*scopes, **options)
+
+        if isinstance(credential, DefaultAzureCredential) and not AZURE_CREDENTIAL_TYPE:
+            # _successful_credential is not a public API; without it DefaultAzureCredential is simply kept
+            resolved = getattr(credential, "_successful_credential", None)
+            if resolved is not None:
+                self._pin(type(resolved).__name__, resolved)
+        return token
+
+    def _pin(self, type_name: str, resolved) -> None:
+        """Use the credential DefaultAzureCredential settled on directly from now on"""
+        if type_name not in CREDENTIAL_TYPES:
+            return
+        self._credential = resolved
+        try:
+            write_private_file(self._type_path, type_name.encode('utf-8'))
+        except OSError as e:
+            log.warning("credential_type_not_saved", credential_type=type_name, error=str(e))
+        log.info("credential_pinned", credential_type=type_name)
+
+    def _forget_pinned_type(self) -> None:
+        try:
+            os.remove(self._type_path)
+        except OSError:
+            pass
+
+    def cached_token(self, scope_key: str) -> Optional[AccessToken]:
+        """A cached token that is still valid for at least 30 seconds, or None"""
+        token = self._tokens.get(scope_key)
+        if token is None or token.expires_on - time.time() <= 30:
+            return None
+        token_requests.inc(source="cache")
+        if token.expires_on - time.time() < self.refresh_margin:
+            self._wake.set()  # Let the refresher renew it off the request path
+        return token
+
+    def get_token(self, *scopes: str, **kwargs) -> AccessToken:
+        scope_key = token_cache_key(scopes, **kwargs)
+        if scope_key is None:
+            token_requests.inc(source="bypass")
+            return self._get_credential().get_token(*scopes, **kwargs)
+
+        token = self.cached_token(scope_key)
+        if token is not None:
+            return token
+
+        with self._lock:
+            token = self._tokens.get(scope_key)
+            if token is None or token.expires_on - time.time() <= 30:
+                token_requests.inc(source="aad")
+                token = self._store(scope_key, self._fetch(scope_key))
+        self._start_refresher()
+        return token
+
+    def _store(self, scope_key: str, token: AccessToken) -> AccessToken:
+        self._tokens[scope_key] = token
+        try:
+            self._token_file.save(dict(self._tokens))
+        except OSError as e:
+            log.warning("token_cache_write_failed", error=str(e))
+        return token
+
+    def _start_refresher(self) -> None:
+        if self._refresher is None:
+            self._refresher = threading.Thread(target=self._refresh_loop, name="credential-refresh", daemon=True)
+            self._refresher.start()
+
+    def _refresh_loop(self) -> None:
+        while True:
+            now = time.time()
+            due = [key for key, token in list(self._tokens.items()) if token.expires_on - now < self.refresh_margin]
+            for scope_key in due:
+                try:
+                    with self._lock:
+                        self._store(scope_key, self._fetch(scope_key))
+                    token_refreshes.inc(outcome="success")
+                except Exception as e:
+                    token_refreshes.inc(outcome="failure")
+                    log.error("token_refresh_failed", scope=scope_key, error=str(e))
+
+            # Sleep until the next token enters its refresh window (retry failures after a minute)
+            next_due = min((t.expires_on - self.refresh_margin for t in list(self._tokens.values())), default=now + 3600)
+            self._wake.wait(timeout=min(max(next_due - time.time(), 60 if due else 1), 3600))
+            self._wake.clear()
+
+
+class SharedCredential:
+    """Sync TokenCredential backed by a shared CredentialProvider"""
+
+    def __init__(self, provider: CredentialProvider):
+        self.provider = provider
+
+    def get_token(self, *scopes: str, **kwargs) -> AccessToken:
+        return self.provider.get_token(*scopes, **kwargs)
+
+    def close(self) -> None:
+        pass  # Shared for the life of the process
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args) -> None:
+        pass
+
+
+class AsyncSharedCredential:
+    """AsyncTokenCredential backed by a shared CredentialProvider
+
+    Cached tokens are returned without leaving the event loop; only a cold
+    fetch runs in a worker thread.
+    """
+
+    def __init__(self, provider: CredentialProvider):
+        self.provider = provider
+
+    async def get_token(self, *scopes: str, **kwargs) -> AccessToken:
+        scope_key = token_cache_key(scopes, **kwargs)
+        if scope_key is not None:
+            token = self.provider.cached_token(scope_key)
+            if token is not None:
+                return token
+        return await asyncio.to_thread(self.provider.get_token, *scopes, **kwargs)
+
+    async def close(self) -> None:
+        pass  # Shared for the life of the process
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        pass
+
+
+_providers: Dict[Optional[str], CredentialProvider] = {}
+_providers_lock = threading.Lock()
+
+
+def get_provider(tenant_id: Optional[str] = None) -> CredentialProvider:
+    """Get the shared provider for a tenant, creating it on first use"""
+    with _providers_lock:
+        provider = _providers.get(tenant_id)
+        if provider is None:
+            provider = CredentialProvider(tenant_id, CREDENTIAL_CACHE_DIR, TOKEN_REFRESH_MARGIN_SECONDS, AZURE_TOKEN_CACHE_KEY)
+            _providers[tenant_id] = provider
+        return provider
+
+
+def get_credential(tenant_id: Optional[str] = None) -> SharedCredential:
+    """Sync credential for Azure SDK clients"""
+    return SharedCredential(get_provider(tenant_id))
+
+
+def get_async_credential(tenant_id: Optional[str] = None) -> AsyncSharedCredential:
+    """Async credential for Azure SDK aio clients"""
+    return AsyncSharedCredential(get_provider(tenant_id))
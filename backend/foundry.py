@@ -2,7 +2,6 @@
 #opentelemetry-instrumentation-openai-v2==2.1b0
 
 from azure.ai.projects import AIProjectClient
-from azure.identity import DefaultAzureCredential
 from azure.monitor.opentelemetry import configure_azure_monitor
 from opentelemetry.instrumentation.openai_v2 import OpenAIInstrumentor
 from dotenv import load_dotenv
@@ -10,6 +9,8 @@ import os
 
 load_dotenv()
 
+from credentials import get_credential
+
 # Get environment variables
 endpoint = os.getenv("PROJECT_ENDPOINT")
 model_deployment_name = os.getenv("MODEL_DEPLOYMENT_NAME")
@@ -19,7 +20,7 @@ if not endpoint or not model_deployment_name:
 
 # Initialize Azure AI Project client
 project_client = AIProjectClient(
-    credential=DefaultAzureCredential(),
+    credential=get_credential(),
     endpoint=endpoint,
 )
 
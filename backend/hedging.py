@@ -0,0 +1,123 @@
+"""
+Hedged requests for non-streaming chat
+
+A few slow generations dominate p99 of /api/chat. With HEDGE_REQUESTS on, a
+call that has not answered after the HEDGE_PERCENTILE latency of earlier calls
+is sent again, to another backend when there is one. The first answer wins and
+the other call is cancelled, which closes its HTTP request.
+
+Hedges are paid from a budget: every request adds HEDGE_BUDGET_RATIO of a
+hedge (at most 1) and a hedge spends a whole one, so hedging can never more
+than double the number of model calls. Until HEDGE_MIN_SAMPLES calls have been
+timed no request is hedged.
+
+The delay is counted from when the first attempt was sent, not while it still
+waits for quota, so a request queued by admission control is not hedged for
+being queued. The percentile is taken over first attempts that answered, timed
+the same way by the Hedger itself: hedges, which are fast by selection, are
+left out so they cannot pull the delay down and trigger more hedging.
+"""
+import asyncio
+import os
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import metrics
+
+HEDGE_REQUESTS = os.getenv("HEDGE_REQUESTS", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "0.95"))
+HEDGE_MIN_DELAY_SECONDS = float(os.getenv("HEDGE_MIN_DELAY_SECONDS", "0.5"))
+HEDGE_BUDGET_RATIO = min(float(os.getenv("HEDGE_BUDGET_RATIO", "0.1")), 1.0)
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "50"))
+
+hedge_outcomes = metrics.counter("hedged_requests_total", "Requests that reached the hedge delay, by outcome")
+hedge_delay = metrics.gauge("hedge_delay_seconds", "Current delay before a request is hedged")
+hedge_primary_latency = metrics.histogram(
+    "hedge_primary_latency_seconds",
+    "Time from sending to answer of first attempts that won, which sets the hedge delay",
+)
+
+T = TypeVar("T")
+
+
+def _retrieve(task: asyncio.Task) -> None:
+    # A losing attempt's error is expected; don't let asyncio log it as never retrieved
+    if not task.cancelled():
+        task.exception()
+
+
+class Hedger:
+    """Sends a second attempt when the first is slower than the chosen percentile"""
+
+    def __init__(self, latency: metrics.Histogram, labels: dict, percentile: float, min_delay: float,
+                 budget_ratio: float, min_samples: int, max_budget: float = 10):
+        self.latency = latency
+        self.labels = labels
+        self.percentile = percentile
+        self.min_delay = min_delay
+        self.budget_ratio = budget_ratio
+        self.min_samples = min_samples
+        self.max_budget = max_budget
+        self.budget = 0.0
+        self._delay: Optional[float] = None
+        self._delay_checked = 0.0
+
+    def delay(self) -> Optional[float]:
+        """Seconds to wait before hedging, or None while there are too few samples"""
+        now = time.monotonic()
+        if now - self._delay_checked >= 1:  # Merging histogram shards is cheap, but not free per request
+            self._delay_checked = now
+            snapshot = self.latency.snapshot(**self.labels)
+            if snapshot is None or snapshot.count < self.min_samples:
+                self._delay = None
+            else:
+                self._delay = max(snapshot.quantile(self.percentile), self.min_delay)
+                hedge_delay.set(self._delay)
+        return self._delay
+
+    async def run(self, attempt: Callable[[bool, asyncio.Event], Awaitable[T]]) -> T:
+        """Run attempt, hedging it once if it is slow; returns the first successful result
+
+        attempt(hedge, sent) is called with hedge=False for the first attempt and
+        True for the hedge, and sets sent once its call has been admitted and sent.
+        """
+        self.budget = min(self.budget + self.budget_ratio, self.max_budget)
+        sent = asyncio.Event()
+        first = asyncio.create_task(attempt(False, sent))
+        delay = self.delay()
+        attempts = [first]
+        try:
+            waiting = asyncio.create_task(sent.wait())
+            try:
+                await asyncio.wait([first, waiting], return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                waiting.cancel()
+            sent_at = time.monotonic() if sent.is_set() else None
+            if delay is not None and not first.done():
+                done, _ = await asyncio.wait(attempts, timeout=delay)
+                if not done:
+                    if self.budget >= 1:
+                        self.budget -= 1
+                        attempts.append(asyncio.create_task(attempt(True, asyncio.Event())))
+                    else:
+                        hedge_outcomes.inc(outcome="no_budget")
+            return await self._first_success(attempts, sent_at)
+        finally:
+            for task in attempts:
+                task.cancel()  # The slower call, or both if the caller went away
+                task.add_done_callback(_retrieve)
+
+    async def _first_success(self, attempts, sent_at: Optional[float]):
+        pending = set(attempts)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if not task.cancelled() and task.exception() is None:
+                    if task is attempts[0] and sent_at is not None:
+                        self.latency.observe(time.monotonic() - sent_at, **self.labels)
+                    if len(attempts) > 1:
+                        hedge_outcomes.inc(outcome="primary_won" if task is attempts[0] else "hedge_won")
+                    return task.result()
+        if len(attempts) > 1:
+            hedge_outcomes.inc(outcome="both_failed")
+        return attempts[0].result()  # Every attempt failed: raise the first one's error
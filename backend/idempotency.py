@@ -0,0 +1,129 @@
+"""
+Idempotency keys for the chat endpoints
+
+A client retrying a chat request after a network blip used to pay for a
+second completion. Requests may carry an Idempotency-Key header; a request
+repeating a key seen within IDEMPOTENCY_WINDOW_SECONDS gets the first
+request's result instead of calling the model again:
+
+- /api/chat waits for the first request if it is still running, or returns
+  its stored response
+- /api/chat/stream attaches to the first request's stream and replays it
+  from the start (a resumable stream, see resumable.py, or with resuming
+  turned off a StreamFanout kept with the key)
+
+The first request's work runs in its own task, so it finishes (and its result
+is kept) even if that client went away. Failed requests are forgotten so they
+can be retried. Keys are scoped per endpoint, and reusing a key for a
+different request body is rejected with IdempotencyKeyReused (a 422), so a
+buggy client can never get the answer to another question. At most
+IDEMPOTENCY_MAX_KEYS keys are remembered; the oldest are forgotten first.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import re
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Mapping, Optional, Tuple, TypeVar
+
+import metrics
+
+IDEMPOTENCY_WINDOW_SECONDS = float(os.getenv("IDEMPOTENCY_WINDOW_SECONDS", "120"))
+IDEMPOTENCY_MAX_KEYS = int(os.getenv("IDEMPOTENCY_MAX_KEYS", "10000"))
+
+IDEMPOTENCY_KEY_HEADER = "idempotency-key"
+
+_KEY_PATTERN = re.compile(r"^[\x21-\x7e]{1,255}$")  # Printable ASCII, no spaces
+
+idempotent_requests = metrics.counter("idempotent_requests_total", "Requests with an Idempotency-Key, by endpoint and outcome")
+
+T = TypeVar("T")
+
+
+class InvalidIdempotencyKey(Exception):
+    """Raised for an Idempotency-Key header that is empty, too long or not printable ASCII"""
+
+
+class IdempotencyKeyReused(Exception):
+    """Raised when a key comes back with a different request body"""
+
+    def __init__(self):
+        super().__init__("This Idempotency-Key was already used for a different request")
+
+
+def idempotency_key(headers: Mapping[str, str]) -> Optional[str]:
+    """The request's Idempotency-Key, or None; raises InvalidIdempotencyKey"""
+    key = headers.get(IDEMPOTENCY_KEY_HEADER)
+    if key is None:
+        return None
+    if not _KEY_PATTERN.match(key):
+        raise InvalidIdempotencyKey("Idempotency-Key must be 1 to 255 printable ASCII characters")
+    return key
+
+
+def body_fingerprint(body: Any) -> str:
+    """Hash of a JSON-serializable request body"""
+    payload = json.dumps(body, sort_keys=True, separators=(',', ':'), default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _succeeded(task: asyncio.Task) -> bool:
+    return not task.cancelled() and task.exception() is None
+
+
+class _Entry:
+    def __init__(self, fingerprint: str, task: asyncio.Task, expires_at: float):
+        self.fingerprint = fingerprint
+        self.task = task
+        self.expires_at = expires_at
+
+
+class IdempotencyStore:
+    """Results of keyed requests, shared with their repeats for a time window"""
+
+    def __init__(self, window: float, max_keys: int):
+        self.window = window
+        self.max_keys = max_keys
+        self._entries: "OrderedDict[Tuple[str, str], _Entry]" = OrderedDict()
+
+    def _sweep(self) -> None:
+        now = time.monotonic()
+        while self._entries and next(iter(self._entries.values())).expires_at <= now:
+            self._entries.popitem(last=False)
+        while len(self._entries) > self.max_keys:
+            self._entries.popitem(last=False)
+
+    def _forget_failed(self, scope_key: Tuple[str, str], entry: _Entry) -> None:
+        if not _succeeded(entry.task) and self._entries.get(scope_key) is entry:
+            del self._entries[scope_key]
+
+    async def run(self, scope: str, key: str, fingerprint: str, call: Callable[[], Awaitable[T]],
+                  reusable: Optional[Callable[[T], bool]] = None) -> Tuple[T, bool]:
+        """Result of call for this key, and whether it was shared from an earlier request
+
+        A finished result for which reusable() is false is replaced by a new call.
+        """
+        self._sweep()
+        scope_key = (scope, key)
+        entry = self._entries.get(scope_key)
+        if entry is not None and entry.fingerprint != fingerprint:
+            idempotent_requests.inc(endpoint=scope, outcome="key_reused")
+            raise IdempotencyKeyReused()
+        if entry is not None and entry.task.done():
+            if not _succeeded(entry.task) or (reusable is not None and not reusable(entry.task.result())):
+                entry = None
+        replayed = entry is not None
+        if entry is None:
+            entry = _Entry(fingerprint, asyncio.create_task(call()), time.monotonic() + self.window)
+            self._entries.pop(scope_key, None)  # Keep the entries in expiry order
+            self._entries[scope_key] = entry
+            entry.task.add_done_callback(lambda _: self._forget_failed(scope_key, entry))
+            self._sweep()
+        idempotent_requests.inc(endpoint=scope, outcome="replayed" if replayed else "first")
+        # Shielded: the first request's work carries on for its repeats if its client goes away
+        return await asyncio.shield(entry.task), replayed
+
+
+idempotency_store = IdempotencyStore(IDEMPOTENCY_WINDOW_SECONDS, IDEMPOTENCY_MAX_KEYS)
@@ -0,0 +1,300 @@
+"""
+In-process metrics for the Solution Architect Agent API
+
+Instruments live in a module-level registry so any module can create or look
+them up by name. Counters and histograms are sharded per thread: each thread
+only ever writes its own shard, so recording takes no lock, and a scrape sums
+the shards. Histograms use HDR-style log-linear buckets (16 per power of two,
+about 6% relative error) so quantiles stay accurate from microseconds to
+minutes in a fixed amount of memory. Their edges do not line up with the
+Prometheus boundaries, so each observation is also counted against its export
+boundary directly; the exported le counts are exact rather than rounded to the
+enclosing HDR bucket.
+
+render_prometheus() formats everything for the /metrics endpoint without
+going through OpenTelemetry. Counters and gauges are also exported through
+OpenTelemetry (and therefore Azure Monitor) via observable callbacks, which
+only read the current values at export time.
+"""
+import bisect
+import math
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from opentelemetry import metrics as otel_metrics
+from opentelemetry.metrics import CallbackOptions, Observation
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# Histogram layout: values below HISTOGRAM_UNIT land in bucket 0, then
+# HISTOGRAM_SUB_BUCKETS linear buckets per power of two for HISTOGRAM_OCTAVES octaves
+HISTOGRAM_UNIT = 1e-6
+HISTOGRAM_SUB_BUCKETS = 16
+HISTOGRAM_OCTAVES = 32  # 1 microsecond up to ~71 minutes
+HISTOGRAM_BUCKETS = 1 + HISTOGRAM_SUB_BUCKETS * HISTOGRAM_OCTAVES
+
+# Bucket boundaries (in seconds) published to Prometheus
+DEFAULT_EXPORT_BOUNDARIES = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+_meter = otel_metrics.get_meter("architect_agent")
+_registry: Dict[str, "Instrument"] = {}
+_registry_lock = threading.Lock()
+
+
+def _label_key(labels: Dict[str, str]) -> LabelKey:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Instrument:
+    """Base class holding one value per label set"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, description: str):
+        self.name = name
+        self.description = description
+        self._values: Dict[LabelKey, float] = {}
+        self._lock = threading.Lock()
+
+    def collect(self) -> List[Tuple[LabelKey, float]]:
+        """Return a snapshot of (labels, value) pairs"""
+        with self._lock:
+            return list(self._values.items())
+
+    def value(self, **labels) -> float:
+        return dict(self.collect()).get(_label_key(labels), 0)
+
+    def _observe(self, options: CallbackOptions):
+        for key, value in self.collect():
+            yield Observation(value, dict(key))
+
+
+class _ShardedInstrument(Instrument):
+    """Instrument whose values are written to a per-thread shard without locking"""
+
+    def __init__(self, name: str, description: str):
+        super().__init__(name, description)
+        self._local = threading.local()
+        self._shards: List[Dict] = []
+
+    def _shard(self) -> Dict:
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = {}
+            with self._lock:  # Once per thread
+                self._shards.append(shard)
+            self._local.shard = shard
+            return shard
+
+    def _snapshot_shards(self) -> List[Dict]:
+        with self._lock:
+            shards = list(self._shards)
+        # Copy each shard so its owner can keep adding label sets while we read
+        return [dict(shard) for shard in shards]
+
+
+class Counter(_ShardedInstrument):
+    """Monotonically increasing count"""
+
+    kind = "counter"
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        shard = self._shard()
+        shard[key] = shard.get(key, 0) + amount
+
+    def collect(self) -> List[Tuple[LabelKey, float]]:
+        totals: Dict[LabelKey, float] = {}
+        for shard in self._snapshot_shards():
+            for key, value in shard.items():
+                totals[key] = totals.get(key, 0) + value
+        return list(totals.items())
+
+
+class Gauge(Instrument):
+    """Value that can go up and down"""
+
+    kind = "gauge"
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels) -> None:
+        self.inc(-amount, **labels)
+
+
+def bucket_index(value: float) -> int:
+    """HDR bucket holding a value"""
+    scaled = value / HISTOGRAM_UNIT
+    if scaled < 1:
+        return 0
+    mantissa, exponent = math.frexp(scaled)  # scaled = mantissa * 2**exponent, 0.5 <= mantissa < 1
+    index = 1 + (exponent - 1) * HISTOGRAM_SUB_BUCKETS + int((mantissa * 2 - 1) * HISTOGRAM_SUB_BUCKETS)
+    return min(index, HISTOGRAM_BUCKETS - 1)
+
+
+def bucket_upper_bound(index: int) -> float:
+    """Largest value a bucket can hold"""
+    if index == 0:
+        return HISTOGRAM_UNIT
+    octave, sub_bucket = divmod(index - 1, HISTOGRAM_SUB_BUCKETS)
+    return HISTOGRAM_UNIT * 2 ** octave * (1 + (sub_bucket + 1) / HISTOGRAM_SUB_BUCKETS)
+
+
+class HistogramSnapshot:
+    """Merged bucket counts of one label set"""
+
+    def __init__(self, buckets: List[int], total: float, count: int, exported: List[int]):
+        self.buckets = buckets
+        self.sum = total
+        self.count = count
+        self.exported = exported  # Per export boundary, +Inf last, not cumulative
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th quantile, or None when empty"""
+        if self.count == 0:
+            return None
+        rank = max(math.ceil(q * self.count), 1)
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return bucket_upper_bound(index)
+        return bucket_upper_bound(HISTOGRAM_BUCKETS - 1)
+
+
+class Histogram(_ShardedInstrument):
+    """Distribution of observed values (seconds by default) in HDR buckets"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, description: str, boundaries: Tuple[float, ...] = DEFAULT_EXPORT_BOUNDARIES):
+        super().__init__(name, description)
+        self.boundaries = boundaries
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        shard = self._shard()
+        cell = shard.get(key)
+        if cell is None:
+            cell = shard[key] = [[0] * HISTOGRAM_BUCKETS, 0.0, 0, [0] * (len(self.boundaries) + 1)]
+        cell[0][bucket_index(value)] += 1
+        cell[1] += value
+        cell[2] += 1
+        cell[3][bisect.bisect_left(self.boundaries, value)] += 1  # First boundary with value <= le
+
+    def snapshots(self) -> Dict[LabelKey, HistogramSnapshot]:
+        """Merge every thread's shard into one snapshot per label set"""
+        merged: Dict[LabelKey, HistogramSnapshot] = {}
+        for shard in self._snapshot_shards():
+            for key, (buckets, total, count, exported) in shard.items():
+                snapshot = merged.get(key)
+                if snapshot is None:
+                    merged[key] = HistogramSnapshot(list(buckets), total, count, list(exported))
+                else:
+                    snapshot.buckets = [a + b for a, b in zip(snapshot.buckets, buckets)]
+                    snapshot.sum += total
+                    snapshot.count += count
+                    snapshot.exported = [a + b for a, b in zip(snapshot.exported, exported)]
+        return merged
+
+    def snapshot(self, **labels) -> Optional[HistogramSnapshot]:
+        """Merged snapshot of one label set, or None before its first observation"""
+        return self.snapshots().get(_label_key(labels))
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        snapshot = self.snapshot(**labels)
+        return snapshot.quantile(q) if snapshot else None
+
+    def collect(self) -> List[Tuple[LabelKey, float]]:
+        return [(key, snapshot.count) for key, snapshot in self.snapshots().items()]
+
+    def exported_buckets(self, snapshot: HistogramSnapshot) -> List[int]:
+        """Cumulative counts for each export boundary, +Inf last"""
+        counts = list(snapshot.exported)
+        for i in range(1, len(counts)):
+            counts[i] += counts[i - 1]
+        return counts
+
+
+def _get_or_create(cls, name: str, description: str, **kwargs):
+    with _registry_lock:
+        instrument = _registry.get(name)
+        if instrument is None:
+            instrument = cls(name, description, **kwargs)
+            _registry[name] = instrument
+            if cls is Counter:
+                _meter.create_observable_counter(name, callbacks=[instrument._observe], description=description)
+            elif cls is Gauge:
+                _meter.create_observable_gauge(name, callbacks=[instrument._observe], description=description)
+        elif not isinstance(instrument, cls):
+            raise ValueError(f"Metric {name} is already registered as a {instrument.kind}")
+        return instrument
+
+
+def counter(name: str, description: str = "") -> Counter:
+    """Get or create a counter"""
+    return _get_or_create(Counter, name, description)
+
+
+def gauge(name: str, description: str = "") -> Gauge:
+    """Get or create a gauge"""
+    return _get_or_create(Gauge, name, description)
+
+
+def histogram(name: str, description: str = "", boundaries: Tuple[float, ...] = DEFAULT_EXPORT_BOUNDARIES) -> Histogram:
+    """Get or create a histogram"""
+    return _get_or_create(Histogram, name, description, boundaries=boundaries)
+
+
+def registered_metrics() -> List[Instrument]:
+    """Return every registered instrument"""
+    with _registry_lock:
+        return list(_registry.values())
+
+
+def _format_labels(key: LabelKey, extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in key]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def render_prometheus() -> str:
+    """Render every instrument in the Prometheus text exposition format"""
+    lines = []
+    for instrument in sorted(registered_metrics(), key=lambda i: i.name):
+        name = instrument.name
+        if instrument.description:
+            lines.append(f"# HELP {name} {instrument.description}")
+        lines.append(f"# TYPE {name} {instrument.kind}")
+
+        if isinstance(instrument, Histogram):
+            for key, snapshot in sorted(instrument.snapshots().items()):
+                cumulative = instrument.exported_buckets(snapshot)
+                for bound, count in zip(instrument.boundaries + ("+Inf",), cumulative):
+                    labels = _format_labels(key, 'le="%s"' % bound)
+                    lines.append(f"{name}_bucket{labels} {count}")
+                lines.append(f"{name}_sum{_format_labels(key)} {repr(snapshot.sum)}")
+                lines.append(f"{name}_count{_format_labels(key)} {snapshot.count}")
+        else:
+            for key, value in sorted(instrument.collect()):
+                lines.append(f"{name}{_format_labels(key)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,54 @@
+"""
+Private on-disk locations for caches holding secrets or chat content
+
+The caches default to fixed names under the shared temp directory, where
+os.makedirs(mode=0o700) only protects a directory it creates itself: one that
+already exists, possibly made by another user, would be used as is.
+private_directory() checks an existing directory too. One this user owns is
+tightened to 0o700; one owned by anybody else (or a symlink) is refused, and a
+fresh per-process directory is used instead. create_private_file() makes a
+file 0o600 up front for libraries such as sqlite3 that would otherwise create
+it under the default umask.
+"""
+import os
+import stat
+import tempfile
+
+from structured_logging import get_logger
+
+log = get_logger("private_files")
+
+
+def private_directory(path: str) -> str:
+    """path as a directory only this user can use, or a new temporary one when path is not ours"""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    if not hasattr(os, "getuid"):  # Windows: access is governed by ACLs, not modes
+        return path
+    info = os.lstat(path)
+    if stat.S_ISDIR(info.st_mode) and info.st_uid == os.getuid():
+        if stat.S_IMODE(info.st_mode) & 0o077:
+            os.chmod(path, 0o700)
+        return path
+    fallback = tempfile.mkdtemp(prefix=f"{os.path.basename(path)}-")
+    log.warning("private_directory_refused", path=path, owner=info.st_uid, fallback=fallback)
+    return fallback
+
+
+def write_private_file(path: str, data: bytes) -> None:
+    """Replace path atomically with a file only this user can read"""
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'wb') as file:
+        file.write(data)
+    os.replace(temp_path, path)
+
+
+def create_private_file(path: str) -> None:
+    """Create path readable only by this user, or tighten it when it already exists and is ours"""
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o600)
+    try:
+        info = os.fstat(fd)
+        if hasattr(os, "getuid") and info.st_uid == os.getuid() and stat.S_IMODE(info.st_mode) & 0o077:
+            os.fchmod(fd, 0o600)
+    finally:
+        os.close(fd)
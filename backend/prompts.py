@@ -1,25 +1,46 @@
 """
 System prompts for the Solution Architect Agent
 """
+import hashlib
 import os
+import threading
+from typing import NamedTuple, Optional, Tuple
+
+KNOWLEDGE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "core_knowledge.txt")
+
+# How the cached prompt notices changes to core_knowledge.txt:
+#   stat  - stat the file on every call and rebuild when mtime/size change (default)
+#   watch - background watcher (inotify via watchfiles, else polling); no syscalls on the hot path
+#   poll  - background polling thread; no syscalls on the hot path
+#   off   - load once at startup
+PROMPT_RELOAD_MODE = os.getenv("PROMPT_RELOAD_MODE", "stat").lower()
+PROMPT_RELOAD_POLL_SECONDS = float(os.getenv("PROMPT_RELOAD_POLL_SECONDS", "2"))
+
+
+class CachedPrompt(NamedTuple):
+    signature: Optional[Tuple[int, int]]  # (mtime_ns, size) of the knowledge file
+    content_hash: str
+    prompt: str
+
+
+_cached_prompt: Optional[CachedPrompt] = None
+_cache_lock = threading.Lock()
+_watcher_thread: Optional[threading.Thread] = None
+
 
 def load_core_knowledge():
     """Load core knowledge from the core_knowledge.txt file"""
     try:
-        current_dir = os.path.dirname(os.path.abspath(__file__))
-        knowledge_path = os.path.join(current_dir, "core_knowledge.txt")
-        
-        with open(knowledge_path, 'r', encoding='utf-8') as file:
+        with open(KNOWLEDGE_PATH, 'r', encoding='utf-8') as file:
             return file.read().strip()
     except FileNotFoundError:
         return "Core knowledge file not found."
     except Exception as e:
         return f"Error loading core knowledge: {str(e)}"
 
-def get_solution_architect_system_prompt():
-    """Get the complete system prompt including core knowledge"""
-    core_knowledge = load_core_knowledge()
-    
+
+def render_system_prompt(core_knowledge):
+    """Render the system prompt around the given core knowledge"""
     return f"""You are an expert Solution Architect Agent specializing in Azure AI, cloud architecture, and GenAI application development.
 
 CORE KNOWLEDGE REFERENCE:
@@ -33,5 +54,99 @@ INSTRUCTIONS:
 3. If the information is not in the core knowledge, provide detailed, practical guidance based on your expertise in Azure AI, cloud architecture, and GenAI application development
 4. Always be helpful, detailed, and practical in your responses"""
 
+
+def get_history_summary_prompt():
+    """Get the system prompt used to summarize older conversation turns"""
+    return """You maintain a running summary of a conversation between a user and a Solution Architect Agent.
+Combine the previous summary (if any) with the new messages into one updated summary.
+Keep every requirement, constraint, decision, Azure service choice and open question the user mentioned.
+Drop pleasantries and repeated explanations. Write at most 300 words of plain text."""
+
+
+def _knowledge_signature():
+    try:
+        stat = os.stat(KNOWLEDGE_PATH)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def _refresh_prompt(signature):
+    """Rebuild the cached prompt if the knowledge file content changed"""
+    global _cached_prompt
+    with _cache_lock:
+        cached = _cached_prompt
+        if cached is not None and cached.signature == signature:
+            return cached
+
+        core_knowledge = load_core_knowledge()
+        content_hash = hashlib.sha256(core_knowledge.encode('utf-8')).hexdigest()
+        if cached is not None and cached.content_hash == content_hash:
+            # Touched but not changed: keep the rendered prompt
+            _cached_prompt = cached._replace(signature=signature)
+        else:
+            _cached_prompt = CachedPrompt(signature, content_hash, render_system_prompt(core_knowledge))
+        return _cached_prompt
+
+
+def _get_cached_prompt():
+    cached = _cached_prompt
+    if cached is None:
+        return _refresh_prompt(_knowledge_signature())
+    if PROMPT_RELOAD_MODE == "stat":
+        signature = _knowledge_signature()
+        if signature != cached.signature:
+            return _refresh_prompt(signature)
+    return cached
+
+
+def get_solution_architect_system_prompt():
+    """Get the complete system prompt including core knowledge"""
+    return _get_cached_prompt().prompt
+
+
+def get_system_prompt_version():
+    """Get the content hash of the core knowledge behind the current system prompt"""
+    return _get_cached_prompt().content_hash
+
+
+def _poll_for_changes(stop_event):
+    while not stop_event.wait(PROMPT_RELOAD_POLL_SECONDS):
+        signature = _knowledge_signature()
+        if _cached_prompt is None or signature != _cached_prompt.signature:
+            _refresh_prompt(signature)
+
+
+def _watch_for_changes(stop_event):
+    try:
+        from watchfiles import watch
+    except ImportError:
+        _poll_for_changes(stop_event)
+        return
+
+    # Watch the directory so editors that replace the file on save are seen too
+    for changes in watch(os.path.dirname(KNOWLEDGE_PATH), stop_event=stop_event):
+        if any(os.path.abspath(path) == KNOWLEDGE_PATH for _, path in changes):
+            _refresh_prompt(_knowledge_signature())
+
+
+def start_prompt_watcher(stop_event: Optional[threading.Event] = None):
+    """Start the background hot-reload watcher for the watch/poll reload modes"""
+    global _watcher_thread
+    if PROMPT_RELOAD_MODE not in ("watch", "poll") or _watcher_thread is not None:
+        return None
+
+    target = _watch_for_changes if PROMPT_RELOAD_MODE == "watch" else _poll_for_changes
+    _watcher_thread = threading.Thread(
+        target=target,
+        args=(stop_event or threading.Event(),),
+        name="prompt-watcher",
+        daemon=True,
+    )
+    _watcher_thread.start()
+    return _watcher_thread
+
+
 # For backward compatibility, keep the old constant but make it dynamic
 SOLUTION_ARCHITECT_SYSTEM_PROMPT = get_solution_architect_system_prompt()
+start_prompt_watcher()
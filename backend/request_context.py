@@ -0,0 +1,69 @@
+"""
+Per-request IDs
+
+Every HTTP request gets an ID: the caller's X-Request-Id when it sent a usable
+one, a new one otherwise. It is returned in the X-Request-Id response header,
+set as the request.id attribute of every span started while the request is
+handled (including the OpenAI spans), and added to every log line written for
+it, so a client report, a log line and a trace can be matched up.
+
+The ID lives in a context variable, so tasks started by a request (a stream's
+pump, a hedged attempt) carry it too.
+"""
+import contextvars
+import re
+import uuid
+from typing import Optional
+
+from opentelemetry.sdk.trace import SpanProcessor
+
+REQUEST_ID_HEADER = b"x-request-id"
+REQUEST_ID_ATTRIBUTE = "request.id"
+
+_ID_PATTERN = re.compile(r"^[A-Za-z0-9._:-]{1,128}$")
+
+_request_id: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+
+def current_request_id() -> Optional[str]:
+    return _request_id.get()
+
+
+class RequestIdMiddleware:
+    """Pure ASGI middleware assigning the request ID and echoing it in the response"""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == REQUEST_ID_HEADER:
+                value = value.decode('latin-1')
+                request_id = value if _ID_PATTERN.match(value) else None
+                break
+        request_id = request_id or uuid.uuid4().hex
+        token = _request_id.set(request_id)
+
+        async def send_with_id(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (REQUEST_ID_HEADER, request_id.encode('latin-1'))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            _request_id.reset(token)
+
+
+class RequestIdSpanProcessor(SpanProcessor):
+    """Tags spans started while handling a request with its ID"""
+
+    def on_start(self, span, parent_context=None) -> None:
+        request_id = _request_id.get()
+        if request_id is not None:
+            span.set_attribute(REQUEST_ID_ATTRIBUTE, request_id)
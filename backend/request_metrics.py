@@ -0,0 +1,142 @@
+"""
+Request-path metrics for the chat API
+
+Latency histograms and token counters recorded by app.py, plus the ASGI
+middleware that times every HTTP request by route template. Everything is
+served by the /metrics endpoint in the Prometheus text format.
+
+The chat path is also split into phases (request parse, history load, prompt
+build, history assembly, upstream connect, first token, last token and SSE
+flush). Each phase becomes an OpenTelemetry span, so it shows up next to the
+OpenAI span in Azure Monitor, and is timed in chat_phase_duration_seconds.
+"""
+import time
+from contextlib import contextmanager
+from typing import Optional
+
+import anyio.to_thread
+from opentelemetry import trace
+
+import metrics
+
+request_latency = metrics.histogram("http_request_duration_seconds", "Time from request received to response finished, by route")
+ttft = metrics.histogram("chat_ttft_seconds", "Time from the chat handler starting to the first streamed chunk, by source")
+upstream_latency = metrics.histogram("upstream_latency_seconds", "Duration of chat completion calls to the model, by endpoint")
+tokens_used = metrics.counter(
+    "chat_tokens_total",
+    "Tokens by endpoint and type; streamed prompt tokens are estimated locally",
+)
+threadpool_busy = metrics.gauge("threadpool_busy_threads", "Worker threads of the default thread pool in use")
+threadpool_size = metrics.gauge("threadpool_max_threads", "Size of the default thread pool")
+phase_latency = metrics.histogram("chat_phase_duration_seconds", "Time spent in each phase of the chat request path")
+
+tracer = trace.get_tracer("architect_agent")
+
+
+class RequestMetricsMiddleware:
+    """Pure ASGI middleware recording request latency per route template
+
+    Unmatched paths are grouped under "unmatched" so arbitrary URLs cannot
+    blow up the number of label sets.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status = 500
+        # Read by handlers to time the request parse phase
+        scope.setdefault("state", {})["received_at_ns"] = time.time_ns()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            request_latency.observe(
+                time.perf_counter() - start,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=status,
+            )
+
+
+def estimate_prompt_tokens(messages) -> int:
+    """Cheap prompt size estimate (~4 characters per token) for streams, which report no usage"""
+    return sum((len(msg["content"]) + 3) // 4 + 4 for msg in messages)
+
+
+def update_threadpool_gauges() -> None:
+    """Read the occupancy of the default thread pool; call from the event loop"""
+    limiter = anyio.to_thread.current_default_thread_limiter()
+    threadpool_busy.set(limiter.borrowed_tokens)
+    threadpool_size.set(limiter.total_tokens)
+
+
+@contextmanager
+def phase(name: str, **attributes):
+    """Time a block as a span and in the phase histogram"""
+    start = time.perf_counter()
+    with tracer.start_as_current_span(f"chat.{name}", attributes=attributes):
+        try:
+            yield
+        finally:
+            phase_latency.observe(time.perf_counter() - start, phase=name)
+
+
+def record_phase(name: str, start_ns: Optional[int], end_ns: Optional[int] = None, **attributes) -> None:
+    """Record a phase that already happened from wall-clock nanosecond timestamps
+
+    Used where a block cannot be wrapped, e.g. across yields of a generator.
+    """
+    if start_ns is None:
+        return
+    end_ns = end_ns or time.time_ns()
+    span = tracer.start_span(f"chat.{name}", start_time=start_ns, attributes=attributes)
+    span.end(end_time=end_ns)
+    phase_latency.observe((end_ns - start_ns) / 1e9, phase=name)
+
+
+def record_request_parse(state) -> None:
+    """Record the time from the request arriving to the handler running (body read and validation)"""
+    record_phase("request_parse", getattr(state, "received_at_ns", None))
+
+
+class FlushTimer:
+    """Accumulates the time a stream spends handing SSE frames to the server"""
+
+    def __init__(self):
+        self.seconds = 0.0
+        self.frames = 0
+        self.first_frame_ns: Optional[int] = None
+        self._started = 0.0
+
+    def start(self) -> None:
+        if self.first_frame_ns is None:
+            self.first_frame_ns = time.time_ns()
+        self._started = time.perf_counter()
+
+    def stop(self) -> None:
+        self.seconds += time.perf_counter() - self._started
+        self.frames += 1
+
+    def record(self) -> None:
+        """Emit one span covering every frame; the histogram gets the time actually spent sending"""
+        if self.first_frame_ns is None:
+            return
+        span = tracer.start_span("chat.sse_flush", start_time=self.first_frame_ns, attributes={
+            "sse.frames": self.frames,
+            "sse.flush_ms": round(self.seconds * 1000, 3),
+        })
+        span.end()
+        phase_latency.observe(self.seconds, phase="sse_flush")
@@ -0,0 +1,154 @@
+"""
+Exact-match response cache for chat completions
+
+Opt-in with RESPONSE_CACHE_ENABLED=true. Entries are keyed by a hash of the
+system prompt version, the messages, the model and the sampling parameters,
+kept in an in-memory LRU bounded by entry count and total bytes, expire after
+a TTL, and are written through to a local SQLite file so they survive restarts.
+The file holds chat content, so it is created owner-only (SQLite gives its
+journal the same mode), by default inside a private temp directory.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, NamedTuple, Optional
+
+import metrics
+from private_files import create_private_file, private_directory
+
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000"))
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv("RESPONSE_CACHE_MAX_BYTES", str(50 * 1024 * 1024)))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "86400"))
+RESPONSE_CACHE_PATH = os.getenv("RESPONSE_CACHE_PATH")  # unset: a private temp directory, empty: memory only
+
+cache_lookups = metrics.counter("response_cache_lookups_total", "Response cache lookups by result")
+cache_entries = metrics.gauge("response_cache_entries", "Entries in the response cache")
+cache_bytes = metrics.gauge("response_cache_bytes", "Bytes of cached response content")
+
+
+def make_cache_key(system_prompt_version: str, messages: List[Dict[str, str]], model: str, params: Dict[str, Any]) -> str:
+    """Hash everything that determines a completion into a cache key"""
+    payload = json.dumps(
+        [system_prompt_version, messages, model, params],
+        sort_keys=True,
+        separators=(',', ':'),
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+class CacheEntry(NamedTuple):
+    content: str
+    created_at: float
+    size: int
+
+
+class ResponseCache:
+    """LRU/TTL cache of completion text with SQLite write-through"""
+
+    def __init__(self, max_entries: int, max_bytes: int, ttl_seconds: float, path: Optional[str]):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.path = path
+        self._entries: "OrderedDict[str, CacheEntry]" = OrderedDict()
+        self._bytes = 0
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        if path:
+            create_private_file(path)
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, content TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            self._load()
+
+    def _load(self) -> None:
+        """Load unexpired entries from disk, oldest first, so the LRU order is kept"""
+        cutoff = time.time() - self.ttl_seconds
+        self._db.execute("DELETE FROM responses WHERE created_at < ?", (cutoff,))
+        self._db.commit()
+        rows = self._db.execute("SELECT key, content, created_at FROM responses ORDER BY created_at").fetchall()
+        for key, content, created_at in rows:
+            self._insert(key, CacheEntry(content, created_at, len(content.encode('utf-8'))))
+        self._evict()
+
+    def _insert(self, key: str, entry: CacheEntry) -> None:
+        previous = self._entries.pop(key, None)
+        if previous is not None:
+            self._bytes -= previous.size
+        self._entries[key] = entry
+        self._bytes += entry.size
+
+    def _evict(self) -> List[str]:
+        evicted = []
+        while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+            key, entry = self._entries.popitem(last=False)
+            self._bytes -= entry.size
+            evicted.append(key)
+        cache_entries.set(len(self._entries))
+        cache_bytes.set(self._bytes)
+        return evicted
+
+    def _persist(self, key: str, entry: Optional[CacheEntry], evicted: List[str]) -> None:
+        if self._db is None:
+            return
+        with self._db_lock:
+            if entry is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO responses (key, content, created_at) VALUES (?, ?, ?)",
+                    (key, entry.content, entry.created_at),
+                )
+            if evicted:
+                self._db.executemany("DELETE FROM responses WHERE key = ?", [(k,) for k in evicted])
+            self._db.commit()
+
+    def get(self, key: str) -> Optional[str]:
+        """Get cached completion text, or None on a miss"""
+        entry = self._entries.get(key)
+        if entry is None:
+            cache_lookups.inc(result="miss")
+            return None
+        if time.time() - entry.created_at > self.ttl_seconds:
+            del self._entries[key]
+            self._bytes -= entry.size
+            cache_lookups.inc(result="expired")
+            return None
+        self._entries.move_to_end(key)
+        cache_lookups.inc(result="hit")
+        return entry.content
+
+    async def set(self, key: str, content: str) -> None:
+        """Cache completion text and write it through to disk"""
+        entry = CacheEntry(content, time.time(), len(content.encode('utf-8')))
+        if entry.size > self.max_bytes:
+            return
+        self._insert(key, entry)
+        evicted = self._evict()
+        stored = entry if key not in evicted else None
+        await asyncio.to_thread(self._persist, key, stored, evicted)
+
+
+def default_cache_path() -> str:
+    """responses.sqlite3 in a temp directory only this user can use"""
+    directory = private_directory(os.path.join(tempfile.gettempdir(), "architect_agent_response_cache"))
+    return os.path.join(directory, "responses.sqlite3")
+
+
+response_cache = (
+    ResponseCache(
+        RESPONSE_CACHE_MAX_ENTRIES,
+        RESPONSE_CACHE_MAX_BYTES,
+        RESPONSE_CACHE_TTL_SECONDS,
+        default_cache_path() if RESPONSE_CACHE_PATH is None else RESPONSE_CACHE_PATH,
+    )
+    if RESPONSE_CACHE_ENABLED
+    else None
+)
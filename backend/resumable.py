@@ -0,0 +1,229 @@
+"""
+Resumable chat streams
+
+A client whose connection drops mid-answer used to lose the answer, and
+retrying regenerated the whole completion. Each stream is now a
+coalescing.StreamFanout whose pump task writes the text deltas into a replay
+buffer, and the HTTP response is just one reader of that buffer. Every SSE frame carries an event ID
+"<stream id>:<characters sent so far>", so a client that reconnects with
+Last-Event-ID gets the rest of the answer from the buffer without a new
+model call.
+
+- While no client is attached the answer keeps being generated for
+  STREAM_RESUME_GRACE_SECONDS, after which the upstream call is cancelled.
+  Keep it short: the generation holds its stream slot and quota until then.
+- A finished stream stays resumable for STREAM_RESUME_TTL_SECONDS.
+- Each buffer keeps at most STREAM_RESUME_MAX_CHARS (older text is dropped
+  and can no longer be resumed from), and at most
+  STREAM_RESUME_MAX_IN_MEMORY finished streams are kept in memory. Beyond
+  that the oldest are spilled to STREAM_RESUME_SPILL_DIR when it is set, and
+  dropped otherwise.
+"""
+import asyncio
+import json
+import os
+import re
+import time
+import uuid
+from collections import OrderedDict
+from typing import AsyncIterator, Callable, Dict, Optional, Tuple
+
+import metrics
+from coalescing import StreamFanout
+
+STREAM_RESUME_ENABLED = os.getenv("STREAM_RESUME_ENABLED", "true").lower() == "true"
+STREAM_RESUME_TTL_SECONDS = float(os.getenv("STREAM_RESUME_TTL_SECONDS", "60"))
+STREAM_RESUME_GRACE_SECONDS = float(os.getenv("STREAM_RESUME_GRACE_SECONDS", "2"))
+STREAM_RESUME_MAX_CHARS = int(os.getenv("STREAM_RESUME_MAX_CHARS", "65536"))
+STREAM_RESUME_MAX_IN_MEMORY = int(os.getenv("STREAM_RESUME_MAX_IN_MEMORY", "1000"))
+STREAM_RESUME_SPILL_DIR = os.getenv("STREAM_RESUME_SPILL_DIR", "")
+
+_EVENT_ID_PATTERN = re.compile(r"^([0-9a-f]{32}):([0-9]{1,12})$")
+
+stream_resumes = metrics.counter("chat_stream_resumes_total", "Reconnects with Last-Event-ID, by outcome")
+resumable_live = metrics.gauge("chat_stream_resumable_live", "Streams whose answer is still being generated")
+resumable_retained = metrics.gauge("chat_stream_resumable_retained", "Finished streams kept for resuming, by location")
+abandoned_streams = metrics.counter("chat_stream_abandoned_total", "Streams cancelled because no client came back within the grace period")
+
+
+def event_id(stream_id: str, offset: int) -> str:
+    return f"{stream_id}:{offset}"
+
+
+def parse_event_id(value: str) -> Optional[Tuple[str, int]]:
+    """(stream id, offset) from a Last-Event-ID header, or None when it is not one of ours"""
+    match = _EVENT_ID_PATTERN.match(value.strip())
+    return (match.group(1), int(match.group(2))) if match else None
+
+
+class ResumableStream(StreamFanout):
+    """An answer's text deltas in a replay buffer that any number of readers follow
+
+    Offsets count characters from the start of the answer. The buffer keeps
+    the last max_chars of them, in whole deltas. Unlike a plain StreamFanout,
+    the answer keeps being generated for grace seconds after the last reader
+    leaves, so a client that reconnects can pick it up.
+    """
+
+    def __init__(self, stream_id: str, max_chars: int, grace: float, on_finished: Callable[["ResumableStream"], None],
+                 conversation_id: Optional[str] = None):
+        super().__init__(stream_id, on_finished, max_chars)
+        self.id = stream_id
+        self.conversation_id = conversation_id
+        self.grace = grace
+        self.expires_at = 0.0
+        self._abandon_handle: Optional[asyncio.TimerHandle] = None
+
+    @classmethod
+    def finished(cls, stream_id: str, conversation_id: Optional[str], text: str, base: int, error: Optional[str],
+                 expires_at: float) -> "ResumableStream":
+        """A stream restored from disk"""
+        stream = cls(stream_id, max(len(text), 1), 0, lambda _: None, conversation_id)
+        stream.base = stream.size = base
+        if text:
+            stream._append(text)
+        stream.done = True
+        stream.error = RuntimeError(error) if error is not None else None
+        stream.expires_at = expires_at
+        return stream
+
+    def start(self, produce: Callable[[], AsyncIterator[str]]) -> None:
+        super().start(produce)
+        if self.subscribers == 0:  # Covers a response that never starts reading
+            self._idle()
+
+    @property
+    def abandoned(self) -> bool:
+        """Cancelled because no client came back; there is no complete answer to replay"""
+        return self.done and isinstance(self.error, asyncio.CancelledError)
+
+    def hold(self) -> None:
+        super().hold()
+        if self._abandon_handle is not None:
+            self._abandon_handle.cancel()
+            self._abandon_handle = None
+
+    def _finished(self) -> None:
+        if self._abandon_handle is not None:
+            self._abandon_handle.cancel()
+        super()._finished()
+
+    def _idle(self) -> None:
+        # Keep generating for a client that reconnects, but not for long
+        self._abandon_handle = asyncio.get_running_loop().call_later(self.grace, self._abandon)
+
+    def _abandon(self) -> None:
+        self._abandon_handle = None
+        if self.subscribers == 0 and not self.done:
+            abandoned_streams.inc()
+            self._task.cancel()
+
+
+class ResumableStreams:
+    """Registry of live and recently finished streams by stream ID"""
+
+    def __init__(self, ttl: float, grace: float, max_chars: int, max_in_memory: int, spill_dir: str):
+        self.ttl = ttl
+        self.grace = grace
+        self.max_chars = max_chars
+        self.max_in_memory = max_in_memory
+        self.spill_dir = spill_dir
+        self._live: Dict[str, ResumableStream] = {}
+        # Finished streams in the order they finished; the oldest are spilled first
+        self._memory: "OrderedDict[str, ResumableStream]" = OrderedDict()
+        self._on_disk: "OrderedDict[str, float]" = OrderedDict()
+        if spill_dir:
+            os.makedirs(spill_dir, mode=0o700, exist_ok=True)  # Holds chat content
+            for name in os.listdir(spill_dir):  # Leftovers of an earlier process have expired
+                if name.endswith(".json"):
+                    os.remove(os.path.join(spill_dir, name))
+
+    def _path(self, stream_id: str) -> str:
+        return os.path.join(self.spill_dir, f"{stream_id}.json")
+
+    def _write_file(self, stream: ResumableStream) -> None:
+        path = self._path(stream.id)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as file:
+            json.dump({
+                "conversation_id": stream.conversation_id,
+                "text": stream.text(),
+                "base": stream.base,
+                "error": str(stream.error) if stream.error is not None else None,
+            }, file)
+        os.replace(tmp_path, path)
+
+    def _read_file(self, stream_id: str, expires_at: float) -> Optional[ResumableStream]:
+        try:
+            with open(self._path(stream_id), 'r', encoding='utf-8') as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return None
+        return ResumableStream.finished(stream_id, data["conversation_id"], data["text"], data["base"], data["error"], expires_at)
+
+    def _remove_file(self, stream_id: str) -> None:
+        try:
+            os.remove(self._path(stream_id))
+        except FileNotFoundError:
+            pass
+
+    def _finished(self, stream: ResumableStream) -> None:
+        if self._live.pop(stream.id, None) is None:
+            return
+        if not stream.abandoned:
+            stream.expires_at = time.monotonic() + self.ttl
+            self._memory[stream.id] = stream
+        self._update_gauges()
+
+    async def _maintain(self) -> None:
+        """Drop expired streams and spill (or drop) the oldest finished ones beyond the memory cap"""
+        now = time.monotonic()
+        while self._memory and next(iter(self._memory.values())).expires_at <= now:
+            self._memory.popitem(last=False)
+        while self._on_disk and next(iter(self._on_disk.values())) <= now:
+            stream_id, _ = self._on_disk.popitem(last=False)
+            await asyncio.to_thread(self._remove_file, stream_id)
+        while len(self._memory) > self.max_in_memory:
+            stream_id, stream = self._memory.popitem(last=False)
+            if self.spill_dir:
+                await asyncio.to_thread(self._write_file, stream)
+                self._on_disk[stream_id] = stream.expires_at
+        self._update_gauges()
+
+    def _update_gauges(self) -> None:
+        resumable_live.set(len(self._live))
+        resumable_retained.set(len(self._memory), location="memory")
+        resumable_retained.set(len(self._on_disk), location="disk")
+
+    async def start(self, produce: Callable[[], AsyncIterator[str]], conversation_id: Optional[str] = None) -> ResumableStream:
+        """Start generating an answer into a new replay buffer"""
+        await self._maintain()
+        stream = ResumableStream(uuid.uuid4().hex, self.max_chars, self.grace, self._finished, conversation_id)
+        self._live[stream.id] = stream
+        stream.start(produce)
+        self._update_gauges()
+        return stream
+
+    def replayable(self, stream_id: str) -> bool:
+        """Whether a stream is still retained from its start and has not failed (spilled streams are taken as is)"""
+        stream = self._live.get(stream_id) or self._memory.get(stream_id)
+        if stream is None:
+            return stream_id in self._on_disk
+        return stream.has_offset(0) and stream.error is None
+
+    async def get(self, stream_id: str) -> Optional[ResumableStream]:
+        """A live or retained stream, or None when it is unknown or expired"""
+        await self._maintain()
+        stream = self._live.get(stream_id) or self._memory.get(stream_id)
+        if stream is None and stream_id in self._on_disk:
+            stream = await asyncio.to_thread(self._read_file, stream_id, self._on_disk[stream_id])
+        return stream
+
+
+resumable_streams = ResumableStreams(
+    STREAM_RESUME_TTL_SECONDS,
+    STREAM_RESUME_GRACE_SECONDS,
+    STREAM_RESUME_MAX_CHARS,
+    STREAM_RESUME_MAX_IN_MEMORY,
+    STREAM_RESUME_SPILL_DIR,
+) if STREAM_RESUME_ENABLED else None
@@ -0,0 +1,185 @@
+"""
+Latency-aware routing across model deployments
+
+MODEL_DEPLOYMENTS lists deployments of the same model, optionally in other
+Azure OpenAI resources or regions:
+
+    MODEL_DEPLOYMENTS="gpt-4.1,gpt-4.1@https://my-resource-eu.openai.azure.com"
+
+Entries without an endpoint are served through the project's OpenAI client.
+Without MODEL_DEPLOYMENTS the router has the single MODEL_DEPLOYMENT_NAME.
+
+Each call goes to the backend with the lowest expected latency: its EWMA
+latency (time to first token for streams, full duration otherwise) times the
+calls it already has in flight, plus any wait for local quota. Backends that
+answered with a 429 are skipped until their Retry-After has passed, and
+failing backends are taken out by their circuit breaker (see
+circuit_breaker.py). When every breaker is open, calls go to
+FALLBACK_DEPLOYMENT if one is configured, or fail fast with CircuitOpen.
+When every backend is throttled the one that recovers first is used anyway.
+"""
+import os
+import random
+import time
+import urllib.parse
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+from openai import APIStatusError, RateLimitError
+
+import metrics
+from admission import upstream_retry_after
+from circuit_breaker import CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_OPEN_SECONDS, CircuitBreaker, CircuitOpen, breaker_rejections
+
+MODEL_DEPLOYMENTS = os.getenv("MODEL_DEPLOYMENTS", "")
+# A cheaper or faster deployment used while every breaker is open (name or name@endpoint)
+FALLBACK_DEPLOYMENT = os.getenv("FALLBACK_DEPLOYMENT", "")
+ROUTER_EWMA_ALPHA = float(os.getenv("ROUTER_EWMA_ALPHA", "0.2"))
+
+backend_calls = metrics.counter("router_backend_calls_total", "Model calls per backend, by endpoint and outcome")
+backend_latency = metrics.gauge("router_backend_ewma_latency_seconds", "EWMA latency per backend and endpoint")
+backend_in_flight = metrics.gauge("router_backend_in_flight", "Model calls in flight per backend")
+backend_available = metrics.gauge("router_backend_available", "1 while a backend receives traffic, 0 while its breaker is open or it is throttled")
+fallback_calls = metrics.counter("router_fallback_calls_total", "Model calls sent to the fallback deployment")
+
+
+class Backend:
+    """One deployment the router can send calls to"""
+
+    def __init__(self, deployment: str, endpoint: Optional[str] = None):
+        self.deployment = deployment
+        self.endpoint = endpoint
+        # Quotas are per deployment per resource, so the name carries the endpoint host
+        self.name = f"{deployment}@{urllib.parse.urlparse(endpoint).netloc}" if endpoint else deployment
+        self.ewma: Dict[str, float] = {}
+        self.in_flight = 0
+        self.throttled_until = 0.0
+        self.breaker = CircuitBreaker(self.name, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_OPEN_SECONDS)
+
+    def available(self, now: float) -> bool:
+        return now >= self.throttled_until and self.breaker.allows(now)
+
+    def expected_latency(self, endpoint: str) -> float:
+        # An unmeasured backend scores 0 so it gets tried
+        latency = self.ewma.get(endpoint, next(iter(self.ewma.values()), 0.0))
+        return latency * (self.in_flight + 1)
+
+
+class _Call:
+    def __init__(self):
+        self.first_token_at: Optional[float] = None
+
+    def first_token(self) -> None:
+        """Mark the first streamed token; its time is the latency a stream is scored by"""
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+
+def parse_backend(entry: str) -> Backend:
+    """Backend from a deployment or deployment@endpoint entry"""
+    deployment, _, endpoint = entry.strip().partition("@")
+    return Backend(deployment.strip(), endpoint.strip() or None)
+
+
+def parse_backends(spec: str, default_deployment: str) -> List[Backend]:
+    """Backends from a MODEL_DEPLOYMENTS value (comma-separated entries)"""
+    backends = [parse_backend(entry) for entry in spec.split(",") if entry.strip()]
+    return backends or [Backend(default_deployment)]
+
+
+class Router:
+    """Picks a backend per call and tracks its latency, load and health"""
+
+    def __init__(self, backends: List[Backend], alpha: float, fallback: Optional[Backend] = None):
+        self.backends = backends
+        self.alpha = alpha
+        self.fallback = fallback
+        self.quota_wait: Optional[Callable[[str, int], float]] = None
+
+    @property
+    def primary(self) -> Backend:
+        return self.backends[0]
+
+    def pick(self, endpoint: str, tokens: int = 0, exclude=()) -> Backend:
+        """The backend expected to answer this call first; raises CircuitOpen"""
+        candidates = [backend for backend in self.backends if backend not in exclude] or self.backends
+        now = time.monotonic()
+        closed = [backend for backend in candidates if backend.breaker.allows(now)]
+        if not closed:
+            backend = self._fallback(now, candidates)
+        else:
+            available = [backend for backend in closed if now >= backend.throttled_until]
+            if not available:
+                backend = min(closed, key=lambda backend: backend.throttled_until)
+            else:
+                def score(backend: Backend) -> float:
+                    wait = self.quota_wait(backend.name, tokens) if self.quota_wait else 0.0
+                    return backend.expected_latency(endpoint) + wait + random.random() * 1e-6  # Random tie-break
+
+                backend = min(available, key=score)
+        backend.breaker.on_pick(now)
+        return backend
+
+    def _fallback(self, now: float, candidates: List[Backend]) -> Backend:
+        if self.fallback is not None and self.fallback.breaker.allows(now):
+            fallback_calls.inc()
+            return self.fallback
+        breaker_rejections.inc()
+        raise CircuitOpen(min(backend.breaker.retry_in(now) for backend in candidates))
+
+    @contextmanager
+    def track(self, backend: Backend, endpoint: str) -> Iterator[_Call]:
+        """Count a call in flight and record its latency and outcome"""
+        call = _Call()
+        start = time.perf_counter()
+        started_at = time.monotonic()  # The clock breakers compare probes on
+        backend.in_flight += 1
+        backend_in_flight.set(backend.in_flight, backend=backend.name)
+        try:
+            yield call
+        except RateLimitError as e:
+            self._throttled(backend, upstream_retry_after(e))
+            backend_calls.inc(backend=backend.name, endpoint=endpoint, outcome="throttled")
+            raise
+        except APIStatusError as e:
+            if e.status_code >= 500 or e.status_code == 408:
+                self._failed(backend, started_at)
+                backend_calls.inc(backend=backend.name, endpoint=endpoint, outcome="error")
+            raise  # Other 4xx are caused by the request, not the backend
+        except Exception:
+            self._failed(backend, started_at)
+            backend_calls.inc(backend=backend.name, endpoint=endpoint, outcome="error")
+            raise
+        else:
+            self._succeeded(backend, endpoint, (call.first_token_at or time.perf_counter()) - start, started_at)
+            backend_calls.inc(backend=backend.name, endpoint=endpoint, outcome="success")
+        finally:
+            backend.in_flight -= 1
+            backend_in_flight.set(backend.in_flight, backend=backend.name)
+
+    def _succeeded(self, backend: Backend, endpoint: str, latency: float, started_at: float) -> None:
+        previous = backend.ewma.get(endpoint)
+        backend.ewma[endpoint] = latency if previous is None else previous + self.alpha * (latency - previous)
+        backend_latency.set(backend.ewma[endpoint], backend=backend.name, endpoint=endpoint)
+        backend.breaker.record_success(started_at)
+
+    def _failed(self, backend: Backend, started_at: float) -> None:
+        backend.breaker.record_failure(started_at)
+
+    def _throttled(self, backend: Backend, retry_after: float) -> None:
+        backend.throttled_until = max(backend.throttled_until, time.monotonic() + retry_after)
+
+    def update_gauges(self) -> None:
+        """Refresh the availability gauges; call before rendering metrics"""
+        now = time.monotonic()
+        for backend in self.backends + ([self.fallback] if self.fallback else []):
+            backend_available.set(1 if backend.available(now) else 0, backend=backend.name)
+
+
+def create_router(default_deployment: str) -> Router:
+    """Router over MODEL_DEPLOYMENTS, or over the default deployment alone"""
+    return Router(
+        parse_backends(MODEL_DEPLOYMENTS, default_deployment),
+        ROUTER_EWMA_ALPHA,
+        parse_backend(FALLBACK_DEPLOYMENT) if FALLBACK_DEPLOYMENT.strip() else None,
+    )
@@ -0,0 +1,221 @@
+"""
+Semantic response cache for single-turn questions
+
+Opt-in with SEMANTIC_CACHE_ENABLED=true. The final user turn is embedded and
+compared against previously answered questions; if the best cosine similarity
+reaches SEMANTIC_CACHE_THRESHOLD, the stored answer is reused.
+
+Vectors live in a NumPy memmap used as a ring buffer, so a search is one
+matrix-vector product over every slot. Answers and metadata live in a SQLite
+file next to it, and both survive restarts. The files are named after the
+embedder and the capacity, so vectors from another embedding space or a
+different ring size are never read back; a vectors file of the wrong size is
+recreated empty.
+
+The embedder is pluggable: "hashing" (default) is an offline TF-IDF style
+hashing vectorizer, "azure" calls an Azure OpenAI embeddings deployment.
+"""
+import asyncio
+import hashlib
+import math
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+import time
+from typing import Awaitable, Callable, List, Optional
+
+import numpy as np
+
+import metrics
+from private_files import private_directory
+
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.9"))
+SEMANTIC_CACHE_CAPACITY = int(os.getenv("SEMANTIC_CACHE_CAPACITY", "10000"))
+SEMANTIC_CACHE_TTL_SECONDS = float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "86400"))
+SEMANTIC_CACHE_DIR = os.getenv(
+    "SEMANTIC_CACHE_DIR",
+    os.path.join(tempfile.gettempdir(), "architect_agent_semantic_cache"),
+)
+SEMANTIC_CACHE_EMBEDDER = os.getenv("SEMANTIC_CACHE_EMBEDDER", "hashing").lower()
+HASHING_EMBEDDING_DIM = int(os.getenv("HASHING_EMBEDDING_DIM", "1024"))
+
+semantic_lookups = metrics.counter("semantic_cache_lookups_total", "Semantic cache lookups by result")
+semantic_entries = metrics.gauge("semantic_cache_entries", "Answers in the semantic cache")
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+_STOP_WORDS = frozenset(
+    "a an and are as at be but by can do does for from how i in is it me my of on or so that the this to "
+    "we what when where which who why will with you your".split()
+)
+
+
+class HashingEmbedder:
+    """Offline embedder: hashed unigrams and bigrams with sublinear TF and IDF-like weighting"""
+
+    def __init__(self, dim: int):
+        self.dim = dim
+        self.name = f"hashing-{dim}"
+
+    def _features(self, text: str) -> List[str]:
+        words = [
+            w[:-1] if len(w) > 3 and w.endswith('s') and not w.endswith('ss') else w  # Crude plural folding
+            for w in _TOKEN_PATTERN.findall(text.lower())
+            if w not in _STOP_WORDS
+        ]
+        return words + [f"{a} {b}" for a, b in zip(words, words[1:])]
+
+    def embed_sync(self, text: str) -> np.ndarray:
+        vector = np.zeros(self.dim, dtype=np.float32)
+        counts = {}
+        for feature in self._features(text):
+            counts[feature] = counts.get(feature, 0) + 1
+        for feature, count in counts.items():
+            digest = hashlib.blake2b(feature.encode('utf-8'), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], 'little') % self.dim
+            sign = 1.0 if digest[4] & 1 else -1.0
+            # Longer features are rarer, so weight them up like a crude IDF
+            weight = (1.0 + math.log(count)) * (1.0 + 0.1 * len(feature))
+            vector[bucket] += sign * weight
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    async def embed(self, text: str) -> np.ndarray:
+        return self.embed_sync(text)
+
+
+class AzureOpenAIEmbedder:
+    """Embedder backed by an Azure OpenAI embeddings deployment"""
+
+    def __init__(self, get_client: Callable[[], Awaitable], deployment: str, dim: int):
+        self.get_client = get_client
+        self.deployment = deployment
+        self.dim = dim
+        self.name = f"azure-{re.sub(r'[^A-Za-z0-9.-]', '_', deployment)}-{dim}"
+
+    async def embed(self, text: str) -> np.ndarray:
+        client = await self.get_client()
+        response = await client.embeddings.create(model=self.deployment, input=text, dimensions=self.dim)
+        vector = np.asarray(response.data[0].embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+
+def _context_id(context: str) -> int:
+    """Fold a context key into an int64 so slots can be filtered with one comparison"""
+    return int.from_bytes(hashlib.blake2b(context.encode('utf-8'), digest_size=8).digest(), 'little', signed=True)
+
+
+class SemanticCache:
+    """Ring buffer of question embeddings with cosine-similarity lookup"""
+
+    def __init__(self, embedder, directory: str, capacity: int, threshold: float, ttl_seconds: float):
+        self.embedder = embedder
+        self.capacity = capacity
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        directory = private_directory(directory)  # Holds chat content
+
+        stem = f"{embedder.name}_{capacity}"
+        vectors_path = os.path.join(directory, f"vectors_{stem}.f32")
+        expected_size = capacity * embedder.dim * np.dtype(np.float32).itemsize
+        reuse = os.path.exists(vectors_path) and os.path.getsize(vectors_path) == expected_size
+        self.vectors = np.memmap(vectors_path, dtype=np.float32, mode='r+' if reuse else 'w+', shape=(capacity, embedder.dim))
+        self.context_ids = np.zeros(capacity, dtype=np.int64)
+        self.created_at = np.zeros(capacity, dtype=np.float64)  # 0 marks an empty slot
+        self.answers: List[Optional[str]] = [None] * capacity
+        self.next_slot = 0
+        self.filled = 0  # Slots are filled in order, so only vectors[:filled] are searched
+
+        self._db_lock = threading.Lock()
+        self._db = sqlite3.connect(os.path.join(directory, f"entries_{stem}.sqlite3"), check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            "slot INTEGER PRIMARY KEY, context_id INTEGER NOT NULL, question TEXT NOT NULL, "
+            "answer TEXT NOT NULL, created_at REAL NOT NULL)"
+        )
+        if not reuse:  # The answers would not match the (new, zeroed) vectors
+            self._db.execute("DELETE FROM entries")
+            self._db.commit()
+        self._load()
+
+    def _load(self) -> None:
+        newest = 0.0
+        rows = self._db.execute("SELECT slot, context_id, answer, created_at FROM entries").fetchall()
+        for slot, context_id, answer, created_at in rows:
+            if slot >= self.capacity:
+                continue
+            self.context_ids[slot] = context_id
+            self.created_at[slot] = created_at
+            self.answers[slot] = answer
+            self.filled = max(self.filled, slot + 1)
+            if created_at > newest:
+                newest = created_at
+                self.next_slot = (slot + 1) % self.capacity
+        semantic_entries.set(int(np.count_nonzero(self.created_at)))
+
+    async def lookup(self, question: str, context: str) -> Optional[str]:
+        """Return the cached answer to the most similar question, if similar enough"""
+        query = await self.embedder.embed(question)
+        filled = self.filled
+        valid = (self.context_ids[:filled] == _context_id(context)) & (self.created_at[:filled] > time.time() - self.ttl_seconds)
+        if not valid.any():
+            semantic_lookups.inc(result="miss")
+            return None
+
+        scores = self.vectors[:filled] @ query
+        scores[~valid] = -1.0
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            semantic_lookups.inc(result="miss")
+            return None
+        semantic_lookups.inc(result="hit")
+        return self.answers[best]
+
+    async def add(self, question: str, context: str, answer: str) -> None:
+        """Store an answer, overwriting the oldest slot once the buffer is full"""
+        vector = await self.embedder.embed(question)
+        slot = self.next_slot
+        self.next_slot = (slot + 1) % self.capacity
+
+        context_id = _context_id(context)
+        created_at = time.time()
+        self.vectors[slot] = vector
+        self.context_ids[slot] = context_id
+        self.created_at[slot] = created_at
+        self.answers[slot] = answer
+        self.filled = max(self.filled, slot + 1)
+        semantic_entries.set(int(np.count_nonzero(self.created_at)))
+        await asyncio.to_thread(self._persist, slot, context_id, question, answer, created_at)
+
+    def _persist(self, slot: int, context_id: int, question: str, answer: str, created_at: float) -> None:
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO entries (slot, context_id, question, answer, created_at) VALUES (?, ?, ?, ?, ?)",
+                (slot, context_id, question, answer, created_at),
+            )
+            self._db.commit()
+            self.vectors.flush()
+
+
+def create_semantic_cache(get_openai_client: Callable[[], Awaitable]) -> Optional[SemanticCache]:
+    """Build the configured semantic cache, or None when it is disabled"""
+    if not SEMANTIC_CACHE_ENABLED:
+        return None
+    if SEMANTIC_CACHE_EMBEDDER == "azure":
+        embedder = AzureOpenAIEmbedder(
+            get_openai_client,
+            os.getenv("EMBEDDING_DEPLOYMENT_NAME", "text-embedding-3-small"),
+            int(os.getenv("EMBEDDING_DIMENSIONS", "512")),
+        )
+    else:
+        embedder = HashingEmbedder(HASHING_EMBEDDING_DIM)
+    return SemanticCache(
+        embedder,
+        SEMANTIC_CACHE_DIR,
+        SEMANTIC_CACHE_CAPACITY,
+        SEMANTIC_CACHE_THRESHOLD,
+        SEMANTIC_CACHE_TTL_SECONDS,
+    )
@@ -0,0 +1,115 @@
+"""
+Background startup for the backend
+
+Connecting to Azure (credential probing, fetching the Application Insights
+connection string, configuring Azure Monitor, creating the OpenAI client) used
+to happen serially at import time. Now the lifespan hook starts each step as a
+concurrent task and the server starts listening right away: /health answers
+immediately, /ready reports 503 until the LLM client is up, and requests that
+arrive earlier simply wait for the client.
+
+The connection string is cached in a local file for
+APPINSIGHTS_CONNECTION_STRING_TTL_SECONDS so restarts skip that network call.
+"""
+import asyncio
+import json
+import os
+import tempfile
+import time
+from typing import Awaitable, Callable, Dict, Optional
+
+import metrics
+from structured_logging import get_logger
+
+APPINSIGHTS_CONNECTION_STRING_TTL_SECONDS = float(os.getenv("APPINSIGHTS_CONNECTION_STRING_TTL_SECONDS", "86400"))
+APPINSIGHTS_CONNECTION_STRING_CACHE = os.getenv(
+    "APPINSIGHTS_CONNECTION_STRING_CACHE",
+    os.path.join(tempfile.gettempdir(), "architect_agent_appinsights.json"),
+)
+
+startup_duration = metrics.gauge("startup_task_seconds", "How long each startup task took")
+
+log = get_logger("startup")
+
+
+class StartupTasks:
+    """Named startup tasks run concurrently once the server is listening"""
+
+    def __init__(self):
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._errors: Dict[str, str] = {}
+
+    def start(self, name: str, step: Awaitable) -> None:
+        self._tasks[name] = asyncio.create_task(self._run(name, step))
+
+    async def _run(self, name: str, step: Awaitable) -> None:
+        start = time.perf_counter()
+        try:
+            await step
+            log.info("startup_task_finished", task=name, seconds=round(time.perf_counter() - start, 2))
+        except Exception as e:
+            self._errors[name] = str(e)
+            log.error("startup_task_failed", task=name, error=str(e))
+        finally:
+            startup_duration.set(time.perf_counter() - start, task=name)
+
+    def status(self) -> Dict[str, str]:
+        """State of every task: pending, ready or failed"""
+        states = {}
+        for name, task in self._tasks.items():
+            if not task.done():
+                states[name] = "pending"
+            else:
+                states[name] = "failed" if name in self._errors else "ready"
+        return states
+
+    def is_ready(self, name: str) -> bool:
+        return self.status().get(name) == "ready"
+
+    async def cancel(self) -> None:
+        for task in self._tasks.values():
+            task.cancel()
+        await asyncio.gather(*self._tasks.values(), return_exceptions=True)
+
+
+def _read_cached_connection_string(endpoint: str) -> Optional[str]:
+    try:
+        with open(APPINSIGHTS_CONNECTION_STRING_CACHE, 'r', encoding='utf-8') as file:
+            cached = json.load(file)
+    except (OSError, ValueError):
+        return None
+    if cached.get("endpoint") != endpoint:
+        return None
+    if time.time() - cached.get("fetched_at", 0) > APPINSIGHTS_CONNECTION_STRING_TTL_SECONDS:
+        return None
+    return cached.get("connection_string")
+
+
+def _write_cached_connection_string(endpoint: str, connection_string: str) -> None:
+    temp_path = f"{APPINSIGHTS_CONNECTION_STRING_CACHE}.{os.getpid()}.tmp"
+    # Owner-only: the connection string identifies the Application Insights resource
+    fd = os.open(temp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, 'w', encoding='utf-8') as file:
+        json.dump({"endpoint": endpoint, "connection_string": connection_string, "fetched_at": time.time()}, file)
+    os.replace(temp_path, APPINSIGHTS_CONNECTION_STRING_CACHE)
+
+
+async def get_connection_string(endpoint: str, fetch: Callable[[], Awaitable[str]]) -> str:
+    """Application Insights connection string from the environment, the local cache or the project"""
+    connection_string = os.getenv("APPLICATIONINSIGHTS_CONNECTION_STRING")
+    if connection_string:
+        return connection_string
+
+    connection_string = await asyncio.to_thread(_read_cached_connection_string, endpoint)
+    if connection_string:
+        return connection_string
+
+    connection_string = await fetch()
+    try:
+        await asyncio.to_thread(_write_cached_connection_string, endpoint, connection_string)
+    except OSError as e:
+        log.warning("connection_string_cache_failed", error=str(e))
+    return connection_string
+
+
+startup_tasks = StartupTasks()
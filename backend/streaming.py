@@ -0,0 +1,311 @@
+"""
+Async streaming engine for /api/chat/stream
+
+Streams run as native async generators on the event loop, so they never take a
+slot in Starlette's thread pool. A StreamLimiter caps how many streams run at
+once; callers beyond the cap wait in a bounded queue and are rejected with a
+503 once the queue is full or they have waited too long.
+
+If the client disconnects mid-answer the body generator is closed right away,
+which closes the upstream HTTP stream so no more tokens are generated for it.
+
+Text deltas are batched into SSE frames by coalesce_deltas(): the first delta
+is sent at once, later ones at most once per SSE_COALESCE_MS or as soon as
+SSE_COALESCE_BYTES have piled up. Frames are built from precomputed framing
+around a JSON-encoded string (orjson when installed), so a frame costs one
+string encode and one socket write instead of one of each per token.
+"""
+import asyncio
+import json
+import os
+import time
+from typing import AsyncIterator, Callable, Optional
+
+import anyio
+from starlette.responses import StreamingResponse
+
+import metrics
+
+MAX_CONCURRENT_STREAMS = int(os.getenv("MAX_CONCURRENT_STREAMS", "200"))
+MAX_QUEUED_STREAMS = int(os.getenv("MAX_QUEUED_STREAMS", "100"))
+STREAM_QUEUE_TIMEOUT_SECONDS = float(os.getenv("STREAM_QUEUE_TIMEOUT_SECONDS", "5"))
+STREAM_RETRY_AFTER_SECONDS = int(os.getenv("STREAM_RETRY_AFTER_SECONDS", "2"))
+SSE_COALESCE_MS = float(os.getenv("SSE_COALESCE_MS", "20"))
+SSE_COALESCE_BYTES = int(os.getenv("SSE_COALESCE_BYTES", "256"))
+
+try:
+    import orjson
+
+    def _json_string(text: str) -> bytes:
+        return orjson.dumps(text)
+except ImportError:  # Optional; the stdlib's C string encoder is the fallback
+    from json.encoder import encode_basestring_ascii
+
+    def _json_string(text: str) -> bytes:
+        return encode_basestring_ascii(text).encode('ascii')
+
+active_streams = metrics.gauge("chat_stream_active", "Streams currently being generated")
+queued_streams = metrics.gauge("chat_stream_queue_depth", "Streams waiting for a free slot")
+rejected_streams = metrics.counter("chat_stream_rejected_total", "Streams rejected with 503 because the limiter was saturated")
+cancelled_streams = metrics.counter("chat_stream_cancelled_total", "Streams aborted because the client disconnected")
+cancelled_tokens_saved = metrics.counter(
+    "chat_stream_cancelled_tokens_saved_total",
+    "Upper bound of completion tokens not generated thanks to cancelled streams",
+)
+stream_duration = metrics.histogram("chat_stream_duration_seconds", "Time a stream response was open, by outcome")
+
+
+class StreamLimiterSaturated(Exception):
+    """Raised when no stream slot could be acquired"""
+
+    def __init__(self, retry_after: int):
+        super().__init__("Too many concurrent streams")
+        self.retry_after = retry_after
+
+
+class StreamLimiter:
+    """Concurrency limiter with a bounded wait queue"""
+
+    def __init__(self, max_concurrent: int, max_queued: int, queue_timeout: float, retry_after: int):
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self._semaphore = asyncio.Semaphore(max_concurrent)
+        self._queued = 0
+
+    @property
+    def queued(self) -> int:
+        return self._queued
+
+    async def acquire(self) -> None:
+        """Take a slot, waiting in the queue if needed; raises StreamLimiterSaturated"""
+        if self._semaphore.locked():
+            if self._queued >= self.max_queued:
+                rejected_streams.inc(reason="queue_full")
+                raise StreamLimiterSaturated(self.retry_after)
+            self._queued += 1
+            queued_streams.set(self._queued)
+            try:
+                await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+            except asyncio.TimeoutError:
+                rejected_streams.inc(reason="queue_timeout")
+                raise StreamLimiterSaturated(self.retry_after)
+            finally:
+                self._queued -= 1
+                queued_streams.set(self._queued)
+        else:
+            await self._semaphore.acquire()
+        active_streams.inc()
+
+    def release(self) -> None:
+        active_streams.dec()
+        self._semaphore.release()
+
+
+stream_limiter = StreamLimiter(
+    MAX_CONCURRENT_STREAMS,
+    MAX_QUEUED_STREAMS,
+    STREAM_QUEUE_TIMEOUT_SECONDS,
+    STREAM_RETRY_AFTER_SECONDS,
+)
+
+
+class LimitedStreamingResponse(StreamingResponse):
+    """StreamingResponse that gives its limiter slot back when the response ends
+
+    The slot is released in __call__ rather than inside the body generator, so
+    it is returned even if the client disconnects before the first chunk.
+    Pass limiter=None when the slot is held by something that outlives the
+    response, such as a resumable stream's generation. on_close, when given,
+    is called once the response has ended, however it ended. The
+    response always watches for http.disconnect (whatever the ASGI spec
+    version) and closes the body generator as soon as the client goes away.
+    """
+
+    def __init__(self, content: AsyncIterator[str], limiter: Optional[StreamLimiter],
+                 on_close: Optional[Callable[[], None]] = None, **kwargs):
+        super().__init__(content, **kwargs)
+        self.limiter = limiter
+        self.on_close = on_close
+        self.disconnected = False
+
+    async def __call__(self, scope, receive, send) -> None:
+        start = time.perf_counter()
+        try:
+            async with anyio.create_task_group() as task_group:
+
+                completed = False
+
+                async def watch_disconnect():
+                    await self.listen_for_disconnect(receive)
+                    # Servers also report http.disconnect once the response is complete
+                    if not completed:
+                        self.disconnected = True
+                    task_group.cancel_scope.cancel()
+
+                task_group.start_soon(watch_disconnect)
+                try:
+                    await self.stream_response(send)
+                    completed = True
+                except OSError:
+                    self.disconnected = True
+                task_group.cancel_scope.cancel()
+
+            if self.background is not None and not self.disconnected:
+                await self.background()
+        finally:
+            with anyio.CancelScope(shield=True):
+                await self.body_iterator.aclose()
+            if self.on_close is not None:
+                self.on_close()
+            if self.limiter is not None:
+                self.limiter.release()
+            stream_duration.observe(
+                time.perf_counter() - start,
+                outcome="disconnected" if self.disconnected else "completed",
+            )
+
+
+_CHUNK_PREFIX = b'data: {"chunk": '
+_CHUNK_SUFFIX = b'}\n\n'
+SSE_DONE_FRAME = b"data: [DONE]\n\n"
+
+
+def sse_chunk_frame(text: str, event_id: Optional[str] = None) -> bytes:
+    """data: {"chunk": ...} frame for a piece of the answer, with an id: line when event_id is set"""
+    if event_id is None:
+        return b"".join((_CHUNK_PREFIX, _json_string(text), _CHUNK_SUFFIX))
+    return b"".join((b"id: ", event_id.encode('ascii'), b"\n", _CHUNK_PREFIX, _json_string(text), _CHUNK_SUFFIX))
+
+
+def sse_error_frame(message: str) -> bytes:
+    return f"data: {json.dumps({'error': message})}\n\n".encode('utf-8')
+
+
+_END = object()
+
+
+async def _next_delta(iterator: AsyncIterator[str]):
+    try:
+        return await iterator.__anext__()
+    except StopAsyncIteration:
+        return _END
+
+
+async def coalesce_deltas(deltas: AsyncIterator[str], window_ms: float = SSE_COALESCE_MS,
+                          max_bytes: int = SSE_COALESCE_BYTES) -> AsyncIterator[str]:
+    """Batch text deltas into fewer frames
+
+    A delta goes out at once when the previous batch went out at least
+    window_ms ago, so the first delta and slow streams are never delayed.
+    Otherwise it is held until max_bytes (counted in characters) are buffered
+    or the window ends. While deltas are held, the next one is read in a task
+    waited on for the rest of the window only, so a stalled upstream cannot
+    hold text back longer than window_ms. Use with contextlib.aclosing so
+    deltas is closed on exit.
+    """
+    if window_ms <= 0:
+        async for text in deltas:
+            yield text
+        return
+
+    window = window_ms / 1000
+    iterator = deltas.__aiter__()
+    parts = []
+    size = 0
+    last_flush = float("-inf")
+    pending: Optional[asyncio.Future] = None  # Read of the next delta that outlived a window
+    try:
+        while True:
+            if parts:
+                if pending is None:
+                    pending = asyncio.ensure_future(_next_delta(iterator))
+                remaining = max(last_flush + window - time.monotonic(), 0)
+                try:
+                    # shield: running out of window must not cancel the read itself
+                    text = await asyncio.wait_for(asyncio.shield(pending), remaining)
+                except asyncio.TimeoutError:
+                    batch = "".join(parts)
+                    parts.clear()
+                    size = 0
+                    last_flush = time.monotonic()
+                    yield batch
+                    continue
+                pending = None
+            elif pending is not None:
+                text = await pending
+                pending = None
+            else:
+                text = await _next_delta(iterator)
+            if text is _END:
+                break
+
+            parts.append(text)
+            size += len(text)
+            now = time.monotonic()
+            if size >= max_bytes or now - last_flush >= window:
+                batch = "".join(parts)
+                parts.clear()
+                size = 0
+                last_flush = now
+                yield batch
+    finally:
+        if pending is not None and not pending.done():
+            pending.cancel()  # Before the caller closes deltas, which cannot close mid-read
+            try:
+                await pending
+            except asyncio.CancelledError:
+                pass
+    if parts:
+        yield "".join(parts)
+
+
+class TextDeltaStream:
+    """Async iterator over the text deltas of a chat completion stream
+
+    Closes the upstream stream on exit and remembers the finish reason. When
+    the consumer goes away before the stream finished, the unused part of
+    max_tokens is recorded as saved. Use with contextlib.aclosing so the
+    upstream stream is closed deterministically.
+    """
+
+    def __init__(self, stream, max_tokens: int):
+        self.stream = stream
+        self.max_tokens = max_tokens
+        self.tokens_streamed = 0
+        self.finish_reason = None
+        self._iterator = self._iterate()
+
+    def __aiter__(self) -> AsyncIterator[str]:
+        return self._iterator
+
+    async def aclose(self) -> None:
+        await self._iterator.aclose()
+
+    async def _iterate(self) -> AsyncIterator[str]:
+        try:
+            async for chunk in self.stream:
+                try:
+                    if not chunk.choices:
+                        continue
+                    choice = chunk.choices[0]
+                    text = choice.delta.content if choice.delta else None
+                    finish_reason = getattr(choice, 'finish_reason', None)
+                except (AttributeError, IndexError):
+                    continue  # Skip malformed chunks
+
+                if text is not None:
+                    self.tokens_streamed += 1  # Azure OpenAI sends one token per delta
+                    yield text
+                if finish_reason is not None:
+                    self.finish_reason = finish_reason
+                    if finish_reason == 'stop':
+                        break
+        except (asyncio.CancelledError, GeneratorExit):
+            cancelled_streams.inc()
+            cancelled_tokens_saved.inc(max(self.max_tokens - self.tokens_streamed, 0))
+            raise
+        finally:
+            with anyio.CancelScope(shield=True):
+                await self.stream.close()
@@ -0,0 +1,196 @@
+"""
+Structured, non-blocking logging for the API
+
+The backend used to print() emoji lines, one of them per streamed token: that
+is synchronous stdout I/O on the event loop and floods the logs under load.
+Log calls now only build a record and put it on a bounded queue; a
+QueueListener thread formats and writes it. When the queue is full, records
+are dropped and counted instead of blocking the caller.
+
+Records are events with fields, written as one JSON object per line (or
+key=value text with LOG_FORMAT=text):
+
+    log = get_logger("app")
+    log.info("chat_stream_finished", conversation_id=cid, frames=12, hot=True)
+
+Records written while a request is handled carry its request_id (see
+request_context.py). Events marked hot=True sit on the request path and are
+sampled per level with LOG_SAMPLE_RATES (e.g. "DEBUG=0.01,INFO=0.1"); a kept
+hot record carries its sample_rate so counts can be scaled back up. Other
+events are never sampled. Streams log one summary line per request instead of
+one line per token.
+"""
+import atexit
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+import time
+from typing import Dict, Optional
+
+import metrics
+from request_context import current_request_id
+
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json").lower()
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "DEBUG=0.01")
+
+ROOT_LOGGER = "architect_agent"
+
+# Attributes every LogRecord has; anything else on a record is an event field
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {"message", "asctime", "fields"}
+
+records_dropped = metrics.counter("log_records_dropped_total", "Log records dropped because the log queue was full")
+records_sampled_out = metrics.counter("log_records_sampled_out_total", "Hot-path log records skipped by sampling, by level")
+
+
+def parse_sample_rates(spec: str) -> Dict[int, float]:
+    """Sample rates per level number from a "LEVEL=rate,..." value; levels not listed keep everything"""
+    rates = {}
+    for entry in spec.split(","):
+        level, _, rate = entry.partition("=")
+        if level.strip() and rate.strip():
+            rates[logging.getLevelName(level.strip().upper())] = min(max(float(rate), 0.0), 1.0)
+    return rates
+
+
+class EventLogger(logging.LoggerAdapter):
+    """Logger taking an event name and keyword fields: log.info("event", key=value, hot=True)"""
+
+    def __init__(self, logger: logging.Logger, sample_rates: Dict[int, float]):
+        super().__init__(logger, {})
+        self.sample_rates = sample_rates
+
+    def log(self, level, msg, *args, hot: bool = False, exc_info=None, stack_info=False, stacklevel=1, **fields):
+        if not self.logger.isEnabledFor(level):
+            return
+        fields.setdefault("request_id", current_request_id())
+        if hot:
+            rate = self.sample_rates.get(level, 1.0)
+            if rate < 1.0:
+                if random.random() >= rate:
+                    records_sampled_out.inc(level=logging.getLevelName(level))
+                    return
+                fields["sample_rate"] = rate
+        self.logger._log(level, msg, args, exc_info=exc_info, stack_info=stack_info,
+                         stacklevel=stacklevel + 1, extra={"fields": fields})
+
+    def debug(self, msg, *args, **kwargs):
+        self.log(logging.DEBUG, msg, *args, **kwargs)
+
+    def info(self, msg, *args, **kwargs):
+        self.log(logging.INFO, msg, *args, **kwargs)
+
+    def warning(self, msg, *args, **kwargs):
+        self.log(logging.WARNING, msg, *args, **kwargs)
+
+    def error(self, msg, *args, **kwargs):
+        self.log(logging.ERROR, msg, *args, **kwargs)
+
+    def exception(self, msg, *args, exc_info=True, **kwargs):
+        self.log(logging.ERROR, msg, *args, exc_info=exc_info, **kwargs)
+
+
+def _event_fields(record: logging.LogRecord) -> dict:
+    fields = dict(getattr(record, "fields", None) or {})
+    # Fields passed the stdlib way, with extra={...}
+    fields.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRIBUTES)
+    return {key: value for key, value in fields.items() if value is not None}
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record: ts, level, logger, event, then the event's fields"""
+
+    converter = time.gmtime
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = {
+            "ts": self.formatTime(record),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+        }
+        line.update(_event_fields(record))
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            line["exception"] = record.exc_text
+        return json.dumps(line, default=str, ensure_ascii=False)
+
+    def formatTime(self, record, datefmt=None):
+        return super().formatTime(record, "%Y-%m-%dT%H:%M:%S") + f".{int(record.msecs):03d}Z"
+
+
+class TextFormatter(JsonFormatter):
+    """ts LEVEL logger event key=value ... for reading logs in a terminal"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        fields = " ".join(f"{key}={value!r}" for key, value in _event_fields(record).items())
+        line = f"{self.formatTime(record)} {record.levelname:<7} {record.name} {record.getMessage()} {fields}".rstrip()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        return f"{line}\n{record.exc_text}" if record.exc_text else line
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that drops and counts records when the queue is full instead of blocking"""
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            records_dropped.inc()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Unlike the stdlib, leave formatting to the listener thread; only what
+        # cannot cross threads (arguments, tracebacks) is resolved here
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_listener: Optional[logging.handlers.QueueListener] = None
+_sample_rates: Dict[int, float] = parse_sample_rates(LOG_SAMPLE_RATES)
+
+
+def configure_logging(level: str = LOG_LEVEL, fmt: str = LOG_FORMAT, queue_size: int = LOG_QUEUE_SIZE) -> None:
+    """Send the backend's log records through the queue to stdout; safe to call more than once"""
+    global _listener
+    if _listener is not None:
+        return
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(TextFormatter() if fmt == "text" else JsonFormatter())
+    log_queue = queue.Queue(maxsize=queue_size)
+    _listener = logging.handlers.QueueListener(log_queue, output, respect_handler_level=False)
+    _listener.start()
+    atexit.register(shutdown_logging)
+
+    logger = logging.getLogger(ROOT_LOGGER)
+    logger.setLevel(level)
+    for handler in [handler for handler in logger.handlers if isinstance(handler, DroppingQueueHandler)]:
+        logger.removeHandler(handler)  # Left over from an earlier configure/shutdown
+    logger.addHandler(DroppingQueueHandler(log_queue))
+    # Kept out of the root logger, which Azure Monitor exports from
+    logger.propagate = False
+
+
+def shutdown_logging() -> None:
+    """Write out queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def get_logger(name: str) -> EventLogger:
+    """Event logger for a backend module"""
+    return EventLogger(logging.getLogger(f"{ROOT_LOGGER}.{name}"), _sample_rates)
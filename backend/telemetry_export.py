@@ -0,0 +1,144 @@
+"""
+Bounded span export pipeline
+
+Finished spans go into a fixed-size queue that a background thread drains in
+batches to the exporter. Ending a span never blocks on the network, and when
+the exporter falls behind (for example during an Azure Monitor incident) the
+oldest queued spans are dropped and counted, so telemetry can never grow the
+memory of the API process or slow down the chat path.
+
+setup_tracing() replaces the tracing pipeline of configure_azure_monitor
+(which is called with disable_tracing=True) and keeps its default sampling of
+TELEMETRY_TRACES_PER_SECOND.
+"""
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, List, Optional
+
+from azure.monitor.opentelemetry.exporter import AzureMonitorTraceExporter, RateLimitedSampler
+from opentelemetry import trace
+from opentelemetry.context import _SUPPRESS_INSTRUMENTATION_KEY, attach, detach, set_value
+from opentelemetry.sdk.trace import SpanProcessor, TracerProvider
+from opentelemetry.sdk.trace.export import SpanExporter, SpanExportResult
+
+import metrics
+from structured_logging import get_logger
+
+TELEMETRY_QUEUE_SIZE = int(os.getenv("TELEMETRY_QUEUE_SIZE", "2048"))
+TELEMETRY_BATCH_SIZE = int(os.getenv("TELEMETRY_BATCH_SIZE", "256"))
+TELEMETRY_FLUSH_INTERVAL_SECONDS = float(os.getenv("TELEMETRY_FLUSH_INTERVAL_SECONDS", "5"))
+TELEMETRY_TRACES_PER_SECOND = float(os.getenv("TELEMETRY_TRACES_PER_SECOND", "5"))
+
+spans_dropped = metrics.counter("telemetry_spans_dropped_total", "Spans dropped because the export queue was full")
+spans_exported = metrics.counter("telemetry_spans_exported_total", "Spans handed to the exporter, by result")
+export_queue_depth = metrics.gauge("telemetry_export_queue_depth", "Spans waiting to be exported")
+export_duration = metrics.histogram("telemetry_export_batch_seconds", "Time the exporter took per batch")
+
+log = get_logger("telemetry_export")
+
+
+class BoundedSpanProcessor(SpanProcessor):
+    """Batching span processor with a bounded, drop-oldest queue"""
+
+    def __init__(self, exporter: SpanExporter, queue_size: int, batch_size: int, flush_interval: float):
+        self.exporter = exporter
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = deque(maxlen=queue_size)  # Appending to a full deque drops the oldest item
+        self._wake = threading.Event()
+        self._export_lock = threading.Lock()
+        self._shutdown = False
+        self._worker = threading.Thread(target=self._run, name="telemetry-export", daemon=True)
+        self._worker.start()
+
+    def on_end(self, span) -> None:
+        if self._shutdown or not span.context.trace_flags.sampled:
+            return
+        if len(self._queue) == self._queue.maxlen:
+            spans_dropped.inc()
+        self._queue.append(span)
+        if len(self._queue) >= self.batch_size:
+            self._wake.set()
+
+    def _run(self) -> None:
+        while not self._shutdown:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self._drain()
+
+    def _next_batch(self) -> List:
+        batch = []
+        while self._queue and len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.popleft())
+            except IndexError:
+                break
+        return batch
+
+    def _drain(self, deadline: Optional[float] = None) -> bool:
+        """Export everything queued so far; returns False if the deadline passed first"""
+        with self._export_lock:
+            while self._queue:
+                if deadline is not None and time.monotonic() > deadline:
+                    return False
+                batch = self._next_batch()
+                if batch:
+                    self._export(batch)
+            export_queue_depth.set(len(self._queue))
+            return True
+
+    def _export(self, batch: List) -> None:
+        # Keep the exporter's own HTTP calls out of the traces
+        token = attach(set_value(_SUPPRESS_INSTRUMENTATION_KEY, True))
+        start = time.perf_counter()
+        try:
+            result = self.exporter.export(batch)
+        except Exception as e:
+            log.error("span_export_failed", spans=len(batch), error=str(e))
+            result = SpanExportResult.FAILURE
+        finally:
+            detach(token)
+        export_duration.observe(time.perf_counter() - start)
+        spans_exported.inc(len(batch), result="success" if result == SpanExportResult.SUCCESS else "failure")
+
+    def force_flush(self, timeout_millis: int = 30000) -> bool:
+        return self._drain(deadline=time.monotonic() + timeout_millis / 1000)
+
+    def shutdown(self) -> None:
+        self._shutdown = True
+        self._wake.set()
+        self._worker.join(timeout=self.flush_interval + 1)
+        self._drain(deadline=time.monotonic() + self.flush_interval)
+        self.exporter.shutdown()
+
+
+def create_span_processor(exporter: SpanExporter) -> BoundedSpanProcessor:
+    """Build the configured bounded span processor around an exporter"""
+    return BoundedSpanProcessor(exporter, TELEMETRY_QUEUE_SIZE, TELEMETRY_BATCH_SIZE, TELEMETRY_FLUSH_INTERVAL_SECONDS)
+
+
+def setup_tracing(
+    connection_string: str,
+    span_processors: List[SpanProcessor],
+    wrap_exporter: Optional[Callable[[SpanExporter], SpanExporter]] = None,
+) -> TracerProvider:
+    """Install a global tracer provider exporting to Azure Monitor through the bounded queue"""
+    tracer_provider = TracerProvider(sampler=RateLimitedSampler(target_spans_per_second_limit=TELEMETRY_TRACES_PER_SECOND))
+    for span_processor in span_processors:
+        tracer_provider.add_span_processor(span_processor)
+    exporter = AzureMonitorTraceExporter(connection_string=connection_string)
+    if wrap_exporter is not None:
+        exporter = wrap_exporter(exporter)
+    tracer_provider.add_span_processor(create_span_processor(exporter))
+    trace.set_tracer_provider(tracer_provider)
+
+    try:
+        # Trace Azure SDK calls (e.g. the project client), as configure_azure_monitor would
+        from azure.core.settings import settings
+        from azure.core.tracing.ext.opentelemetry_span import OpenTelemetrySpan
+        settings.tracing_implementation = OpenTelemetrySpan
+    except ImportError:
+        pass
+    return tracer_provider
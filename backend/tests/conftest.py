@@ -0,0 +1,12 @@
+import os
+import sys
+
+import pytest
+
+# The backend's modules import each other by plain name, as when run from backend/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
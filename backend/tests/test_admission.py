@@ -0,0 +1,98 @@
+import asyncio
+import types
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected, upstream_retry_after
+
+pytestmark = pytest.mark.anyio
+
+
+def controller(rpm=60, tpm=0, max_wait=5, max_queued=10):
+    # headroom 1 and a one-second burst: rpm=60 admits one call, then one per second
+    return AdmissionController(rpm, tpm, 1.0, 1, max_wait, max_queued)
+
+
+async def test_call_over_quota_waits_its_turn():
+    admission = AdmissionController(6000, 0, 1.0, 0.01, 5, 10)  # One call per 10ms
+    await admission.admit("gpt", 0)
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    await admission.admit("gpt", 0)
+
+    assert loop.time() - started >= 0.005
+
+
+async def test_call_that_would_miss_its_deadline_is_rejected_at_once():
+    admission = controller(max_wait=0.5)
+    await admission.admit("gpt", 0)
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        await admission.admit("gpt", 0)
+
+    assert rejected.value.reason == "deadline"
+    assert rejected.value.retry_after == 1
+
+
+async def test_full_queue_rejects_and_a_cancelled_waiter_gives_its_place_back():
+    admission = controller(max_queued=1)
+    await admission.admit("gpt", 0)
+    waiter = asyncio.create_task(admission.admit("gpt", 0))
+    await asyncio.sleep(0)
+
+    with pytest.raises(AdmissionRejected) as rejected:
+        await admission.admit("gpt", 0)
+    assert rejected.value.reason == "queue_full"
+    assert admission.wait_time("gpt", 0) > 1.5
+
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert admission._deployment("gpt").waiting == 0
+    assert admission.wait_time("gpt", 0) <= 1  # Its reservation was refunded
+
+
+async def test_refund_returns_the_quota_of_an_unsent_call():
+    admission = controller(rpm=0, tpm=600)  # 10 tokens a second, 10 at once
+    await admission.admit("gpt", 10)
+    assert admission.wait_time("gpt", 10) > 0.9
+
+    admission.refund("gpt", 10)
+
+    assert admission.wait_time("gpt", 10) == 0
+
+
+async def test_upstream_429_drains_the_buckets_for_its_retry_after():
+    admission = controller(tpm=600)
+
+    rejected = admission.throttled("gpt", 5)
+
+    assert rejected.reason == "upstream"
+    assert rejected.retry_after == 5
+    assert 5 < admission.wait_time("gpt", 1) <= 6.1
+    assert admission.wait_time("other", 1) == 0
+    with pytest.raises(AdmissionRejected):
+        await admission.admit("gpt", 1)
+
+
+def test_unlimited_deployment_never_waits():
+    assert AdmissionController(0, 0, 1.0, 1, 5, 10).wait_time("gpt", 10**6) == 0
+
+
+def throttle_error(headers):
+    return Exception() if headers is None else types.SimpleNamespace(response=types.SimpleNamespace(headers=headers))
+
+
+@pytest.mark.parametrize(
+    "headers, expected",
+    [
+        ({"retry-after-ms": "1500", "retry-after": "9"}, 1.5),
+        ({"retry-after": "7"}, 7),
+        ({"retry-after": "Wed, 21 Oct 2026 07:28:00 GMT"}, 10),
+        ({}, 10),
+        (None, 10),
+    ],
+)
+def test_upstream_retry_after_reads_the_response_headers(headers, expected):
+    assert upstream_retry_after(throttle_error(headers)) == expected
@@ -0,0 +1,94 @@
+import time
+
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+def open_breaker(threshold=3, open_seconds=30):
+    breaker = CircuitBreaker("test", threshold, open_seconds)
+    for _ in range(threshold):
+        breaker.record_failure(time.monotonic())
+    return breaker
+
+
+def test_opens_after_consecutive_failures_only():
+    breaker = CircuitBreaker("test", 3, 30)
+    now = time.monotonic()
+    breaker.record_failure(now)
+    breaker.record_failure(now)
+    breaker.record_success(now)  # Resets the run
+    breaker.record_failure(now)
+    breaker.record_failure(now)
+    assert breaker.state == CLOSED
+
+    breaker.record_failure(now)
+    assert breaker.state == OPEN
+
+
+def test_open_breaker_rejects_calls_until_the_open_period_ends():
+    breaker = open_breaker(open_seconds=30)
+    now = time.monotonic()
+
+    assert not breaker.allows(now)
+    assert 29 < breaker.retry_in(now) <= 30
+    assert breaker.allows(now + 31)
+
+
+def test_half_open_lets_one_probe_through():
+    breaker = open_breaker(open_seconds=30)
+    later = time.monotonic() + 31
+
+    breaker.on_pick(later)
+    assert breaker.state == HALF_OPEN
+    assert not breaker.allows(later + 1)  # The probe is still running
+
+
+def test_probe_success_closes_and_failure_reopens():
+    later = time.monotonic() + 31
+    breaker = open_breaker(open_seconds=30)
+    breaker.on_pick(later)
+    breaker.record_success(later)
+    assert breaker.state == CLOSED
+    assert breaker.allows(time.monotonic())
+
+    breaker = open_breaker(open_seconds=30)
+    breaker.on_pick(later)
+    breaker.record_failure(later)  # One failure is enough in half-open
+    assert breaker.state == OPEN
+    assert not breaker.allows(time.monotonic())
+
+
+def test_probe_that_never_reports_back_expires():
+    breaker = open_breaker(open_seconds=30)
+    later = time.monotonic() + 31
+    breaker.on_pick(later)
+
+    assert breaker.allows(later + 31)
+
+
+def test_only_the_probe_decides_a_half_open_breaker():
+    before = time.monotonic()
+    breaker = open_breaker(open_seconds=30)
+    breaker.record_success(before)  # A call sent while the breaker was closed
+    assert breaker.state == OPEN
+
+    later = before + 31
+    breaker.on_pick(later)
+    breaker.record_success(before)
+    breaker.record_failure(before)
+    assert breaker.state == HALF_OPEN
+
+    breaker.record_success(later + 0.1)  # The probe
+    assert breaker.state == CLOSED
+
+
+def test_result_of_an_expired_probe_is_ignored():
+    breaker = open_breaker(open_seconds=30)
+    first_probe = time.monotonic() + 31
+    breaker.on_pick(first_probe)
+    second_probe = first_probe + 31
+    breaker.on_pick(second_probe)
+
+    breaker.record_failure(first_probe)
+    assert breaker.state == HALF_OPEN
+    breaker.record_failure(second_probe)
+    assert breaker.state == OPEN
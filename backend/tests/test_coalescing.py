@@ -0,0 +1,126 @@
+import asyncio
+from contextlib import aclosing
+
+import pytest
+
+from coalescing import OffsetUnavailable, StreamCoalescer, StreamFanout
+
+pytestmark = pytest.mark.anyio
+
+
+async def read_all(deltas):
+    async with aclosing(deltas) as deltas:
+        return "".join([text async for text in deltas])
+
+
+async def test_late_joiner_gets_the_answer_from_the_start_without_a_second_call():
+    coalescer = StreamCoalescer()
+    calls = 0
+    more = asyncio.Event()
+
+    async def produce():
+        nonlocal calls
+        calls += 1
+        yield "Hello"
+        await more.wait()
+        yield ", world"
+
+    first = coalescer.start("key", produce).subscribe(held=True)
+    assert await first.__anext__() == "Hello"
+    joined = coalescer.attach("key")
+    assert joined is not None
+    more.set()
+
+    texts = await asyncio.gather(read_all(first), read_all(joined.subscribe(held=True)))
+
+    assert texts == [", world", "Hello, world"]
+    assert calls == 1
+
+
+async def test_attach_finds_nothing_once_the_stream_is_done():
+    coalescer = StreamCoalescer()
+
+    async def produce():
+        yield "answer"
+
+    assert coalescer.attach("key") is None
+    assert await read_all(coalescer.start("key", produce).subscribe(held=True)) == "answer"
+    assert coalescer.attach("key") is None
+
+
+async def test_upstream_is_cancelled_only_when_the_last_subscriber_leaves():
+    coalescer = StreamCoalescer()
+    closed = asyncio.Event()
+
+    async def produce():
+        try:
+            yield "first"
+            await asyncio.Event().wait()  # Never finishes on its own
+        finally:
+            closed.set()
+
+    fanout = coalescer.start("key", produce)
+    first = fanout.subscribe(held=True)
+    second = coalescer.attach("key").subscribe(held=True)
+    assert await first.__anext__() == "first"
+    assert await second.__anext__() == "first"
+
+    await first.aclose()
+    await asyncio.sleep(0)
+    assert not closed.is_set()
+    third = coalescer.attach("key").subscribe(held=True)
+    assert await third.__anext__() == "first"
+    await third.aclose()
+
+    await second.aclose()
+    await asyncio.wait_for(closed.wait(), timeout=1)
+    assert fanout.closing
+    assert coalescer.attach("key") is None
+
+
+async def test_upstream_error_reaches_every_subscriber():
+    fanout = StreamFanout("key", lambda _: None)
+
+    async def produce():
+        yield "partial"
+        raise RuntimeError("upstream failed")
+
+    fanout.start(produce)
+    results = await asyncio.gather(read_all(fanout.subscribe()), read_all(fanout.subscribe()), return_exceptions=True)
+
+    assert [str(result) for result in results] == ["upstream failed", "upstream failed"]
+
+
+async def test_max_chars_keeps_only_the_newest_whole_chunks():
+    fanout = StreamFanout("key", lambda _: None, max_chars=5)
+
+    async def produce():
+        for text in ("abc", "def", "ghi"):
+            yield text
+
+    fanout.start(produce)
+    assert await read_all(fanout.subscribe(6)) == "ghi"
+
+    assert not fanout.has_offset(0)
+    assert fanout.read(7) == "hi"
+    with pytest.raises(OffsetUnavailable):
+        fanout.read(3)
+
+
+async def test_releasing_a_hold_that_was_never_read_stops_the_upstream():
+    coalescer = StreamCoalescer()
+    closed = asyncio.Event()
+
+    async def produce():
+        try:
+            yield "first"
+            await asyncio.Event().wait()
+        finally:
+            closed.set()
+
+    fanout = coalescer.start("key", produce)
+    await asyncio.sleep(0.01)  # The pump is running for a reader that never comes
+    fanout.release()
+
+    await asyncio.wait_for(closed.wait(), timeout=1)
+    assert coalescer.attach("key") is None
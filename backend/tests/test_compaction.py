@@ -0,0 +1,123 @@
+import asyncio
+import types
+
+import pytest
+
+import compaction
+from compaction import MESSAGE_OVERHEAD_TOKENS, HistoryCompactor, count_tokens
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture(autouse=True)
+def character_counting(monkeypatch):
+    monkeypatch.setattr(compaction, "_encoding", None)
+
+
+def turn(index):
+    return {"role": "user" if index % 2 == 0 else "assistant", "content": f"message {index:02d} " + "x" * 28}  # 10 tokens
+
+
+TURN_TOKENS = 10 + MESSAGE_OVERHEAD_TOKENS
+
+
+class RecordingSummarizer:
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, previous, messages):
+        self.calls.append((previous, [msg["content"] for msg in messages]))
+        return "short summary"
+
+
+def test_fallback_counts_about_four_characters_per_token():
+    assert count_tokens("") == 0
+    assert count_tokens("abcd") == 1
+    assert count_tokens("abcde") == 2
+
+
+def test_tiktoken_encoding_is_used_when_available(monkeypatch):
+    monkeypatch.setattr(compaction, "_encoding", types.SimpleNamespace(encode=lambda text, disallowed_special: text.split()))
+
+    assert count_tokens("three whole words") == 3
+
+
+def test_history_is_counted_once_per_message(monkeypatch):
+    counted = []
+    message_tokens = compaction.message_tokens
+    monkeypatch.setattr(compaction, "message_tokens", lambda msg: counted.append(msg["content"]) or message_tokens(msg))
+    compactor = HistoryCompactor(10_000, 2, 10)
+    history = [turn(i) for i in range(4)]
+
+    compactor.compact("conv", history, [turn(4)])
+    compactor.compact("conv", history + [turn(4), turn(5)], [turn(6)])
+
+    # The new turn is counted again once it is stored history; older history never is
+    assert counted == [turn(i)["content"] for i in (0, 1, 2, 3, 4, 4, 5, 6)]
+    assert compactor._history_tokens["conv"] == [TURN_TOKENS] * 6
+
+
+def test_shorter_history_is_recounted():
+    compactor = HistoryCompactor(10_000, 2, 10)
+    compactor.compact("conv", [turn(i) for i in range(4)], [])
+
+    compactor.compact("conv", [{"role": "user", "content": "new"}], [])
+
+    assert compactor._history_tokens["conv"] == [1 + MESSAGE_OVERHEAD_TOKENS]
+
+
+def test_token_counts_are_kept_for_the_most_recent_conversations_only():
+    compactor = HistoryCompactor(10_000, 2, 2)
+    for conversation_id in ("a", "b", "a", "c"):
+        compactor.compact(conversation_id, [turn(0)], [])
+
+    assert list(compactor._history_tokens) == ["a", "c"]
+
+
+def test_compacted_messages_carry_only_role_and_content():
+    compactor = HistoryCompactor(3 * TURN_TOKENS, 2, 10)
+    history = [dict(turn(i), created_at=i) for i in range(6)]
+    stored = [dict(msg) for msg in history]
+
+    compacted = compactor.compact("conv", history, [turn(6)])
+
+    assert compacted == [turn(4), turn(5), turn(6)]
+    assert history == stored
+
+
+async def test_summary_is_only_generated_for_conversations_the_client_returns_to():
+    summarize = RecordingSummarizer()
+    compactor = HistoryCompactor(3 * TURN_TOKENS, 2, 10, summarize)
+    history = [turn(i) for i in range(6)]
+
+    compactor.compact("anonymous", history, [turn(6)], allow_summary=False)
+    compactor.compact("conv", history, [turn(6)])
+    await asyncio.gather(*compactor._pending.values())
+
+    assert summarize.calls == [(None, [turn(i)["content"] for i in range(4)])]
+    assert "anonymous" not in compactor._summaries
+    assert compactor._summaries["conv"].covered == 4
+
+    compacted = compactor.compact("conv", history + [turn(6)], [turn(7)])
+    assert compacted[0]["content"].endswith("short summary")
+
+
+async def test_forget_drops_the_summary_counts_and_pending_work():
+    blocked = asyncio.Event()
+
+    async def slow_summary(previous, messages):
+        await blocked.wait()
+        return "never stored"
+
+    compactor = HistoryCompactor(3 * TURN_TOKENS, 2, 10, slow_summary)
+    compactor._summaries["conv"] = compaction.Summary("old", 2, 5)
+    compactor.compact("conv", [turn(i) for i in range(6)], [turn(6)])
+    task = compactor._pending["conv"]
+
+    compactor.forget("conv")
+    await asyncio.sleep(0)
+
+    assert task.cancelled()
+    assert "conv" not in compactor._summaries
+    assert "conv" not in compactor._history_tokens
+    assert "conv" not in compactor._pending
@@ -0,0 +1,70 @@
+import pytest
+from opentelemetry.sdk.trace import TracerProvider
+from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+import content_recording
+from content_recording import FULL, OFF, SAMPLED, ContentRecordingSpanExporter, ContentRecordingSpanProcessor
+from prompts import get_solution_architect_system_prompt, get_system_prompt_version
+
+PROMPT_ATTRIBUTE = "gen_ai.prompt.0.content"
+
+
+@pytest.fixture
+def traced():
+    exporter = InMemorySpanExporter()
+    provider = TracerProvider()
+    provider.add_span_processor(ContentRecordingSpanProcessor())
+    provider.add_span_processor(SimpleSpanProcessor(ContentRecordingSpanExporter(exporter)))
+    tracer = provider.get_tracer("test")
+
+    def record(mode, prompt):
+        token = content_recording._mode.set(mode)
+        try:
+            with tracer.start_as_current_span("chat") as span:
+                span.set_attribute(PROMPT_ATTRIBUTE, prompt)
+                span.set_attribute("gen_ai.usage.input_tokens", 12)
+                span.add_event("gen_ai.choice", {"gen_ai.event.content": "The answer", "index": 0})
+        finally:
+            content_recording._mode.reset(token)
+        exported = exporter.get_finished_spans()[-1]
+        return span, exported
+
+    return record
+
+
+def test_full_mode_exports_the_span_untouched(traced):
+    prompt = get_solution_architect_system_prompt() + " question"
+
+    _, exported = traced(FULL, prompt)
+
+    assert exported.attributes[PROMPT_ATTRIBUTE] == prompt
+    assert exported.events[0].attributes["gen_ai.event.content"] == "The answer"
+
+
+def test_off_mode_drops_content_and_keeps_metadata(traced):
+    span, exported = traced(OFF, "secret question")
+
+    assert PROMPT_ATTRIBUTE not in exported.attributes
+    assert exported.attributes["gen_ai.usage.input_tokens"] == 12
+    assert [event.name for event in exported.events] == ["gen_ai.choice"]
+    assert "gen_ai.event.content" not in exported.events[0].attributes
+    assert span.attributes[PROMPT_ATTRIBUTE] == "secret question"  # Only the exported copy is redacted
+
+
+def test_sampled_mode_replaces_the_system_prompt_with_its_hash(traced):
+    prompt = get_solution_architect_system_prompt() + " question"
+
+    _, exported = traced(SAMPLED, prompt)
+
+    assert exported.attributes[PROMPT_ATTRIBUTE] == f"[system prompt sha256:{get_system_prompt_version()}] question"
+    assert exported.events[0].attributes["gen_ai.event.content"] == "The answer"
+
+
+def test_sampled_values_are_capped_in_bytes(traced, monkeypatch):
+    monkeypatch.setattr(content_recording, "CONTENT_RECORDING_MAX_ATTRIBUTE_BYTES", 5)
+
+    _, exported = traced(SAMPLED, "héllo world")
+
+    # é takes two bytes, so five bytes hold "héll"
+    assert exported.attributes[PROMPT_ATTRIBUTE] == "héll...[truncated 7 bytes]"
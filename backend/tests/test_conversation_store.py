@@ -0,0 +1,91 @@
+import asyncio
+import os
+import stat
+import threading
+
+import pytest
+
+from conversation_store import ConversationStore
+
+pytestmark = pytest.mark.anyio
+
+
+def user(text):
+    return {"role": "user", "content": text}
+
+
+def open_store(directory, max_in_memory=1, max_on_disk=10):
+    return ConversationStore(max_in_memory, max_on_disk, str(directory))
+
+
+async def test_spilled_conversation_loads_back_after_a_restart(tmp_path):
+    store = open_store(tmp_path)
+    await store.append("first", [user("one")])
+    await store.append("second", [user("two")])
+
+    assert os.listdir(tmp_path) == ["first.json"]
+    assert stat.S_IMODE(os.stat(tmp_path / "first.json").st_mode) == 0o600
+
+    restarted = open_store(tmp_path)
+    assert await restarted.get("first") == [user("one")]
+    assert not (tmp_path / "first.json").exists()
+
+
+async def test_conversation_in_use_is_not_spilled_until_idle(tmp_path):
+    store = open_store(tmp_path)
+    await store.append("busy", [user("one")])
+
+    async with store._locked("busy"):
+        await store.append("other", [user("two")])
+        assert list(store._memory) == ["busy"]
+        assert os.listdir(tmp_path) == ["other.json"]
+
+    await store.append("third", [user("three")])
+    assert list(store._memory) == ["third"]
+    assert sorted(os.listdir(tmp_path)) == ["busy.json", "other.json"]
+
+
+async def test_slow_disk_read_only_holds_up_its_own_conversation(tmp_path, monkeypatch):
+    store = open_store(tmp_path)
+    await store.append("slow", [user("one")])
+    await store.append("fast", [user("two")])
+    release = threading.Event()
+    read_file = store._read_file
+
+    def blocked_read(conversation_id):
+        release.wait(5)
+        return read_file(conversation_id)
+
+    monkeypatch.setattr(store, "_read_file", blocked_read)
+    slow = asyncio.create_task(store.get("slow"))
+    await asyncio.sleep(0.05)
+
+    assert await asyncio.wait_for(store.get("fast"), 1) == [user("two")]
+    assert not slow.done()
+    release.set()
+    assert await slow == [user("one")]
+
+
+async def test_append_during_spill_keeps_both_turns(tmp_path, monkeypatch):
+    store = open_store(tmp_path)
+    await store.append("first", [user("one")])
+    writing = threading.Event()
+    release = threading.Event()
+    write_file = store._write_file
+
+    def blocked_write(conversation_id, messages):
+        writing.set()
+        release.wait(5)
+        write_file(conversation_id, messages)
+
+    monkeypatch.setattr(store, "_write_file", blocked_write)
+    spill = asyncio.create_task(store.append("second", [user("two")]))
+    await asyncio.to_thread(writing.wait, 5)
+    late = asyncio.create_task(store.append("first", [user("three")]))
+    await asyncio.sleep(0.05)
+    assert not late.done()
+
+    release.set()
+    await spill
+    await late
+    assert await store.get("first") == [user("one"), user("three")]
@@ -0,0 +1,86 @@
+import os
+import stat
+import time
+
+from azure.core.credentials import AccessToken
+from azure.identity import DefaultAzureCredential
+
+import credentials
+from credentials import CREDENTIAL_TYPES, CredentialProvider
+
+SCOPE = "https://cognitiveservices.azure.com/.default"
+
+
+class RecordingCredential:
+    def __init__(self):
+        self.calls = []
+
+    def get_token(self, *scopes, **kwargs):
+        self.calls.append((scopes, kwargs))
+        return AccessToken(f"token-{len(self.calls)}", int(time.time()) + 3600)
+
+
+def make_provider(tmp_path, credential=None):
+    provider = CredentialProvider(None, str(tmp_path / "credentials"), refresh_margin=600, cache_key=None)
+    provider._credential = credential
+    return provider
+
+
+def test_pinned_managed_identity_keeps_the_user_assigned_client_id(monkeypatch):
+    built = []
+    monkeypatch.setattr(credentials, "ManagedIdentityCredential", lambda **kwargs: built.append(kwargs))
+    monkeypatch.setenv("AZURE_CLIENT_ID", "user-assigned-id")
+
+    CREDENTIAL_TYPES["ManagedIdentityCredential"](None)
+
+    assert built == [{"client_id": "user-assigned-id"}]
+
+
+def test_cae_tokens_are_requested_and_cached_apart(tmp_path):
+    credential = RecordingCredential()
+    provider = make_provider(tmp_path, credential)
+
+    plain = provider.get_token(SCOPE)
+    cae = provider.get_token(SCOPE, enable_cae=True)
+
+    assert plain.token != cae.token
+    assert provider.get_token(SCOPE, enable_cae=True) is cae
+    assert credential.calls == [((SCOPE,), {}), ((SCOPE,), {"enable_cae": True})]
+
+
+def test_claims_challenges_bypass_the_cache_with_their_options(tmp_path):
+    credential = RecordingCredential()
+    provider = make_provider(tmp_path, credential)
+    provider.get_token(SCOPE)
+
+    provider.get_token(SCOPE, claims="challenge", enable_cae=True)
+
+    assert credential.calls[-1] == ((SCOPE,), {"claims": "challenge", "enable_cae": True})
+
+
+class FakeDefaultCredential(DefaultAzureCredential):
+    def __init__(self, resolved=None):
+        if resolved is not None:
+            self._successful_credential = resolved
+
+    def get_token(self, *scopes, **kwargs):
+        return AccessToken("token", int(time.time()) + 3600)
+
+
+def test_resolved_type_is_pinned_in_an_owner_only_file(tmp_path):
+    resolved = type("ManagedIdentityCredential", (RecordingCredential,), {})()
+    provider = make_provider(tmp_path, FakeDefaultCredential(resolved))
+
+    provider.get_token(SCOPE)
+
+    assert provider.credential_type == "ManagedIdentityCredential"
+    assert stat.S_IMODE(os.stat(provider._type_path).st_mode) == 0o600
+    assert stat.S_IMODE(os.stat(tmp_path / "credentials").st_mode) == 0o700
+
+
+def test_default_credential_is_kept_without_the_private_attribute(tmp_path):
+    provider = make_provider(tmp_path, FakeDefaultCredential())
+
+    assert provider.get_token(SCOPE).token == "token"
+    assert provider.credential_type == "FakeDefaultCredential"
+    assert not os.path.exists(provider._type_path)
@@ -0,0 +1,81 @@
+import asyncio
+
+import pytest
+
+import metrics
+from hedging import Hedger, hedge_outcomes
+
+pytestmark = pytest.mark.anyio
+
+DELAY = 0.05
+
+
+def make_hedger(budget_ratio=1.0, samples=10, name="test_hedge_latency"):
+    latency = metrics.Histogram(name, "")
+    for _ in range(samples):
+        latency.observe(DELAY / 2)  # Below min_delay, so the delay is DELAY
+    return Hedger(latency, {}, 0.95, DELAY, budget_ratio, min_samples=10)
+
+
+def slow_primary(calls, primary_seconds=DELAY * 6, hedge_seconds=0.0, queued_seconds=0.0):
+    async def attempt(hedge, sent):
+        calls.append(hedge)
+        if not hedge:
+            await asyncio.sleep(queued_seconds)  # Waiting for quota before the call is sent
+        sent.set()
+        await asyncio.sleep(hedge_seconds if hedge else primary_seconds)
+        return "hedge" if hedge else "primary"
+    return attempt
+
+
+async def test_slow_attempt_is_hedged_and_the_faster_answer_wins():
+    hedger = make_hedger()
+    calls = []
+
+    assert await hedger.run(slow_primary(calls)) == "hedge"
+    assert calls == [False, True]
+    assert hedger.budget == 0
+
+
+async def test_no_hedging_until_enough_samples():
+    hedger = make_hedger(samples=3)
+    calls = []
+
+    assert await hedger.run(slow_primary(calls)) == "primary"
+    assert calls == [False]
+
+
+async def test_delay_counts_from_when_the_attempt_was_sent():
+    hedger = make_hedger()
+    calls = []
+
+    # Queued far longer than the delay, then answers well within it
+    result = await hedger.run(slow_primary(calls, primary_seconds=DELAY / 5, queued_seconds=DELAY * 4))
+
+    assert result == "primary"
+    assert calls == [False]
+
+
+async def test_hedges_are_paid_from_the_budget():
+    hedger = make_hedger(budget_ratio=0.5)
+    no_budget = hedge_outcomes.value(outcome="no_budget")
+    calls = []
+
+    assert await hedger.run(slow_primary(calls)) == "primary"  # Half a hedge saved so far
+    assert hedge_outcomes.value(outcome="no_budget") == no_budget + 1
+    assert await hedger.run(slow_primary(calls)) == "hedge"
+    assert calls == [False, False, True]
+    assert hedger.budget == 0
+
+
+async def test_only_first_attempts_that_won_feed_the_hedge_delay():
+    hedger = make_hedger()
+    calls = []
+
+    await hedger.run(slow_primary(calls))  # The hedge wins
+    assert hedger.latency.snapshot().count == 10
+
+    await hedger.run(slow_primary(calls, primary_seconds=DELAY / 5, queued_seconds=DELAY * 4))
+    snapshot = hedger.latency.snapshot()
+    assert snapshot.count == 11
+    assert snapshot.sum - 10 * DELAY / 2 < DELAY * 2  # Timed from when it was sent, not queued
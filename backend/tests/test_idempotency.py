@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+
+from idempotency import IdempotencyKeyReused, IdempotencyStore, InvalidIdempotencyKey, body_fingerprint, idempotency_key
+
+pytestmark = pytest.mark.anyio
+
+BODY = body_fingerprint({"messages": [{"role": "user", "content": "hi"}]})
+
+
+def counting_call(result="answer", fail_first=False, seconds=0.0):
+    calls = []
+
+    async def call():
+        calls.append(None)
+        await asyncio.sleep(seconds)
+        if fail_first and len(calls) == 1:
+            raise RuntimeError("upstream failed")
+        return f"{result} {len(calls)}"
+    return call, calls
+
+
+async def test_repeat_gets_the_first_result_without_a_second_call():
+    store = IdempotencyStore(window=60, max_keys=100)
+    call, calls = counting_call(seconds=0.01)
+
+    results = await asyncio.gather(store.run("chat", "key", BODY, call), store.run("chat", "key", BODY, call))
+    later = await store.run("chat", "key", BODY, call)
+
+    assert results == [("answer 1", False), ("answer 1", True)]
+    assert later == ("answer 1", True)
+    assert len(calls) == 1
+
+
+async def test_key_reused_with_a_different_body_is_rejected():
+    store = IdempotencyStore(window=60, max_keys=100)
+    call, calls = counting_call()
+    await store.run("chat", "key", BODY, call)
+
+    with pytest.raises(IdempotencyKeyReused):
+        await store.run("chat", "key", body_fingerprint({"messages": []}), call)
+    assert len(calls) == 1
+
+
+async def test_failed_request_can_be_retried_with_the_same_key():
+    store = IdempotencyStore(window=60, max_keys=100)
+    call, calls = counting_call(fail_first=True)
+
+    with pytest.raises(RuntimeError):
+        await store.run("chat", "key", BODY, call)
+    assert await store.run("chat", "key", BODY, call) == ("answer 2", False)
+
+
+async def test_result_that_is_no_longer_reusable_is_replaced():
+    store = IdempotencyStore(window=60, max_keys=100)
+    call, calls = counting_call()
+    await store.run("chat_stream", "key", BODY, call)
+
+    assert await store.run("chat_stream", "key", BODY, call, reusable=lambda result: False) == ("answer 2", False)
+
+
+async def test_keys_are_scoped_per_endpoint():
+    store = IdempotencyStore(window=60, max_keys=100)
+    call, calls = counting_call()
+    await store.run("chat", "key", BODY, call)
+
+    assert await store.run("chat_stream", "key", BODY, call) == ("answer 2", False)
+
+
+async def test_first_request_finishes_for_its_repeat_after_its_client_left():
+    store = IdempotencyStore(window=60, max_keys=100)
+    call, calls = counting_call(seconds=0.02)
+    first = asyncio.create_task(store.run("chat", "key", BODY, call))
+    await asyncio.sleep(0)
+    first.cancel()
+
+    assert await store.run("chat", "key", BODY, call) == ("answer 1", True)
+    assert len(calls) == 1
+
+
+async def test_invalid_keys_are_refused():
+    assert idempotency_key({}) is None
+    assert idempotency_key({"idempotency-key": "abc-123"}) == "abc-123"
+    for key in ("", "has space", "x" * 256):
+        with pytest.raises(InvalidIdempotencyKey):
+            idempotency_key({"idempotency-key": key})
@@ -0,0 +1,28 @@
+import random
+import threading
+
+from metrics import DEFAULT_EXPORT_BOUNDARIES, Histogram
+
+
+def test_exported_le_counts_are_exact_cumulative_counts():
+    histogram = Histogram("test_latency_seconds", "")
+    rng = random.Random(7)
+    samples = [rng.uniform(0, 1.2) for _ in range(5000)] + [0.5, 1, 200]
+    for value in samples:
+        histogram.observe(value, route="chat")
+
+    counts = histogram.exported_buckets(histogram.snapshot(route="chat"))
+
+    expected = [sum(1 for value in samples if value <= bound) for bound in DEFAULT_EXPORT_BOUNDARIES]
+    assert counts == expected + [len(samples)]
+
+
+def test_exported_counts_merge_across_threads():
+    histogram = Histogram("test_threaded_seconds", "", boundaries=(0.1, 1))
+    threads = [threading.Thread(target=histogram.observe, args=(value,)) for value in (0.05, 0.099, 0.1, 0.5, 3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert histogram.exported_buckets(histogram.snapshot()) == [3, 4, 5]
@@ -0,0 +1,68 @@
+import os
+import stat
+
+import pytest
+
+from private_files import create_private_file, private_directory, write_private_file
+
+
+def mode(path):
+    return stat.S_IMODE(os.stat(path).st_mode)
+
+
+def test_new_directory_is_owner_only(tmp_path):
+    path = private_directory(str(tmp_path / "cache"))
+
+    assert path == str(tmp_path / "cache")
+    assert mode(path) == 0o700
+
+
+def test_own_directory_with_loose_mode_is_tightened(tmp_path):
+    path = tmp_path / "cache"
+    path.mkdir()
+    os.chmod(path, 0o777)
+
+    assert private_directory(str(path)) == str(path)
+    assert mode(path) == 0o700
+
+
+@pytest.mark.skipif(not hasattr(os, "geteuid") or os.geteuid() != 0, reason="needs root to create another user's directory")
+def test_directory_owned_by_someone_else_is_refused(tmp_path):
+    path = tmp_path / "cache"
+    path.mkdir(mode=0o777)
+    os.chown(path, 12345, 12345)
+
+    fallback = private_directory(str(path))
+
+    assert fallback != str(path)
+    assert os.stat(fallback).st_uid == os.getuid()
+    assert mode(fallback) == 0o700
+
+
+def test_symlinked_directory_is_refused(tmp_path):
+    (tmp_path / "elsewhere").mkdir()
+    os.symlink(tmp_path / "elsewhere", tmp_path / "cache")
+
+    assert private_directory(str(tmp_path / "cache")) != str(tmp_path / "cache")
+
+
+def test_written_file_is_owner_only(tmp_path):
+    path = str(tmp_path / "secret")
+    write_private_file(path, b"one")
+    write_private_file(path, b"two")
+
+    assert open(path, 'rb').read() == b"two"
+    assert mode(path) == 0o600
+
+
+def test_created_file_is_owner_only_and_keeps_its_content(tmp_path):
+    path = tmp_path / "cache.sqlite3"
+    path.write_bytes(b"kept")
+    os.chmod(path, 0o644)
+
+    create_private_file(str(path))
+    create_private_file(str(tmp_path / "new.sqlite3"))
+
+    assert path.read_bytes() == b"kept"
+    assert mode(path) == 0o600
+    assert mode(tmp_path / "new.sqlite3") == 0o600
@@ -0,0 +1,21 @@
+import os
+import stat
+
+import pytest
+
+from response_cache import ResponseCache
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_cache_file_is_owner_only_and_survives_a_restart(tmp_path):
+    path = str(tmp_path / "responses.sqlite3")
+    previous_umask = os.umask(0)
+    try:
+        cache = ResponseCache(10, 1024, 60, path)
+        await cache.set("key", "cached answer")
+    finally:
+        os.umask(previous_umask)
+
+    assert stat.S_IMODE(os.stat(path).st_mode) == 0o600
+    assert ResponseCache(10, 1024, 60, path).get("key") == "cached answer"
@@ -0,0 +1,94 @@
+import asyncio
+import os
+import stat
+from contextlib import aclosing
+
+import pytest
+
+from resumable import ResumableStreams, abandoned_streams, event_id, parse_event_id
+
+pytestmark = pytest.mark.anyio
+
+GRACE = 0.05
+
+
+def make_streams(spill_dir="", max_in_memory=10):
+    return ResumableStreams(ttl=60, grace=GRACE, max_chars=1000, max_in_memory=max_in_memory, spill_dir=spill_dir)
+
+
+async def read_all(deltas):
+    async with aclosing(deltas) as deltas:
+        return "".join([text async for text in deltas])
+
+
+def answer(*texts, gate=None):
+    async def produce():
+        for index, text in enumerate(texts):
+            if index and gate is not None:
+                await gate.wait()
+            yield text
+    return produce
+
+
+async def test_resume_from_last_event_id_gets_the_rest_of_the_answer():
+    streams = make_streams()
+    stream = await streams.start(answer("Hello", ", ", "world"))
+    assert await read_all(stream.subscribe()) == "Hello, world"
+
+    stream_id, offset = parse_event_id(event_id(stream.id, 5))
+    resumed = await streams.get(stream_id)
+
+    assert resumed is stream
+    assert await read_all(resumed.subscribe(offset)) == ", world"
+
+
+async def test_parse_event_id_rejects_foreign_ids():
+    assert parse_event_id("42") is None
+    assert parse_event_id("not-ours:5") is None
+
+
+async def test_reconnect_within_grace_keeps_generating():
+    streams = make_streams()
+    gate = asyncio.Event()
+    stream = await streams.start(answer("Hello", ", world", gate=gate))
+
+    deltas = stream.subscribe()
+    assert await deltas.__anext__() == "Hello"
+    await deltas.aclose()  # Connection dropped
+    await asyncio.sleep(GRACE / 2)
+
+    resumed = stream.subscribe(5)
+    gate.set()
+    assert await read_all(resumed) == ", world"
+    assert not stream.abandoned
+
+
+async def test_generation_is_cancelled_when_no_client_comes_back():
+    streams = make_streams()
+    abandoned = abandoned_streams.value()
+    finished = asyncio.Event()
+    stream = await streams.start(answer("Hello", ", world", gate=asyncio.Event()))
+    stream.add_done_callback(finished.set)
+
+    deltas = stream.subscribe()
+    assert await deltas.__anext__() == "Hello"
+    await deltas.aclose()
+    await asyncio.wait_for(finished.wait(), timeout=GRACE * 20)
+
+    assert stream.abandoned
+    assert abandoned_streams.value() == abandoned + 1
+    assert await streams.get(stream.id) is None  # There is no complete answer to resume
+
+
+async def test_finished_streams_beyond_the_memory_cap_are_spilled(tmp_path):
+    spill_dir = str(tmp_path / "streams")
+    streams = make_streams(spill_dir, max_in_memory=0)
+    stream = await streams.start(answer("spilled ", "answer"))
+    assert await read_all(stream.subscribe()) == "spilled answer"
+
+    await streams.start(answer("next"))  # Maintenance runs before each new stream
+    restored = await streams.get(stream.id)
+
+    assert restored is not stream
+    assert await read_all(restored.subscribe(8)) == "answer"
+    assert stat.S_IMODE(os.stat(spill_dir).st_mode) == 0o700
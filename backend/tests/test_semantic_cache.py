@@ -0,0 +1,61 @@
+import os
+import stat
+
+import pytest
+
+from semantic_cache import HashingEmbedder, SemanticCache
+
+pytestmark = pytest.mark.anyio
+
+QUESTION = "What are the pillars of the Well-Architected Framework?"
+
+
+def open_cache(directory, dim=64, capacity=8):
+    return SemanticCache(HashingEmbedder(dim), str(directory), capacity, threshold=0.9, ttl_seconds=3600)
+
+
+async def test_answers_survive_a_restart(tmp_path):
+    await open_cache(tmp_path).add(QUESTION, "context", "Five pillars")
+
+    assert await open_cache(tmp_path).lookup(QUESTION, "context") == "Five pillars"
+
+
+async def test_changing_the_capacity_starts_an_empty_cache_instead_of_failing(tmp_path):
+    await open_cache(tmp_path, capacity=8).add(QUESTION, "context", "Five pillars")
+
+    bigger = open_cache(tmp_path, capacity=16)
+
+    assert await bigger.lookup(QUESTION, "context") is None
+    await bigger.add(QUESTION, "context", "Still five")
+    assert await open_cache(tmp_path, capacity=16).lookup(QUESTION, "context") == "Still five"
+
+
+async def test_embedders_with_the_same_dimension_do_not_share_vectors(tmp_path):
+    await open_cache(tmp_path).add(QUESTION, "context", "Five pillars")
+
+    class OtherEmbedder(HashingEmbedder):
+        def __init__(self, dim):
+            super().__init__(dim)
+            self.name = f"other-{dim}"
+
+    other = SemanticCache(OtherEmbedder(64), str(tmp_path), 8, threshold=0.9, ttl_seconds=3600)
+
+    assert await other.lookup(QUESTION, "context") is None
+
+
+async def test_vectors_file_of_the_wrong_size_is_recreated(tmp_path):
+    await open_cache(tmp_path).add(QUESTION, "context", "Five pillars")
+    vectors_path = next(path for path in tmp_path.iterdir() if path.suffix == ".f32")
+    with open(vectors_path, 'r+b') as file:
+        file.truncate(100)
+
+    reopened = open_cache(tmp_path)
+
+    assert await reopened.lookup(QUESTION, "context") is None
+    assert os.path.getsize(vectors_path) == 8 * 64 * 4
+
+
+def test_cache_directory_is_owner_only(tmp_path):
+    open_cache(tmp_path / "semantic")
+
+    assert stat.S_IMODE(os.stat(tmp_path / "semantic").st_mode) == 0o700
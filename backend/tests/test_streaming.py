@@ -0,0 +1,87 @@
+import asyncio
+import time
+from contextlib import aclosing
+
+import pytest
+
+from streaming import LimitedStreamingResponse, StreamLimiter, coalesce_deltas
+
+pytestmark = pytest.mark.anyio
+
+
+async def test_disconnect_before_the_first_chunk_runs_on_close_and_frees_the_slot():
+    limiter = StreamLimiter(max_concurrent=1, max_queued=0, queue_timeout=1, retry_after=1)
+    await limiter.acquire()
+    closed = []
+
+    async def body():
+        await asyncio.Event().wait()  # The upstream has not answered yet
+        yield b"never sent"
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    response = LimitedStreamingResponse(body(), limiter, on_close=lambda: closed.append(True), media_type="text/event-stream")
+    await asyncio.wait_for(response({"type": "http", "asgi": {"spec_version": "2.4"}}, receive, send), timeout=1)
+
+    assert closed == [True]
+    assert response.disconnected
+    assert not limiter._semaphore.locked()
+
+
+async def timed_batches(deltas, **kwargs):
+    started = time.monotonic()
+    async with aclosing(coalesce_deltas(deltas, **kwargs)) as batches:
+        return [(batch, time.monotonic() - started) async for batch in batches]
+
+
+async def test_fast_deltas_are_batched_without_losing_text():
+    async def deltas():
+        for i in range(50):
+            yield f"{i},"
+
+    batches = await timed_batches(deltas(), window_ms=1000, max_bytes=40)
+
+    assert "".join(batch for batch, _ in batches) == "".join(f"{i}," for i in range(50))
+    assert batches[0][0] == "0,"
+    assert len(batches) < 10
+
+
+async def test_held_text_is_sent_when_the_window_ends_even_if_the_upstream_stalls():
+    async def deltas():
+        yield "first"
+        yield " held"
+        await asyncio.sleep(0.5)
+        yield " late"
+
+    batches = await timed_batches(deltas(), window_ms=50, max_bytes=1000)
+
+    assert [batch for batch, _ in batches] == ["first", " held", " late"]
+    assert batches[1][1] < 0.25
+    assert batches[2][1] >= 0.5
+
+
+async def test_closing_while_a_read_is_pending_closes_the_upstream():
+    closed = []
+
+    async def deltas():
+        try:
+            yield "first"
+            yield " held"
+            await asyncio.Event().wait()
+            yield "never"
+        finally:
+            closed.append(True)
+
+    upstream = deltas()
+    async with aclosing(coalesce_deltas(upstream, window_ms=20, max_bytes=1000)) as batches:
+        assert await batches.__anext__() == "first"
+        assert await asyncio.wait_for(batches.__anext__(), 1) == " held"
+    await upstream.aclose()
+
+    assert closed == [True]
@@ -26,6 +26,21 @@ const STARTER_QUESTIONS = [
   "How do I implement proper monitoring and observability for my AI application?",
 ]
 
+// How often one message's answer is requested before giving up; every attempt
+// sends the same Idempotency-Key
+const MAX_STREAM_ATTEMPTS = 3
+const RETRYABLE_STATUSES = [429, 502, 503, 504]
+
+class StreamRetry extends Error {
+  delayMs?: number
+
+  constructor(message: string, delayMs?: number) {
+    super(message)
+    this.delayMs = delayMs
+    Object.setPrototypeOf(this, StreamRetry.prototype)  // Keeps instanceof working when compiled to ES5
+  }
+}
+
 export default function ChatPage() {
   const [messages, setMessages] = useState<Message[]>([])
   const [inputMessage, setInputMessage] = useState('')
@@ -54,6 +69,8 @@ export default function ChatPage() {
     }
   ])
   const [currentSessionId, setCurrentSessionId] = useState<string | null>(null)
+  // Server-side conversation ID; once set, only the new turn is sent
+  const [conversationId, setConversationId] = useState<string | null>(null)
   const [showStarterQuestions, setShowStarterQuestions] = useState(true)
   const messagesEndRef = useRef<HTMLDivElement>(null)
 
@@ -99,135 +116,166 @@ export default function ChatPage() {
     }
     setMessages(prev => [...prev, initialAssistantMessage])
 
-    try {
-      console.log('🚀 Starting streaming request to /api/chat/stream...')
-      
-      const response = await fetch('http://localhost:8000/api/chat/stream', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify({
-          messages: currentMessages,
-          stream: true
-        })
-      })
+    // One key per user message, reused by every retry below so the server
+    // replays or resumes the first answer instead of generating a new one
+    const idempotencyKey = crypto.randomUUID()
+    const requestBody = JSON.stringify(
+      conversationId
+        ? { conversation_id: conversationId, messages: [userMessage], stream: true }
+        : { messages: currentMessages, stream: true }
+    )
+    let accumulatedContent = ''
+    let lastEventId: string | null = null
+
+    const showContent = (content: string) => {
+      setMessages(prevMessages => prevMessages.map((msg, index) =>
+        index === prevMessages.length - 1 && msg.role === 'assistant'
+          ? { ...msg, content }
+          : msg
+      ))
+    }
+
+    // One request for the answer; resolves true once [DONE] arrives and false if the
+    // connection ended before it. Throws StreamRetry when trying again may help.
+    const streamOnce = async (): Promise<boolean> => {
+      const headers: Record<string, string> = {
+        'Content-Type': 'application/json',
+        'Idempotency-Key': idempotencyKey,
+      }
+      if (lastEventId) {
+        // Continue after the last frame received instead of starting over
+        headers['Last-Event-ID'] = lastEventId
+      } else {
+        // Without an event ID the answer comes again from the start
+        accumulatedContent = ''
+      }
+
+      let response: Response
+      try {
+        response = await fetch('http://localhost:8000/api/chat/stream', { method: 'POST', headers, body: requestBody })
+      } catch (networkError) {
+        throw new StreamRetry(`Network error: ${networkError}`)
+      }
 
       console.log('📡 Response status:', response.status)
-      console.log('📡 Response headers:', Object.fromEntries(response.headers.entries()))
 
       if (!response.ok) {
+        if (response.status === 410 && lastEventId) {
+          // Too late to resume; the same key replays (or regenerates) the answer from the start
+          lastEventId = null
+          throw new StreamRetry('Stream can no longer be resumed', 0)
+        }
+        if (response.status === 404 && conversationId) {
+          // Server no longer has this conversation; resend the full history next time
+          setConversationId(null)
+        }
+        if (RETRYABLE_STATUSES.includes(response.status)) {
+          const retryAfter = Number(response.headers.get('Retry-After'))
+          throw new StreamRetry(`HTTP error! status: ${response.status}`, retryAfter > 0 ? retryAfter * 1000 : undefined)
+        }
         throw new Error(`HTTP error! status: ${response.status}`)
       }
 
+      // The server stores the turn only once the answer completes, so adopt the ID on [DONE]
+      const serverConversationId = response.headers.get('X-Conversation-Id')
+
       const reader = response.body?.getReader()
       if (!reader) {
         throw new Error('No reader available')
       }
 
       const decoder = new TextDecoder()
-      let accumulatedContent = ''
-      
+      let pending = ''  // Start of a line split across reads
+
       console.log('📡 Starting to read stream chunks...')
 
       while (true) {
-        const { done, value } = await reader.read()
-        if (done) {
+        let result: ReadableStreamReadResult<Uint8Array>
+        try {
+          result = await reader.read()
+        } catch (readError) {
+          console.warn('⚠️ Connection dropped mid-answer:', readError)
+          return false
+        }
+        if (result.done) {
           console.log('📡 Stream reading complete (done=true)')
-          break
+          return false
         }
-        
-        // Decode the chunk
-        const chunk = decoder.decode(value, { stream: true })
-        console.log('📦 Raw chunk received:', JSON.stringify(chunk))
-        
-        // Split by lines and process each
-        const lines = chunk.split('\n')
-        
+
+        const lines = (pending + decoder.decode(result.value, { stream: true })).split('\n')
+        pending = lines.pop() ?? ''
+
         for (const line of lines) {
           if (!line.trim()) {
-            console.log('📋 Skipping empty line')
             continue
           }
-          
-          console.log('📋 Processing line:', JSON.stringify(line))
-          
+
+          if (line.startsWith('id: ')) {
+            lastEventId = line.slice(4).trim()
+            continue
+          }
+
           if (!line.startsWith('data: ')) {
-            console.log('📋 Line does not start with "data: " - skipping')
             continue
           }
-          
+
           // Check for completion signal
           if (line.includes('[DONE]')) {
             console.log('✅ [DONE] signal received - ending stream')
-            setIsLoading(false)
-            return
+            if (serverConversationId) {
+              setConversationId(serverConversationId)
+            }
+            return true
           }
 
+          let data
           try {
-            // Parse the JSON data after "data: "
-            const jsonData = line.slice(5).trim()
-            if (!jsonData) {
-              console.log('📋 No JSON data after "data: " - skipping')
-              continue
-            }
-            
-            const data = JSON.parse(jsonData)
-            console.log('📄 Parsed chunk data:', data)
-            
-            // Handle chunk data
-            if (data.chunk) {
-              const newChunk = data.chunk
-              accumulatedContent += newChunk
-              
-              console.log(`📝 New chunk: ${JSON.stringify(newChunk)}`)
-              console.log(`📝 Total accumulated (${accumulatedContent.length} chars): "${accumulatedContent.slice(-100)}"`)
-              
-              // Force immediate UI update
-              setMessages(prevMessages => {
-                console.log('🔄 Updating messages state with new chunk...')
-                const updatedMessages = prevMessages.map((msg, index) => {
-                  if (index === prevMessages.length - 1 && msg.role === 'assistant') {
-                    const updatedMsg = { ...msg, content: accumulatedContent }
-                    console.log(`🔄 Updated assistant message (${updatedMsg.content.length} chars): "${updatedMsg.content.slice(-50)}"`)
-                    return updatedMsg
-                  }
-                  return msg
-                })
-                return updatedMessages
-              })
-              
-              // Small delay to ensure React processes the update
-              await new Promise(resolve => setTimeout(resolve, 0))
-            }
-            
-            // Handle done flag
-            if (data.done === true) {
-              console.log('✅ Done flag received in data')
-              setIsLoading(false)
-              return
-            }
-            
-            // Handle error
-            if (data.error) {
-              throw new Error(data.error)
-            }
-            
+            data = JSON.parse(line.slice(5).trim())
           } catch (parseError) {
             console.warn('⚠️ Parse error (skipping):', parseError)
             console.warn('⚠️ Line that failed:', JSON.stringify(line))
             continue
           }
+
+          if (data.error) {
+            throw new Error(data.error)
+          }
+
+          if (data.chunk) {
+            accumulatedContent += data.chunk
+            showContent(accumulatedContent)
+            // Small delay to ensure React processes the update
+            await new Promise(resolve => setTimeout(resolve, 0))
+          }
         }
       }
-      
+    }
+
+    try {
+      console.log('🚀 Starting streaming request to /api/chat/stream...')
+
+      for (let attempt = 1; ; attempt++) {
+        let delayMs = attempt * 1000
+        try {
+          if (await streamOnce()) {
+            return
+          }
+          console.warn('⚠️ Stream ended before [DONE]')
+        } catch (error) {
+          if (!(error instanceof StreamRetry)) {
+            throw error
+          }
+          console.warn('⚠️', error.message)
+          delayMs = error.delayMs ?? delayMs
+        }
+        if (attempt >= MAX_STREAM_ATTEMPTS) {
+          throw new Error('Gave up on the answer after several attempts')
+        }
+        await new Promise(resolve => setTimeout(resolve, delayMs))
+      }
     } catch (error) {
       console.error('❌ Error in sendMessage:', error)
-      setMessages(prev => prev.map((msg, index) => 
-        index === prev.length - 1 && msg.role === 'assistant'
-          ? { ...msg, content: 'Sorry, I encountered an error. Please try again.' }
-          : msg
-      ))
+      showContent('Sorry, I encountered an error. Please try again.')
     } finally {
       console.log('🏁 Finally block - setting isLoading to false')
       setIsLoading(false)
@@ -244,11 +292,13 @@ export default function ChatPage() {
   const startNewChat = () => {
     setMessages([])
     setCurrentSessionId(null)
+    setConversationId(null)
     setShowStarterQuestions(true)
   }
 
   const loadChatSession = (sessionId: string) => {
     setCurrentSessionId(sessionId)
+    setConversationId(null)
     setShowStarterQuestions(false)
     // In a real app, you would load the actual messages for this session
     setMessages([
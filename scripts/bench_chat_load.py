@@ -0,0 +1,152 @@
+"""
+Load benchmark for the non-streaming /api/chat endpoint.
+
+By default this starts scripts/mock_openai_server.py and the real backend
+(backend/app.py with MOCK_OPENAI_BASE_URL pointing at the mock) on free local
+ports, then drives /api/chat over HTTP at each concurrency level. Every
+completion takes the mock's --ttft-ms plus --completion-tokens at
+--tokens-per-sec, so the numbers show how many completions one backend process
+keeps in flight against a slow upstream. Questions are unique per request so
+caching and coalescing don't skew the numbers (--same-question turns that off).
+
+Pass --url to drive an already running backend instead, e.g.:
+
+    python scripts/bench_chat_load.py -c 1 10 50 --ttft-ms 200 --tokens-per-sec 100
+    python scripts/bench_chat_load.py --url http://localhost:8000 -c 1 10 50
+"""
+import argparse
+import asyncio
+import contextlib
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+QUESTION = "What are the 5 pillars of the Well-Architected Framework?"
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Benchmark /api/chat throughput under concurrent load.")
+    parser.add_argument('--url', type=str, default=None, help="Base URL of a running backend. Omit to start the backend against the mock upstream.")
+    parser.add_argument('-c', '--concurrency', type=int, nargs='+', default=[1, 10, 50, 100], help="Concurrency levels to test.")
+    parser.add_argument('-n', '--requests', type=int, default=200, help="Requests per concurrency level.")
+    parser.add_argument('--same-question', action='store_true', help="Send an identical question every time (exercises caching/coalescing).")
+    parser.add_argument('--ttft-ms', type=float, default=200.0, help="Mock upstream time to first token (local mode).")
+    parser.add_argument('--tokens-per-sec', type=float, default=100.0, help="Mock upstream token rate (local mode).")
+    parser.add_argument('--completion-tokens', type=int, default=50, help="Mock upstream tokens per answer (local mode).")
+    parser.add_argument('--timeout', type=float, default=120.0, help="Per-request timeout in seconds.")
+    return parser.parse_args()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_until_ready(url, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(timeout=2.0) as client:
+        while time.monotonic() < deadline:
+            with contextlib.suppress(httpx.HTTPError):
+                if (await client.get(url)).status_code == 200:
+                    return
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not become ready within {timeout:.0f}s")
+
+
+@contextlib.asynccontextmanager
+async def local_backend(args):
+    """Run the mock upstream and the backend as subprocesses; yields the backend's base URL"""
+    mock_port, backend_port = free_port(), free_port()
+    mock = subprocess.Popen([
+        sys.executable, os.path.join(ROOT, "scripts", "mock_openai_server.py"),
+        "--port", str(mock_port),
+        "--ttft-ms", str(args.ttft_ms),
+        "--ttft-jitter-ms", "0",
+        "--tokens-per-sec", str(args.tokens_per_sec),
+        "--completion-tokens", str(args.completion_tokens),
+    ], stdout=subprocess.DEVNULL)
+    backend = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(backend_port), "--log-level", "warning"],
+        cwd=os.path.join(ROOT, "backend"),
+        env={**os.environ, "MOCK_OPENAI_BASE_URL": f"http://127.0.0.1:{mock_port}/v1"},
+        stdout=subprocess.DEVNULL,
+    )
+    try:
+        base_url = f"http://127.0.0.1:{backend_port}"
+        await wait_until_ready(f"http://127.0.0.1:{mock_port}/docs")
+        await wait_until_ready(f"{base_url}/ready")
+        yield base_url
+    finally:
+        for process in (backend, mock):
+            process.terminate()
+            process.wait()
+
+
+async def run_level(client, concurrency, total, same_question):
+    """Fire `total` requests with at most `concurrency` in flight"""
+    latencies = []
+    errors = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one_request(number):
+        nonlocal errors
+        question = QUESTION if same_question else f"{QUESTION} (benchmark request {concurrency}-{number})"
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                response = await client.post("/api/chat", json={"messages": [{"role": "user", "content": question}]})
+                response.raise_for_status()
+                latencies.append(time.perf_counter() - start)
+            except httpx.HTTPError:
+                errors += 1
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_request(number) for number in range(total)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "errors": errors,
+        "rps": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": statistics.median(latencies) * 1000 if latencies else 0.0,
+        "p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else 0.0,
+    }
+
+
+def print_result(label, result):
+    print(f"{label:>10} | c={result['concurrency']:>4} | {result['rps']:>8.1f} req/s | "
+          f"p50 {result['p50_ms']:>8.1f} ms | p99 {result['p99_ms']:>8.1f} ms | errors {result['errors']}")
+
+
+async def drive(base_url, label, args):
+    limits = httpx.Limits(max_connections=max(args.concurrency), max_keepalive_connections=max(args.concurrency))
+    async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+        for concurrency in args.concurrency:
+            print_result(label, await run_level(client, concurrency, args.requests, args.same_question))
+
+
+async def main():
+    args = parse_arguments()
+
+    if args.url:
+        await drive(args.url, "live", args)
+        return
+
+    upstream_ms = args.ttft_ms + args.completion_tokens / args.tokens_per_sec * 1000
+    print(f"backend/app.py against the mock upstream, about {upstream_ms:.0f} ms per completion\n")
+    async with local_backend(args) as base_url:
+        await drive(base_url, "local", args)
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,160 @@
+"""
+Backend CPU per streamed token of /api/chat/stream, through a real server and socket.
+
+Starts scripts/mock_openai_server.py, then runs the backend (backend/app.py
+with MOCK_OPENAI_BASE_URL) twice on free local ports: once with
+SSE_COALESCE_MS=0 (one SSE frame per token) and once with coalescing on. N
+concurrent clients read each stream over HTTP, and the backend process's CPU
+time (user + system, read with psutil) is divided by the tokens it streamed.
+The warm-up request and process startup are not counted. Frames and bytes per
+stream are what the clients actually received.
+
+    python scripts/bench_sse_cpu.py --streams 20 --tokens 300 --tokens-per-sec 100
+    python scripts/bench_sse_cpu.py --streams 20 --tokens-per-sec 100 --burst 5
+    python scripts/bench_sse_cpu.py --window-ms 20 --max-bytes 256 -o bench_sse_cpu.json
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+import psutil
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+QUESTION = "Describe a reference architecture for a RAG chatbot on Azure."
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Measure backend CPU per streamed token with and without SSE coalescing.")
+    parser.add_argument('--streams', type=int, default=20, help="Concurrent streams (keep below CPU saturation).")
+    parser.add_argument('--tokens', type=int, default=300, help="Tokens per stream.")
+    parser.add_argument('--tokens-per-sec', type=float, default=100.0, help="Token rate of each mock upstream stream.")
+    parser.add_argument('--burst', type=int, default=1, help="Tokens the mock sends back to back per write (Azure often sends several).")
+    parser.add_argument('--window-ms', type=float, default=20.0, help="SSE_COALESCE_MS for the coalesced run.")
+    parser.add_argument('--max-bytes', type=int, default=256, help="SSE_COALESCE_BYTES for the coalesced run.")
+    parser.add_argument('--timeout', type=float, default=120.0, help="Per-stream timeout in seconds.")
+    parser.add_argument('-o', '--output', type=str, default=None, help="Where to write the JSON results.")
+    return parser.parse_args()
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+async def wait_until_ready(url, timeout=30.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(timeout=2.0) as client:
+        while time.monotonic() < deadline:
+            with contextlib.suppress(httpx.HTTPError):
+                if (await client.get(url)).status_code == 200:
+                    return
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"{url} did not become ready within {timeout:.0f}s")
+
+
+@contextlib.contextmanager
+def process(command, **kwargs):
+    child = subprocess.Popen(command, stdout=subprocess.DEVNULL, **kwargs)
+    try:
+        yield child
+    finally:
+        child.terminate()
+        child.wait()
+
+
+async def read_stream(client, number, totals):
+    body = {"messages": [{"role": "user", "content": f"{QUESTION} (benchmark stream {number})"}]}
+    async with client.stream("POST", "/api/chat/stream", json=body) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_raw():
+            totals["bytes"] += len(chunk)
+            totals["frames"] += chunk.count(b"data: ")
+
+
+async def run_variant(name, coalesce_ms, args, mock_url):
+    port = free_port()
+    env = {
+        **os.environ,
+        "MOCK_OPENAI_BASE_URL": mock_url,
+        "SSE_COALESCE_MS": str(coalesce_ms),
+        "SSE_COALESCE_BYTES": str(args.max_bytes),
+        "MAX_CONCURRENT_STREAMS": str(args.streams),
+        "LOG_LEVEL": "WARNING",
+    }
+    command = [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port), "--log-level", "warning"]
+    with process(command, cwd=os.path.join(ROOT, "backend"), env=env) as backend:
+        base_url = f"http://127.0.0.1:{port}"
+        await wait_until_ready(f"{base_url}/ready")
+        limits = httpx.Limits(max_connections=args.streams, max_keepalive_connections=args.streams)
+        async with httpx.AsyncClient(base_url=base_url, timeout=args.timeout, limits=limits) as client:
+            await read_stream(client, "warm-up", {"bytes": 0, "frames": 0})
+
+            server = psutil.Process(backend.pid)
+            totals = {"bytes": 0, "frames": 0}
+            cpu_start = server.cpu_times()
+            wall_start = time.perf_counter()
+            await asyncio.gather(*(read_stream(client, f"{name}-{number}", totals) for number in range(args.streams)))
+            cpu_end = server.cpu_times()
+
+    cpu = (cpu_end.user - cpu_start.user) + (cpu_end.system - cpu_start.system)
+    tokens = args.streams * args.tokens
+    return {
+        "variant": name,
+        "sse_coalesce_ms": coalesce_ms,
+        "cpu_seconds": round(cpu, 3),
+        "wall_seconds": round(time.perf_counter() - wall_start, 3),
+        "cpu_us_per_token": round(cpu / tokens * 1e6, 1),
+        "frames_per_stream": round(totals["frames"] / args.streams, 1),
+        "bytes_per_stream": round(totals["bytes"] / args.streams),
+    }
+
+
+async def main():
+    args = parse_arguments()
+    report = {
+        "benchmark": "sse_cpu",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "settings": vars(args),
+        "variants": [],
+    }
+    mock_port = free_port()
+    mock_command = [
+        sys.executable, os.path.join(ROOT, "scripts", "mock_openai_server.py"),
+        "--port", str(mock_port),
+        "--ttft-ms", "0",
+        "--ttft-jitter-ms", "0",
+        "--tokens-per-sec", str(args.tokens_per_sec),
+        "--completion-tokens", str(args.tokens),
+        "--burst", str(args.burst),
+    ]
+    with process(mock_command):
+        await wait_until_ready(f"http://127.0.0.1:{mock_port}/docs")
+        for name, coalesce_ms in (("per_token", 0), ("coalesced", args.window_ms)):
+            result = await run_variant(name, coalesce_ms, args, f"http://127.0.0.1:{mock_port}/v1")
+            report["variants"].append(result)
+            print(
+                f"{name:>10} | {result['cpu_us_per_token']:>7} us CPU/token | "
+                f"{result['frames_per_stream']:>6} frames/stream | {result['bytes_per_stream']:>6} bytes/stream | "
+                f"{result['wall_seconds']}s wall"
+            )
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+        print(f"\nResults written to {args.output}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,202 @@
+"""
+End-to-end benchmark for /api/chat/stream.
+
+Drives N concurrent SSE clients against a running backend (backed by the mock
+server in scripts/mock_openai_server.py or by a real deployment) and reports,
+per concurrency level:
+
+- time to first byte (response headers received)
+- time to first token (first chunk event parsed)
+- inter-chunk gap p50/p95/p99 (one chunk per token unless the server batches)
+- tokens/sec per stream and requests/sec overall
+
+Results are written as JSON. Pass --compare with an earlier results file to
+fail (exit code 1) when a level regressed by more than --tolerance.
+
+    python scripts/bench_stream.py --url http://localhost:8000 -c 1 10 50 100 -o bench_stream.json
+    python scripts/bench_stream.py -c 1 10 50 100 --compare bench_stream.json
+"""
+import argparse
+import asyncio
+import json
+import platform
+import sys
+import time
+from datetime import datetime, timezone
+
+import httpx
+
+QUESTION = "What do I need to consider to ensure a smooth production rollout of my GenAI MVP?"
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Benchmark /api/chat/stream with concurrent SSE clients.")
+    parser.add_argument('--url', type=str, default="http://localhost:8000", help="Base URL of the backend.")
+    parser.add_argument('-c', '--concurrency', type=int, nargs='+', default=[1, 10, 50], help="Concurrency levels to test.")
+    parser.add_argument('-n', '--requests', type=int, default=None, help="Requests per level (default: 5 x concurrency).")
+    parser.add_argument('--same-question', action='store_true', help="Send an identical question every time (exercises caching/coalescing).")
+    parser.add_argument('--timeout', type=float, default=300.0, help="Per-request timeout in seconds.")
+    parser.add_argument('-o', '--output', type=str, default="bench_stream.json", help="Where to write the JSON results.")
+    parser.add_argument('--compare', type=str, default=None, help="Earlier results file to check for regressions.")
+    parser.add_argument('--tolerance', type=float, default=0.15, help="Allowed relative regression before failing.")
+    return parser.parse_args()
+
+
+def percentile(values, pct):
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def to_ms(value):
+    return round(value * 1000, 2) if value is not None else None
+
+
+async def run_stream(client, request_number, same_question):
+    """Run one streaming request and collect its timings"""
+    question = QUESTION if same_question else f"{QUESTION} (benchmark request {request_number})"
+    body = {"messages": [{"role": "user", "content": question}], "stream": True}
+    result = {"ok": False, "ttfb": None, "ttft": None, "gaps": [], "chars": 0, "duration": None}
+
+    start = time.perf_counter()
+    last_chunk_at = None
+    try:
+        async with client.stream("POST", "/api/chat/stream", json=body) as response:
+            result["ttfb"] = time.perf_counter() - start
+            if response.status_code != 200:
+                result["status"] = response.status_code
+                return result
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                payload = line[6:].strip()
+                if payload == "[DONE]":
+                    result["ok"] = True
+                    break
+                data = json.loads(payload)
+                if "error" in data:
+                    result["status"] = "error"
+                    break
+                if "chunk" not in data:
+                    continue
+                now = time.perf_counter()
+                if last_chunk_at is None:
+                    result["ttft"] = now - start
+                else:
+                    result["gaps"].append(now - last_chunk_at)
+                last_chunk_at = now
+                result["chars"] += len(data["chunk"])
+    except httpx.HTTPError as e:
+        result["status"] = type(e).__name__
+    result["duration"] = time.perf_counter() - start
+    return result
+
+
+async def run_level(base_url, concurrency, total, same_question, timeout):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited(number):
+            async with semaphore:
+                return await run_stream(client, number, same_question)
+
+        start = time.perf_counter()
+        results = await asyncio.gather(*(limited(i) for i in range(total)))
+        elapsed = time.perf_counter() - start
+
+    ok = [r for r in results if r["ok"]]
+    gaps = [gap for r in ok for gap in r["gaps"]]
+    # Token counts are estimated at ~4 characters per token so batched frames are comparable
+    tokens_per_sec = [
+        (r["chars"] / 4) / (r["duration"] - r["ttft"])
+        for r in ok
+        if r["ttft"] is not None and r["duration"] > r["ttft"]
+    ]
+    errors = {}
+    for r in results:
+        if not r["ok"]:
+            key = str(r.get("status", "incomplete"))
+            errors[key] = errors.get(key, 0) + 1
+
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "succeeded": len(ok),
+        "errors": errors,
+        "requests_per_sec": round(len(ok) / elapsed, 2) if elapsed else None,
+        "ttfb_ms": {f"p{p}": to_ms(percentile([r["ttfb"] for r in ok], p)) for p in (50, 95, 99)},
+        "ttft_ms": {f"p{p}": to_ms(percentile([r["ttft"] for r in ok if r["ttft"] is not None], p)) for p in (50, 95, 99)},
+        "inter_chunk_gap_ms": {f"p{p}": to_ms(percentile(gaps, p)) for p in (50, 95, 99)},
+        "tokens_per_sec_per_stream": {f"p{p}": round(percentile(tokens_per_sec, p), 2) if tokens_per_sec else None for p in (50, 5)},
+        "chunks_per_stream": round(sum(len(r["gaps"]) + 1 for r in ok) / len(ok), 1) if ok else None,
+    }
+
+
+def print_level(level):
+    print(
+        f"c={level['concurrency']:>4} | {level['succeeded']}/{level['requests']} ok | "
+        f"{level['requests_per_sec']} req/s | "
+        f"TTFB p50 {level['ttfb_ms']['p50']} ms | "
+        f"TTFT p50/p95/p99 {level['ttft_ms']['p50']}/{level['ttft_ms']['p95']}/{level['ttft_ms']['p99']} ms | "
+        f"gap p50/p95/p99 {level['inter_chunk_gap_ms']['p50']}/{level['inter_chunk_gap_ms']['p95']}/{level['inter_chunk_gap_ms']['p99']} ms | "
+        f"{level['tokens_per_sec_per_stream']['p50']} tok/s | errors {level['errors'] or 0}"
+    )
+
+
+def find_regressions(current, baseline, tolerance):
+    """Compare levels present in both runs; latency may not rise and throughput may not drop beyond tolerance"""
+    regressions = []
+    baseline_levels = {level["concurrency"]: level for level in baseline["levels"]}
+    for level in current["levels"]:
+        before = baseline_levels.get(level["concurrency"])
+        if before is None:
+            continue
+        for metric in ("ttft_ms", "inter_chunk_gap_ms"):
+            for pct in ("p95", "p99"):
+                old, new = before[metric][pct], level[metric][pct]
+                if old and new and new > old * (1 + tolerance):
+                    regressions.append(f"c={level['concurrency']} {metric} {pct}: {old} -> {new}")
+        old, new = before["requests_per_sec"], level["requests_per_sec"]
+        if old and new is not None and new < old * (1 - tolerance):
+            regressions.append(f"c={level['concurrency']} requests_per_sec: {old} -> {new}")
+    return regressions
+
+
+async def main():
+    args = parse_arguments()
+    report = {
+        "benchmark": "chat_stream",
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "url": args.url,
+        "python": platform.python_version(),
+        "same_question": args.same_question,
+        "levels": [],
+    }
+
+    for concurrency in args.concurrency:
+        total = args.requests or concurrency * 5
+        level = await run_level(args.url, concurrency, total, args.same_question, args.timeout)
+        print_level(level)
+        report["levels"].append(level)
+
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(report, file, indent=2)
+    print(f"\nResults written to {args.output}")
+
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as file:
+            baseline = json.load(file)
+        regressions = find_regressions(report, baseline, args.tolerance)
+        if regressions:
+            print(f"\nRegressions beyond {args.tolerance:.0%} against {args.compare}:")
+            for regression in regressions:
+                print(f"- {regression}")
+            sys.exit(1)
+        print(f"\nNo regressions beyond {args.tolerance:.0%} against {args.compare}")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
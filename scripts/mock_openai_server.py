@@ -0,0 +1,144 @@
+"""
+Local stand-in for the Azure OpenAI chat-completions API.
+
+Serves both streaming (SSE) and non-streaming completions with a configurable
+time to first token, token rate, error rate and 429 injection, so the backend
+can be load-tested on a laptop without spending tokens or touching the network.
+
+Start it, then point the backend at it:
+
+    python scripts/mock_openai_server.py --port 8100 --ttft-ms 300 --tokens-per-sec 60
+    MOCK_OPENAI_BASE_URL=http://localhost:8100/v1 python backend/app.py
+
+Both OpenAI-style (/v1/chat/completions) and Azure-style
+(/openai/deployments/{deployment}/chat/completions) routes are served.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+import uuid
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+LOREM = (
+    "A production-grade GenAI application on Azure needs more than a working prompt. Start with the five "
+    "pillars of the Well-Architected Framework: reliability, security, cost optimization, operational "
+    "excellence and performance efficiency. Capture user prompts, retrieved context and model output so "
+    "you can debug, audit and evaluate. Track LLM latency, non-LLM latency, token usage and cost, and "
+    "build a gold standard benchmark set with your business SMEs before UAT. "
+).split(" ")
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser(description="Mock Azure OpenAI chat-completions server.")
+    parser.add_argument('--host', type=str, default="127.0.0.1")
+    parser.add_argument('--port', type=int, default=8100)
+    parser.add_argument('--ttft-ms', type=float, default=300.0, help="Mean time to first token in milliseconds.")
+    parser.add_argument('--ttft-jitter-ms', type=float, default=100.0, help="Uniform +/- jitter on the time to first token.")
+    parser.add_argument('--tokens-per-sec', type=float, default=60.0, help="Generation speed after the first token.")
+    parser.add_argument('--completion-tokens', type=int, default=300, help="Tokens per answer (capped by max_tokens).")
+    parser.add_argument('--burst', type=int, default=1, help="Streamed tokens sent back to back per write, like Azure often does.")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests that fail with a 500.")
+    parser.add_argument('--rate-429', type=float, default=0.0, help="Fraction of requests rejected with a 429.")
+    parser.add_argument('--retry-after', type=int, default=1, help="Retry-After seconds sent with injected 429s.")
+    return parser.parse_args()
+
+
+def create_app(args) -> FastAPI:
+    app = FastAPI(title="Mock Azure OpenAI")
+
+    def injected_failure():
+        roll = random.random()
+        if roll < args.rate_429:
+            return JSONResponse(
+                status_code=429,
+                content={"error": {"code": "429", "message": "Rate limit is exceeded (mock)."}},
+                headers={"Retry-After": str(args.retry_after), "retry-after-ms": str(args.retry_after * 1000)},
+            )
+        if roll < args.rate_429 + args.error_rate:
+            return JSONResponse(
+                status_code=500,
+                content={"error": {"code": "InternalServerError", "message": "Injected failure (mock)."}},
+            )
+        return None
+
+    def answer_tokens(max_tokens):
+        count = min(args.completion_tokens, max_tokens or args.completion_tokens)
+        return [LOREM[i % len(LOREM)] + " " for i in range(count)]
+
+    async def wait_for_first_token():
+        jitter = random.uniform(-args.ttft_jitter_ms, args.ttft_jitter_ms)
+        await asyncio.sleep(max(args.ttft_ms + jitter, 0) / 1000)
+
+    async def chat_completions(request: Request, model: str):
+        body = await request.json()
+        failure = injected_failure()
+        if failure is not None:
+            return failure
+
+        model = body.get("model") or model
+        prompt_tokens = sum(len(str(m.get("content", ""))) // 4 for m in body.get("messages", []))
+        tokens = answer_tokens(body.get("max_tokens"))
+        finish_reason = "length" if len(tokens) < args.completion_tokens else "stop"
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        usage = {"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens), "total_tokens": prompt_tokens + len(tokens)}
+
+        if not body.get("stream"):
+            await wait_for_first_token()
+            await asyncio.sleep(len(tokens) / args.tokens_per_sec)
+            return {
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": "".join(tokens)},
+                    "finish_reason": finish_reason,
+                }],
+                "usage": usage,
+            }
+
+        def frame(delta, reason=None):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": reason}],
+            }
+            return f"data: {json.dumps(chunk)}\n\n"
+
+        async def generate():
+            await wait_for_first_token()
+            yield frame({"role": "assistant", "content": ""})
+            interval = args.burst / args.tokens_per_sec
+            next_at = time.perf_counter()
+            for start in range(0, len(tokens), args.burst):
+                yield "".join(frame({"content": token}) for token in tokens[start:start + args.burst])
+                next_at += interval
+                await asyncio.sleep(max(next_at - time.perf_counter(), 0))
+            yield frame({}, finish_reason)
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(generate(), media_type="text/event-stream")
+
+    @app.post("/v1/chat/completions")
+    async def openai_chat_completions(request: Request):
+        return await chat_completions(request, "mock-gpt")
+
+    @app.post("/openai/deployments/{deployment}/chat/completions")
+    async def azure_chat_completions(deployment: str, request: Request):
+        return await chat_completions(request, deployment)
+
+    return app
+
+
+if __name__ == "__main__":
+    arguments = parse_arguments()
+    uvicorn.run(create_app(arguments), host=arguments.host, port=arguments.port, log_level="warning")